@@ -7,6 +7,7 @@ This file contains constants and utilities shared by all other modules in the pr
 """
 import numpy
 import numericalunits as nu
+from scipy.integrate import simps
 
 import environment
 from common import statistics as STATISTICS
@@ -94,6 +95,14 @@ class Params(object):
     dy = None
 
     h = None
+    h_min = None
+    h_max = None
+    # Number of steps made with the current step size (`None` while it has never changed), see\
+    # `multistep_order`
+    uniform_steps = None
+
+    # Settings of the run, see `environment.Config`
+    config = None
 
     def __init__(self, **kwargs):
         """ ## Parameters
@@ -115,9 +124,25 @@ class Params(object):
         self.dy = 0.05
         self.dx = 0.005 * UNITS.MeV
 
+        # Adaptive step size control: acceptable local errors of the `aT` and relative changes\
+        # of the distribution functions over a step. Step size bounds default to `h / 100`\
+        # and `h * 100` of the initial step
+        self.aT_tolerance = 1e-6
+        self.distribution_tolerance = 1e-2
+
+        # State of the run updated by the `kinematics` helpers: the energy of the sterile neutrino\
+        # that bounds the momenta of its decay products, whether it has decayed and whether it\
+        # decoupled while relativistic
+        self.HNL_energy = None
+        self.sterile_decayed = False
+        self.relativistic_decoupling = False
+
         for key in kwargs:
             setattr(self, key, kwargs[key])
 
+        if self.config is None:
+            self.config = environment.Config()
+
         # As the initial scale factor is arbitrary, it can be use to ensure the initial $aT$ value\
         # equal to 1
         self.a = 1 * self.m / self.T
@@ -125,9 +150,14 @@ class Params(object):
 
         self.infer()
 
-        if environment.get('LOGARITHMIC_TIMESTEP') and not kwargs.get('dy'):
+        if self.h_min is None:
+            self.h_min = self.h / 100.
+        if self.h_max is None:
+            self.h_max = self.h * 100.
+
+        if self.config.LOGARITHMIC_TIMESTEP and not kwargs.get('dy'):
             raise Exception("Using logarithmic timestep, but no Params.dy was specified")
-        if not environment.get('LOGARITHMIC_TIMESTEP') and not kwargs.get('dx'):
+        if not self.config.LOGARITHMIC_TIMESTEP and not kwargs.get('dx'):
             raise Exception("Using linear timestep, but no Params.dx was specified")
 
     def infer(self):
@@ -135,18 +165,47 @@ class Params(object):
 
         # Compute present-state parameters that can be inferred from the base ones
         self.x = self.a * self.m
-        if environment.get('LOGARITHMIC_TIMESTEP'):
+        if self.config.LOGARITHMIC_TIMESTEP:
             self.y = numpy.log(self.a)
         self.aT = self.a * self.T
 
         # Conformal scale factor step size during computations
-        if environment.get('LOGARITHMIC_TIMESTEP'):
+        if self.config.LOGARITHMIC_TIMESTEP:
             self.dx = self.x * self.dy
             self.h = self.dy
         else:
             self.dy = None
             self.h = self.dx
 
+    def set_step(self, h):
+        """ Change the integration step size keeping `dx` and `dy` consistent """
+        h = min(max(h, self.h_min), self.h_max)
+
+        if h != self.h:
+            self.uniform_steps = 0
+        self.h = h
+        if self.config.LOGARITHMIC_TIMESTEP:
+            self.dy = h
+            self.dx = self.x * h
+        else:
+            self.dx = h
+
+        return self.h
+
+    def multistep_order(self, order):
+        """ Order of a multistep method limited by the history made with the current step size:\
+            fixed-step coefficients applied over the history of another step size are wrong to\
+            the first order, so the methods drop to the first order after each step size change\
+            and regain their order as the history is rebuilt """
+        if self.uniform_steps is None:
+            return order
+        return min(order, self.uniform_steps + 1)
+
+    def count_step(self):
+        """ Count the step made with the current step size """
+        if self.uniform_steps is not None:
+            self.uniform_steps += 1
+
     def init_time(self, rho):
         self.t = numpy.sqrt(3. / (32. * numpy.pi * CONST.G * rho))
         return self.t
@@ -169,7 +228,7 @@ class Params(object):
                 H = \sqrt{\frac{8 \pi}{3} G \rho}
             \end{equation}
         """
-        if environment.get('LOGARITHMIC_TIMESTEP'):
+        if self.config.LOGARITHMIC_TIMESTEP:
             self.dx = self.x * self.dy
         self.rho = rho
         self.S = S
@@ -217,7 +276,68 @@ and errors).
 """
 
 
-class LinearSpacedGrid(object):
+class MomentumGrid(object):
+
+    """ ## Momentum grid
+        Quantities shared by all consumers of the grid are computed once: powers of the momenta\
+        `POWERS[k] = TEMPLATE**k`, Simpson's rule weights `SIMPSON_WEIGHTS` such that\
+        `numpy.dot(f, SIMPSON_WEIGHTS) == simps(f, TEMPLATE)` and Gauss-Legendre nodes and weights\
+        over `BOUNDS` (see `gauss()`).
+
+        `SPACING` tells how the nodes are placed: 0 - arbitrary, 1 - linear, 2 - logarithmic with\
+        the ratio `BASE` of the consecutive steps. On the last two the interval containing\
+        a momentum is found arithmetically, both by `find()` and by the C++ interpolation. """
+
+    SPACING = 0
+    BASE = 1.
+
+    def init_weights(self):
+        self.POWERS = self.TEMPLATE ** numpy.arange(5)[:, None]
+        self.SIMPSON_WEIGHTS = simps(numpy.eye(self.MOMENTUM_SAMPLES), self.TEMPLATE)
+        self.quadrature = None
+
+    def gauss(self):
+        """ Gauss-Legendre nodes and weights of the current order over the grid range """
+        from common.integrators import gauss_legendre
+
+        if self.quadrature is None or len(self.quadrature[0]) != len(gauss_legendre.points):
+            sub = (self.MAX_MOMENTUM - self.MIN_MOMENTUM) / 2.
+            add = (self.MAX_MOMENTUM + self.MIN_MOMENTUM) / 2.
+            self.quadrature = (sub * gauss_legendre.points + add, sub * gauss_legendre.weights)
+        return self.quadrature
+
+    def position(self, x):
+        """ Index of the last node not above `x` """
+        return numpy.searchsorted(self.TEMPLATE, x, side='right') - 1
+
+    def find(self, x):
+        """ Indices of the nodes around `x` as `(lower, upper)`, `(i, i)` if `x` is a node,\
+            `(-1, 0)` below and `(last, -1)` above the grid """
+        temp = self.TEMPLATE
+        tail = self.MOMENTUM_SAMPLES - 1
+
+        if temp[tail] < x:
+            return tail, -1
+        if temp[0] > x:
+            return -1, 0
+
+        head = max(0, min(int(self.position(x)), tail - 1))
+        # Rounding errors can shift the arithmetic estimate by a node
+        while head > 0 and temp[head] > x:
+            head -= 1
+        while head < tail - 1 and temp[head + 1] <= x:
+            head += 1
+
+        if temp[head + 1] == x:
+            return head + 1, head + 1
+        if temp[head] == x:
+            return head, head
+        return head, head + 1
+
+
+class LinearSpacedGrid(MomentumGrid):
+
+    SPACING = 1
 
     def __init__(self, MOMENTUM_SAMPLES=None, MAX_MOMENTUM=None):
         if not MAX_MOMENTUM:
@@ -242,9 +362,17 @@ class LinearSpacedGrid(object):
         """
         self.TEMPLATE = numpy.linspace(self.MIN_MOMENTUM, self.MAX_MOMENTUM,
                                        num=self.MOMENTUM_SAMPLES, endpoint=True)
+        self.init_weights()
+
+    def position(self, x):
+        return ((x - self.MIN_MOMENTUM) / (self.MAX_MOMENTUM - self.MIN_MOMENTUM)
+                * (self.MOMENTUM_SAMPLES - 1))
 
 
-class LogSpacedGrid(object):
+class LogSpacedGrid(MomentumGrid):
+
+    SPACING = 2
+    BASE = 1.2
 
     def __init__(self, MOMENTUM_SAMPLES=None, MAX_MOMENTUM=None):
         if not MAX_MOMENTUM:
@@ -258,9 +386,10 @@ class LogSpacedGrid(object):
         self.MOMENTUM_SAMPLES = MOMENTUM_SAMPLES
 
         self.TEMPLATE = self.generate_template()
+        self.init_weights()
 
     def generate_template(self):
-        base = 1.2
+        base = self.BASE
         return (
             self.MIN_MOMENTUM
             + (self.MAX_MOMENTUM - self.MIN_MOMENTUM)
@@ -268,8 +397,14 @@ class LogSpacedGrid(object):
             / (base ** (self.MOMENTUM_SAMPLES - 1.) - 1.)
         )
 
+    def position(self, x):
+        return numpy.log1p(
+            (x - self.MIN_MOMENTUM) / (self.MAX_MOMENTUM - self.MIN_MOMENTUM)
+            * (self.BASE ** (self.MOMENTUM_SAMPLES - 1.) - 1.)
+        ) / numpy.log(self.BASE)
+
 
-class HeuristicGrid(object):
+class HeuristicGrid(MomentumGrid):
 
     def __init__(self, M, tau, aT=1*UNITS.MeV, b=0.8, c=200):
         H = 0.5 / UNITS.s  # such that at T=1 <=> t=1
@@ -290,6 +425,7 @@ class HeuristicGrid(object):
         self.MIN_MOMENTUM = 0
         self.MAX_MOMENTUM = grid[0]
         self.BOUNDS = (self.MIN_MOMENTUM, self.MAX_MOMENTUM)
+        self.init_weights()
 
 
 GRID = LinearSpacedGrid()
@@ -374,21 +510,7 @@ def cubic_interpolation(function, grid):
 
 
 def binary_find(grid, x):
-    temp = grid.TEMPLATE
-    head = 0
-    tail = grid.MOMENTUM_SAMPLES - 1
-
-    if temp[-1] < x:
-        return tail, -1
-
-    if temp[0] > x:
-        return -1, head
-
-    if x in temp:
-        pos = numpy.where(temp == x)
-        return pos, pos
-
-    return numpy.searchsorted(temp, x, side='right') - 1, numpy.searchsorted(temp, x, side='right')
+    return grid.find(x)
 
 
 def interp(particle, p, conformal_mass):
@@ -1,5 +1,5 @@
 import numpy
-from scipy import integrate
+from scipy import integrate, optimize
 import functools
 
 import environment
@@ -104,7 +104,7 @@ def adams_moulton_solver(y, fs, A, B, h, order=None):
         order = min(MAX_ADAMS_MOULTON_ORDER, len(fs) + 1)
 
     bs, divider = ADAMS_MOULTON_COEFFICIENTS[order]
-    fs = fs[-(order-1):] + [A]
+    fs = (fs[-(order-1):] if order > 1 else []) + [A]
     assert len(fs) == order, (len(fs), order)
 
     return (
@@ -112,6 +112,79 @@ def adams_moulton_solver(y, fs, A, B, h, order=None):
     ) / (1 - h * B * bs[-1] / divider)
 
 
+def heun_method(Is, AB):
+    """ Trapezoidal average of the previous and the current collision integrals """
+    if not len(Is):
+        return AB
+    return (Is[-1] + AB) / 2.
+
+
+"""
+Backward differentiation formulas (BDF):
+
+\begin{equation}
+    y_{n+1} - \sum_j a_j y_{n-j} = \beta h f(t_{n+1}, y_{n+1})
+\end{equation}
+
+Coefficients are listed as `([a_j for the oldest to the latest value], beta)`.
+"""
+BACKWARD_DIFF_COEFFICIENTS = {
+    1: ([1.], 1.),
+    2: ([-1./3., 4./3.], 2./3.),
+    3: ([2./11., -9./11., 18./11.], 6./11.),
+    4: ([-3./25., 16./25., -36./25., 48./25.], 12./25.)
+}
+MAX_BACKWARD_DIFF_ORDER = max(BACKWARD_DIFF_COEFFICIENTS.keys())
+
+
+def backward_differentiation(ys, AB, B, h, order=None):
+    """ BDF solver for the linear per-momentum ODE $\frac{dy}{dt} = A + B y$ """
+    if order is None:
+        order = min(MAX_BACKWARD_DIFF_ORDER, len(ys))
+
+    As, beta = BACKWARD_DIFF_COEFFICIENTS[order]
+    ys = ys[-order:]
+    assert len(ys) == order, (len(ys), order)
+
+    return (sum(a * y for a, y in zip(As, ys)) + beta * h * AB) / (1 - beta * h * B)
+
+
+def newton_krylov_step(ys, rate, h, order=None, tolerance=1e-8, max_iterations=50):
+    """
+    Fully implicit BDF step for the system of ODEs $\frac{d y}{dt} = F(y)$ with all components\
+    coupled through the `rate` function $F$.
+
+    The nonlinear equation
+    \begin{equation}
+        R(y_{n+1}) = y_{n+1} - \sum_j a_j y_{n-j} - \beta h F(y_{n+1}) = 0
+    \end{equation}
+    is solved by the Jacobian-free Newton-Krylov method: the Jacobian is never formed, only its\
+    products with vectors are approximated by finite differences of $F$.
+
+    :param ys: History of the solution, `ys[-1]` is the current value
+    :param tolerance: Largest residual relative to the current value
+    :return: $y_{n+1}$, raises `scipy.optimize.NoConvergence` after `max_iterations`
+    """
+    if order is None:
+        order = min(MAX_BACKWARD_DIFF_ORDER, len(ys))
+
+    As, beta = BACKWARD_DIFF_COEFFICIENTS[order]
+    ys = ys[-order:]
+    assert len(ys) == order, (len(ys), order)
+
+    base = sum(a * y for a, y in zip(As, ys))
+    scale = numpy.maximum(numpy.abs(ys[-1]), tolerance)
+
+    def residual(y):
+        return (y - base - beta * h * rate(y)) / scale
+
+    # Explicit Euler predictor
+    guess = ys[-1] + h * rate(ys[-1])
+
+    return optimize.newton_krylov(residual, guess, f_tol=tolerance, maxiter=max_iterations,
+                                  method='lgmres')
+
+
 def integrate_1D(integrand, bounds):
     if not environment.get('FIXED_ORDER_1D_QUADRATURE'):
         integral, error = integrate.quad(
@@ -1,11 +1,9 @@
 # -*- coding: utf-8 -*-
 
-import os
 import numpy as np
 import environment
 from common import CONST, UNITS, utils
 from collections import Counter
-from scipy.integrate import simps
 from interactions.four_particle.cpp.integral import CollisionIntegralKind
 
 
@@ -73,7 +71,7 @@ def four_particle_bounds_creation(reaction=None):
                     )**2
                     - specie_1.conformal_mass**2)
 
-    return max(max_momentum, environment.get('MAX_MOMENTUM_MEV') * UNITS.MeV)
+    return max(max_momentum, specie_1.params.config.MAX_MOMENTUM_MEV * UNITS.MeV)
 
 def four_particle_grid_cutoff_creation(reaction=None):
     """ Returns grid elements (slice_1) for which four particle collision integral will be computed.
@@ -90,13 +88,14 @@ def four_particle_grid_cutoff_creation(reaction=None):
 def four_particle_grid_cutoff_scattering(particle):
     grid = particle.grid.TEMPLATE
 
+    params = particle.params
     if particle.name == 'Sterile neutrino (Dirac)':
         max_mom = particle.grid.MAX_MOMENTUM #3 * particle.params.T
-    elif particle.name != 'Sterile neutrino (Dirac)' and environment.get('HNL_ENERGY'):
-        HNL_energy = float(environment.get('HNL_ENERGY'))
-        max_mom = max(np.sqrt(HNL_energy**2 - particle.conformal_mass**2), environment.get('MAX_MOMENTUM_MEV') * UNITS.MeV)
+    elif particle.name != 'Sterile neutrino (Dirac)' and params.HNL_energy:
+        HNL_energy = params.HNL_energy
+        max_mom = max(np.sqrt(HNL_energy**2 - particle.conformal_mass**2), params.config.MAX_MOMENTUM_MEV * UNITS.MeV)
     else:
-        max_mom = environment.get('MAX_MOMENTUM_MEV') * UNITS.MeV
+        max_mom = params.config.MAX_MOMENTUM_MEV * UNITS.MeV
 
     upper_element_grid = min(len(grid) - 1, np.searchsorted(grid, max_mom))
 
@@ -109,11 +108,12 @@ def four_particle_grid_cutoff_decay(particle):
     inv_f_min = 1e100
     aT = 1 * UNITS.MeV
 
+    params = particle.params
     if particle.name == 'Sterile neutrino (Dirac)':
         max_mom = particle.grid.MAX_MOMENTUM
-    elif particle.name != 'Sterile neutrino (Dirac)' and environment.get('HNL_ENERGY'):
-        HNL_energy = float(environment.get('HNL_ENERGY'))
-        max_mom = max(np.sqrt(HNL_energy**2 - particle.conformal_mass**2), environment.get('MAX_MOMENTUM_MEV') * UNITS.MeV)
+    elif particle.name != 'Sterile neutrino (Dirac)' and params.HNL_energy:
+        HNL_energy = params.HNL_energy
+        max_mom = max(np.sqrt(HNL_energy**2 - particle.conformal_mass**2), params.config.MAX_MOMENTUM_MEV * UNITS.MeV)
     else:
         max_mom = particle.grid.MAX_MOMENTUM
 
@@ -168,10 +168,12 @@ def decoupling_temperature_relativistic(mass, mixing_angle):
 
     return (1.66 * np.sqrt(g_star) / (CONST.M_p * CONST.G_F**2 * theta_sq))**(1/3)
 
-def decoupling_temperature(mass, mixing_angle):
+def decoupling_temperature(mass, mixing_angle, params):
+    """ Decoupling temperature of the sterile neutrino. Relativistic decoupling is recorded in\
+        the `params` of the run """
     T_dec_rel = decoupling_temperature_relativistic(mass, mixing_angle)
     if 1.5 * T_dec_rel > 1.5 * mass:
-        os.environ['Relativistic_decoupling'] = 'True'
+        params.relativistic_decoupling = True
         return 1.5 * T_dec_rel
     elif mass <= 1.5 * T_dec_rel <= 1.5 * mass:
         return 1.5 * mass
@@ -233,10 +235,10 @@ def grid_resolution_lepton(mass, mixing_angle, std=False):
 
     return min(delta_y_lepton, environment.get('FOUR_PARTICLE_GRID_RESOLUTION') * UNITS.MeV)
 
-def grid_params_HNL(mass, mixing_angle):
+def grid_params_HNL(mass, mixing_angle, params):
     aT = 1 * UNITS.MeV
     inv_f_min = 1e100
-    a_ini = aT / decoupling_temperature(mass, mixing_angle)
+    a_ini = aT / decoupling_temperature(mass, mixing_angle, params=params)
     MAX_MOMENTUM = np.sqrt((aT * np.log(inv_f_min))**2 - (mass * a_ini)**2)
 
     MOMENTUM_SAMPLES = MAX_MOMENTUM / grid_resolution_HNL(mass, mixing_angle)
@@ -313,7 +315,7 @@ def Neglect4pInteraction(interaction, ps):
 
     # Decoupling of scattering reactions involving HNL
     if utils.reaction_type(interaction).SCATTERING and any(item.specie.name == 'Sterile neutrino (Dirac)' for item in interaction.reaction)\
-    and (environment.get('Relativistic_decoupling') and interaction.particle.params.T < interaction.particle.params.m / interaction.particle.params.a_ini / 15. or interaction.particle.params.T < 1. * UNITS.MeV):
+    and (interaction.particle.params.relativistic_decoupling and interaction.particle.params.T < interaction.particle.params.m / interaction.particle.params.a_ini / 15. or interaction.particle.params.T < 1. * UNITS.MeV):
         return True
 
     # If temperature is higher than HNL mass, skip decay reaction to prevent incorrect computation of collision integral
@@ -346,13 +348,14 @@ def CollisionMultiplier3p(interaction):
 
 def store_energy(interaction):
     if interaction.particle.name == 'Sterile neutrino (Dirac)':
-        os.environ['HNL_ENERGY'] = str(np.sqrt((interaction.particle.grid.MAX_MOMENTUM/10)**2 + interaction.particle.conformal_mass**2))
+        interaction.particle.params.HNL_energy = np.sqrt((interaction.particle.grid.MAX_MOMENTUM/10)**2 + interaction.particle.conformal_mass**2)
 
 def interpolation_4p(interaction, ps, slice_1):
     interpolate = False
     grid = interaction.particle.grid
-    if grid.MAX_MOMENTUM / (grid.MOMENTUM_SAMPLES - 1) < environment.get('FOUR_PARTICLE_GRID_RESOLUTION') * UNITS.MeV:
-        steps = np.ceil(slice_1[-1] / (environment.get('FOUR_PARTICLE_GRID_RESOLUTION') * UNITS.MeV))
+    resolution = interaction.particle.params.config.FOUR_PARTICLE_GRID_RESOLUTION * UNITS.MeV
+    if grid.MAX_MOMENTUM / (grid.MOMENTUM_SAMPLES - 1) < resolution:
+        steps = np.ceil(slice_1[-1] / resolution)
         interp_pos = np.searchsorted(ps, np.linspace(ps[0], ps[-1], steps))
         ps = ps[interp_pos]
         interpolate = True
@@ -366,7 +369,7 @@ def scaling(interaction, fullstack, constant):
             if Counter(sym) == Counter(key):
                 BR = interaction.reaction[-1].specie.BR[key]
         dof = interaction.particle.dof if interaction.particle.majorana else interaction.particle.dof / 2.
-        created = simps(fullstack * constant * dof * grid.TEMPLATE**2, grid.TEMPLATE)
+        created = np.dot(fullstack * constant * dof * grid.POWERS[2], grid.SIMPSON_WEIGHTS)
         if created == 0.:
             return False
         scaling = BR * interaction.reaction[-1].specie.num_creation / created
@@ -380,7 +383,7 @@ def has_decayed(particle, ps):
         particle.decayed = True
         particle._distribution = np.zeros(len(ps))
         if particle.name == 'Sterile neutrino (Dirac)':
-            os.environ['STERILE_DECAYED'] = 'True'
+            particle.params.sterile_decayed = True
         return True
     return False
 
@@ -400,14 +403,14 @@ def Icoll_fast_decay(particle, ps):
 
     if hasattr(particle, 'thermalization'):
         distr_ini = distr_backg + sum(F1s) * particle.params.h
-        distr_bef = distr_backg + simps(sum(F1s) * particle.grid.TEMPLATE**2, particle.grid.TEMPLATE) * particle.params.h \
+        distr_bef = distr_backg + np.dot(sum(F1s) * particle.grid.POWERS[2], particle.grid.SIMPSON_WEIGHTS) * particle.params.h \
                     / (2 * np.pi * particle.conformal_mass * particle.aT)**(3/2) \
-                    * np.exp(-particle.grid.TEMPLATE**2 / (2 * particle.conformal_mass * particle.aT))
+                    * np.exp(-particle.grid.POWERS[2] / (2 * particle.conformal_mass * particle.aT))
 
     else:
         distr_bef = distr_backg + sum(F1s) * particle.params.h
 
-    particle.num_creation = simps(sum(F1s*np.array(dofs)[:,None]) * particle.grid.TEMPLATE**2, particle.grid.TEMPLATE)
+    particle.num_creation = np.dot(sum(F1s*np.array(dofs)[:,None]) * particle.grid.POWERS[2], particle.grid.SIMPSON_WEIGHTS)
 
     for index, Ff in enumerate(Ffs_temp):
         integral = particle.collision_integrals[index]
@@ -417,7 +420,7 @@ def Icoll_fast_decay(particle, ps):
                 if Counter(sym) == Counter(key):
                     BR = integral.reaction[0].specie.BR[key]
             dof = particle.dof if particle.majorana else particle.dof / 2
-            decayed = simps(-1 * distr_bef * Ff * dof * particle.grid.TEMPLATE**2, particle.grid.TEMPLATE)
+            decayed = np.dot(-1 * distr_bef * Ff * dof * particle.grid.POWERS[2], particle.grid.SIMPSON_WEIGHTS)
             if decayed == 0.:
                 Ffs.append(np.zeros(len(Ff)))
             else:
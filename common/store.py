@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+# Run store
+
+Binary storage for the distribution functions and collision integrals history of the run.
+
+Store is a folder with the `store.json` metadata file and chunks of rows saved as `.npy` files\
+(or compressed `.npz` files). Each row corresponds to a saved step: universe parameters are kept\
+in the `steps` arrays, momentum-space arrays of each particle in the chunks of shape\
+`(rows, MOMENTUM_SAMPLES)`. Uncompressed chunks are memory-mapped by the reader, so steps and\
+momentum ranges can be sliced without loading the whole history:
+
+    store = RunStore('output/run')
+    store.steps['T']
+    store['Electron neutrino', 'distribution'][::10, :50]
+"""
+
+import os
+import json
+import numpy
+
+from common import UNITS, utils
+
+
+STEP_COLUMNS = [
+    ['step', None, 1],
+    ['a', None, 1],
+    ['x', 'MeV', UNITS.MeV],
+    ['t', 's', UNITS.s],
+    ['T', 'MeV', UNITS.MeV],
+    ['aT', 'MeV', UNITS.MeV],
+    ['h', None, 1],
+]
+
+ARRAYS = ('distribution', 'collision_integral')
+
+
+def particle_key(name):
+    return name.replace(' ', '_').replace('(', '').replace(')', '')
+
+
+class RunStoreWriter(object):
+
+    """ Accumulates rows of the run and saves them to the store by chunks of `chunk_size` rows """
+
+    def __init__(self, path, dtype=numpy.float64, chunk_size=100, compress=False, append=False):
+        self.path = path
+        self.meta_path = os.path.join(path, 'store.json')
+
+        if append and os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+        else:
+            utils.ensure_dir(path)
+            self.meta = {
+                'version': 1,
+                'dtype': numpy.dtype(dtype).name,
+                'compress': compress,
+                'chunk_size': chunk_size,
+                'rows': 0,
+                'columns': [[name, unit] for name, unit, _ in STEP_COLUMNS],
+                'arrays': list(ARRAYS),
+                'chunks': [],
+                'particles': {}
+            }
+
+        self.dtype = numpy.dtype(self.meta['dtype'])
+        self.buffer = []
+
+    @property
+    def rows(self):
+        return self.meta['rows'] + len(self.buffer)
+
+    def append(self, universe):
+        """ Add current state of the `universe` as a row """
+        particles = [particle for particle in universe.particles
+                     if getattr(particle, '_distribution', None) is not None]
+
+        for particle in particles:
+            if particle.name not in self.meta['particles']:
+                self.meta['particles'][particle.name] = {
+                    'key': particle_key(particle.name),
+                    'grid': list(particle.grid.TEMPLATE / UNITS.MeV),
+                    'grid_unit': 'MeV',
+                    'first_row': self.rows
+                }
+
+        params = universe.params
+        step = [universe.step, params.a, params.x, params.t, params.T, params.aT, params.h]
+        self.buffer.append((
+            [value / unit for value, (_, _, unit) in zip(step, STEP_COLUMNS)],
+            {particle.name: (numpy.array(particle._distribution, dtype=self.dtype),
+                             numpy.array(particle.collision_integral, dtype=self.dtype))
+             for particle in particles}
+        ))
+
+        if len(self.buffer) >= self.meta['chunk_size']:
+            self.flush()
+
+    def chunk_file(self, index, key):
+        return "{:05d}.{}.{}".format(index, key, 'npz' if self.meta['compress'] else 'npy')
+
+    def save(self, filename, array):
+        with open(os.path.join(self.path, filename), 'wb') as f:
+            if self.meta['compress']:
+                numpy.savez_compressed(f, data=array)
+            else:
+                numpy.save(f, array)
+
+    def flush(self):
+        """ Save buffered rows as a new chunk """
+        if not self.buffer:
+            return
+
+        index = len(self.meta['chunks'])
+        start = self.meta['rows']
+        stop = start + len(self.buffer)
+        chunk = {'start': start, 'stop': stop, 'files': {}}
+
+        steps = numpy.array([row[0] for row in self.buffer], dtype=numpy.float64)
+        chunk['files']['steps'] = self.chunk_file(index, 'steps')
+        self.save(chunk['files']['steps'], steps)
+
+        for name, particle in self.meta['particles'].items():
+            rows = [row[1][name] for row in self.buffer if name in row[1]]
+            if not rows:
+                continue
+            for i, array in enumerate(ARRAYS):
+                filename = self.chunk_file(index, particle['key'] + '.' + array)
+                self.save(filename, numpy.array([row[i] for row in rows], dtype=self.dtype))
+                chunk['files'][name + '/' + array] = filename
+
+        self.meta['chunks'].append(chunk)
+        self.meta['rows'] = stop
+        self.buffer = []
+
+        utils.atomic_write(self.meta_path, json.dumps(self.meta, indent=1).encode('utf-8'))
+
+    def truncate(self, rows):
+        """ Drop rows starting from `rows`, e.g. to continue the run from a checkpoint """
+        self.flush()
+        if rows >= self.meta['rows']:
+            return
+
+        reader = RunStore(self.path)
+        kept = []
+        for chunk in self.meta['chunks']:
+            if chunk['stop'] <= rows:
+                kept.append(chunk)
+                continue
+            if chunk['start'] < rows:
+                # The chunk is shortened and saved anew
+                length = rows - chunk['start']
+                for key, filename in chunk['files'].items():
+                    array = reader.load(filename)[:length]
+                    self.save(filename, numpy.array(array))
+                chunk['stop'] = rows
+                kept.append(chunk)
+            else:
+                for filename in chunk['files'].values():
+                    os.remove(os.path.join(self.path, filename))
+
+        self.meta['chunks'] = kept
+        self.meta['rows'] = rows
+        utils.atomic_write(self.meta_path, json.dumps(self.meta, indent=1).encode('utf-8'))
+
+    def close(self):
+        self.flush()
+
+
+class StoreArray(object):
+
+    """ Lazily loaded `(rows, momenta)` array of a particle in the store """
+
+    def __init__(self, store, name, array):
+        self.store = store
+        self.chunks = [
+            (chunk['start'], chunk['stop'], chunk['files'][name + '/' + array])
+            for chunk in store.meta['chunks'] if name + '/' + array in chunk['files']
+        ]
+        self.offset = store.meta['particles'][name]['first_row']
+        self.length = sum(stop - start for start, stop, _ in self.chunks)
+        self.shape = (self.length, len(store.meta['particles'][name]['grid']))
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple):
+            index = (index, slice(None))
+        rows, momenta = index
+
+        single = numpy.isscalar(rows)
+        rows = numpy.atleast_1d(numpy.arange(self.length)[rows])
+        momenta = numpy.atleast_1d(numpy.arange(self.shape[1])[momenta])
+
+        result = numpy.empty((len(rows), len(momenta)), dtype=self.store.dtype)
+        for start, stop, filename in self.chunks:
+            start -= self.offset
+            stop -= self.offset
+            mask = (rows >= start) & (rows < stop)
+            if numpy.any(mask):
+                chunk = self.store.load(filename)
+                result[mask] = chunk[rows[mask] - start][:, momenta]
+
+        return result[0] if single else result
+
+
+class RunStore(object):
+
+    """ Reader of the run store """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'store.json')) as f:
+            self.meta = json.load(f)
+        self.dtype = numpy.dtype(self.meta['dtype'])
+
+    def load(self, filename):
+        path = os.path.join(self.path, filename)
+        if filename.endswith('.npz'):
+            with numpy.load(path) as data:
+                return data['data']
+        return numpy.load(path, mmap_mode='r')
+
+    @property
+    def particles(self):
+        return list(self.meta['particles'].keys())
+
+    @property
+    def steps(self):
+        """ Universe parameters of the saved rows as a dictionary of columns """
+        if not self.meta['chunks']:
+            return {name: numpy.array([]) for name, _ in self.meta['columns']}
+
+        steps = numpy.concatenate([self.load(chunk['files']['steps'])
+                                   for chunk in self.meta['chunks']])
+        return {name: steps[:, i] for i, (name, _) in enumerate(self.meta['columns'])}
+
+    def grid(self, name):
+        """ Momentum grid of the particle in MeV """
+        return numpy.array(self.meta['particles'][name]['grid'])
+
+    def __getitem__(self, key):
+        name, array = key
+        return StoreArray(self, name, array)
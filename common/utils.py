@@ -1,32 +1,129 @@
 import os
 import sys
 import time
+import queue
 import codecs
+import tempfile
+import threading
 import contextlib
 import numpy
 from collections import deque
 
 
 class Logger(object):
-    """ Convenient double logger that redirects `stdout` and save the output also to the file """
-    def __init__(self, filename):
+    """ Convenient double logger that redirects `stdout` and save the output also to the file.
+
+        Loggers are chained: each one passes the output on to the previous `stdout`. The file\
+        receives only the output of the thread that created the logger and only until another\
+        logger is created in that thread, so that universes evolved one after another or in\
+        parallel threads keep separate logs. """
+
+    # The logger saving the output of each thread
+    active = {}
+
+    def __init__(self, filename, mode="wb"):
         self.terminal = sys.stdout
-        self.log = codecs.open(filename, "wb", encoding="utf8")
+        self.log = codecs.open(filename, mode, encoding="utf8")
+        self.thread = threading.get_ident()
+        Logger.active[self.thread] = self
 
     def write(self, message, terminal=True, log=True):
-        if terminal:
-            self.terminal.write(message)
-        if log:
+        if log and Logger.active.get(threading.get_ident()) is self:
             self.log.write(message)
+        if isinstance(self.terminal, Logger):
+            self.terminal.write(message, terminal=terminal, log=log)
+        elif terminal:
+            self.terminal.write(message)
+
+    def close(self):
+        """ Stop saving the output and unlink the logger from the `stdout` chain """
+        if Logger.active.get(self.thread) is self:
+            del Logger.active[self.thread]
+
+        if sys.stdout is self:
+            sys.stdout = self.terminal
+        else:
+            logger = sys.stdout
+            while isinstance(logger, Logger):
+                if logger.terminal is self:
+                    logger.terminal = self.terminal
+                    break
+                logger = logger.terminal
+
+        if not self.log.closed:
+            self.log.close()
 
     def __del__(self):
-        if sys:
+        if Logger.active.get(self.thread) is self:
+            del Logger.active[self.thread]
+        if sys and sys.stdout is self:
             sys.stdout = self.terminal
 
     def __getattr__(self, attr):
         return getattr(self.terminal, attr)
 
 
+class BackgroundWriter(object):
+    """ Writes text to files from a separate thread so that the caller is not blocked by formatting\
+        and disk access. The queue is bounded: if the writer can't keep up, the caller waits.
+
+        Targets are either file paths (opened in the append mode once and kept open) or already\
+        opened file objects. Payload is either a string or a function that writes to the file. """
+
+    def __init__(self, maxsize=1000):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.files = {}
+        self.error = None
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, target, payload, mode='a'):
+        if self.error:
+            raise self.error
+        self.queue.put((target, payload, mode))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    break
+                target, payload, mode = item
+                if isinstance(target, str):
+                    if mode != 'a' or target not in self.files:
+                        if target in self.files:
+                            self.files[target].close()
+                        self.files[target] = open(target, mode)
+                    target = self.files[target]
+                if callable(payload):
+                    payload(target)
+                else:
+                    target.write(payload)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """ Wait until all queued writes are done and flush the files """
+        self.queue.join()
+        for f in self.files.values():
+            f.flush()
+        if self.error:
+            raise self.error
+
+    def close(self):
+        if not self.thread.is_alive():
+            return
+        self.queue.join()
+        self.queue.put(None)
+        self.thread.join()
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+
 class Throttler(object):
     def __init__(self, rate):
         self.clock = time.time()
@@ -91,6 +188,89 @@ class benchmark(object):
         return False
 
 
+class PhaseTimer(object):
+    """ Low-overhead wall clock timers of the named phases of the computation step.
+
+        Time of each phase is accumulated over the step, `end_step` stores it as a row of\
+        the `table` and adds to the run totals. Phases that show up for the first time add\
+        the columns to the table, with zeros for the earlier steps. Disabled timer does nothing. """
+
+    class Phase(object):
+        __slots__ = ('timer', 'name', 'start')
+
+        def __init__(self, timer, name):
+            self.timer = timer
+            self.name = name
+
+        def __enter__(self):
+            self.start = time.perf_counter()
+
+        def __exit__(self, ty, val, tb):
+            self.timer.current[self.name] = (self.timer.current.get(self.name, 0.)
+                                             + time.perf_counter() - self.start)
+            return False
+
+    class Disabled(object):
+        def __enter__(self):
+            pass
+
+        def __exit__(self, ty, val, tb):
+            return False
+
+    disabled = Disabled()
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.current = {}
+        self.totals = {}
+        self.steps = 0
+        self.table = None
+
+    def __call__(self, name):
+        if not self.enabled:
+            return self.disabled
+        return self.Phase(self, name)
+
+    def end_step(self, step):
+        if not self.enabled or not self.current:
+            return
+
+        if self.table is None or not set(self.current) <= set(self.table.columns):
+            self.extend_table(self.current)
+
+        row = {name: self.current.get(name, 0.) for name in self.table.columns}
+        row['step'] = step
+        self.table.append(row)
+
+        for name, elapsed in self.current.items():
+            self.totals[name] = self.totals.get(name, 0.) + elapsed
+        self.steps += 1
+        self.current = {}
+
+    def extend_table(self, names):
+        """ Rebuild the `table` with the columns of the phases `names` added """
+        old = self.table
+        columns = sorted(set(names) | set(old.columns[1:] if old is not None else ()))
+        self.table = DynamicRecArray([['step', None, 1]] + [[name, 's', 1] for name in columns])
+
+        if old is not None:
+            for row in old.data:
+                self.table.append({name: row[name] if name in old.columns else 0.
+                                   for name in self.table.columns})
+
+    def summary(self):
+        """ Total and average time of the phases, most expensive first """
+        if not self.steps:
+            return ""
+
+        total = sum(elapsed for name, elapsed in self.totals.items() if '/' not in name)
+        lines = ["{:<40s} {:>10s} {:>12s} {:>7s}".format("Phase", "total, s", "per step, s", "%")]
+        for name, elapsed in sorted(self.totals.items(), key=lambda item: -item[1]):
+            lines.append("{:<40s} {:>10.3f} {:>12.5f} {:>7.1f}".format(
+                name, elapsed, elapsed / self.steps, 100. * elapsed / total if total else 0.))
+        return "\n".join(lines)
+
+
 @contextlib.contextmanager
 def printoptions(*args, **kwargs):
     original = numpy.get_printoptions()
@@ -122,6 +302,23 @@ def ensure_dir(*chunks):
     return dir
 
 
+def atomic_write(path, payload):
+    """ Write `payload` bytes so that `path` always holds either the old or the new content """
+    # A unique temporary file, so that concurrent writers of the same `path` do not race on it
+    descriptor, temp = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                        prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
 class reaction_type(object):
     def __init__(self, interaction):
         self.sumsides = sum([item.side for item in interaction.reaction])
@@ -166,11 +363,123 @@ def particle_orderer(particles):
     return particles
 
 
-class Dynamic2DArray(object):
+class BoundedHistory(object):
+    """ History policy of the dynamic arrays.
+
+        By default arrays keep all rows and grow as needed. `bound()` switches the array to\
+        a fixed buffer with the first `head` rows and a ring of the `capacity` most recent rows.\
+        Rows leaving the ring are dropped, except every `spill_every`-th row that is appended\
+        to the `spill` binary file together with its index (see `load_spill`).
+
+        `len()` and `length` count all rows ever appended, while `data` holds the kept ones:\
+        the head rows followed by the recent rows. """
+
+    capacity = None
+    head = 0
+    retained = 0
+    spill = None
+    spill_every = 1
+    spilled = -1
+    spill_file = None
+
+    @property
+    def length(self):
+        return self._length
+
+    @length.setter
+    def length(self, length):
+        if self.capacity is not None:
+            if length > self._length:
+                raise ValueError("Rows can only be appended to the bounded array")
+            self.retained = max(0, min(self.retained - (self._length - length), length - self.head))
+        self._length = length
+
+    def bound(self, capacity, head=2, spill=None, spill_every=1):
+        """ Limit the memory used by the array to `head + capacity` rows """
+        rows = self.data.copy()
+
+        self.capacity = capacity
+        self.head = head
+        self.spill = spill
+        self.spill_every = spill_every
+        self.size = head + capacity
+        self._data = numpy.zeros((self.size, ) + self._data.shape[1:], dtype=self._data.dtype)
+        self._length = 0
+        self.retained = 0
+
+        for row in rows:
+            self.append_bounded(row)
+
+    def slot(self, index):
+        if index < self.head:
+            return index
+        return self.head + (index - self.head) % self.capacity
+
+    def append_bounded(self, row):
+        index = self._length
+        slot = self.slot(index)
+
+        if index >= self.head and self.retained == self.capacity:
+            self.evict(index - self.capacity, self._data[slot])
+
+        self._data[slot] = row
+        self._length += 1
+        if index >= self.head:
+            self.retained = min(self.retained + 1, self.capacity)
+
+    def evict(self, index, row):
+        if not self.spill or index <= self.spilled or (index - self.head) % self.spill_every:
+            return
+
+        if self.spill_file is None:
+            self.spill_file = open(self.spill, 'ab')
+        record = numpy.zeros(1, dtype=self.spill_dtype())
+        record['index'] = index
+        record['row'] = row
+        self.spill_file.write(record.tobytes())
+        self.spilled = index
+
+    def spill_dtype(self):
+        return numpy.dtype([('index', numpy.int64), ('row', self._data.dtype, self._data.shape[1:])])
+
+    def load_spill(self):
+        """ Rows saved to the `spill` file: (indices, rows) """
+        if self.spill_file:
+            self.spill_file.flush()
+        records = numpy.fromfile(self.spill, dtype=self.spill_dtype())
+        return records['index'], records['row']
+
+    def kept(self):
+        if self.capacity is None:
+            return self._data[:self._length]
+
+        first = numpy.arange(min(self._length, self.head))
+        recent = numpy.arange(self._length - self.retained, self._length)
+        return self._data[[self.slot(i) for i in numpy.concatenate([first, recent])]]
+
+    def rows(self, start, stop):
+        """ Rows with indices from `start` to `stop` """
+        if self.capacity is None:
+            return self._data[start:stop]
+
+        if stop > self._length:
+            raise IndexError("Row {} is not appended yet".format(self._length))
+        # Rows between the head and the recent ones are dropped
+        if max(start, self.head) < min(stop, self._length - self.retained):
+            raise IndexError("Row {} is no longer kept in memory".format(max(start, self.head)))
+        return self._data[[self.slot(i) for i in range(start, stop)]]
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop('spill_file', None)
+        return state
+
+
+class Dynamic2DArray(BoundedHistory):
     def __init__(self, header):
         self.header = header
 
-        self.length = 0
+        self._length = 0
         self.size = 10
         self._data = numpy.zeros((self.size, len(self.header)))
 
@@ -178,7 +487,7 @@ class Dynamic2DArray(object):
         return self.length
 
     def __getitem__(self, index):
-        return self._data[:self.length][index]
+        return self.data[index]
         # if isinstance(index, Iterable):
         #     index = list(index)
         #     if index[0] < 0:
@@ -192,6 +501,9 @@ class Dynamic2DArray(object):
         # return self._data[index]
 
     def append(self, row):
+        if self.capacity is not None:
+            return self.append_bounded(row)
+
         if self.length == self.size or self.length == len(self._data) - 2:
             self.size = int(1.5*self.size)
             self._data = numpy.resize(self._data, (self.size, len(self.header)))
@@ -204,10 +516,11 @@ class Dynamic2DArray(object):
 
     @property
     def data(self):
-        return self._data[:self.length]
+        return self.kept()
 
     def truncate(self):
-        self._data = numpy.delete(self._data, self.length + 1, axis=0)
+        if self.capacity is None:
+            self._data = numpy.delete(self._data, self.length + 1, axis=0)
         self.length -= 1
 
     def savetxt(self, f):
@@ -215,7 +528,7 @@ class Dynamic2DArray(object):
                       header='\t'.join(['{:e}'.format(h) for h in self.header]))
 
 
-class DynamicRecArray(object):
+class DynamicRecArray(BoundedHistory):
     def __init__(self, columns, dtypes=None):
         if dtypes is None:
             dtypes = [float] * len(columns)
@@ -228,7 +541,7 @@ class DynamicRecArray(object):
         self.unit_names = [column[1] for column in columns]
         self.units = numpy.array([column[2] for column in columns])
 
-        self.length = 0
+        self._length = 0
         self.size = 10
         self._data = numpy.zeros(self.size, dtype=self.structure)
 
@@ -246,7 +559,9 @@ class DynamicRecArray(object):
 
     def __getitem__(self, index):
         if index in self.columns:
-            return self._data[index][:self.length]
+            return self.data[index]
+        if self.capacity is not None:
+            return self.data[int(index)]
         index = int(index)
         if index < 0:
             index = self.length+1-index
@@ -256,6 +571,9 @@ class DynamicRecArray(object):
         if isinstance(rec, dict):
             rec = tuple(rec[column] for column in self.columns)
 
+        if self.capacity is not None:
+            return self.append_bounded(rec)
+
         if self.length == self.size or self.length == len(self._data) - 2:
             self.size = int(1.5*self.size)
             self._data = numpy.resize(self._data, self.size)
@@ -268,7 +586,7 @@ class DynamicRecArray(object):
 
     @property
     def data(self):
-        return self._data[:self.length]
+        return self.kept()
 
     def row_repr(self, index, names=False):
         row = self.data[index]
@@ -286,10 +604,16 @@ class DynamicRecArray(object):
         return '\t'.join(heading)
 
     def truncate(self):
-        self._data = numpy.delete(self._data, self.length + 1, axis=0)
+        if self.capacity is None:
+            self._data = numpy.delete(self._data, self.length + 1, axis=0)
         self.length -= 1
 
-    def savetxt(self, f):
+    def savetxt(self, f, rows=None, header=True):
+        """ Save the table in the text format. `rows` slice of the `data` can be appended to the\
+            file saved before without the `header` """
+        if rows is None:
+            rows = self.data
+
         heading = [
             name + (', ' + unit if unit else '')
             for name, unit in zip(self.columns, self.unit_names)
@@ -297,6 +621,6 @@ class DynamicRecArray(object):
 
         numpy.savetxt(
             f,
-            self.data.view((numpy.float_, len(self._data.dtype))) / self.units[None, :],
-            delimiter='\t', header='\t'.join(heading)
+            rows.view((numpy.float_, len(self._data.dtype))) / self.units[None, :],
+            delimiter='\t', header='\t'.join(heading) if header else ''
         )
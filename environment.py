@@ -18,6 +18,10 @@ defaults = {
     # a logarithm of scale factor or dimensionful scale factor ($x = a * 1 MeV$)
     'LOGARITHMIC_TIMESTEP': True,
 
+    # Whether the step size of the temperature equation integration should be adjusted to keep
+    # the local error estimate within `Params.aT_tolerance` and `Params.distribution_tolerance`
+    'ADAPTIVE_TIMESTEP': False,
+
     # Whether the code should use Adams-Bashforth or explicit Euler numerical scheme
     # while solving for the temperature evolution
     'ADAMS_BASHFORTH_TEMPERATURE_CORRECTION': True,
@@ -26,6 +30,78 @@ defaults = {
     # while solving for the distribution function evolution
     'ADAMS_MOULTON_DISTRIBUTION_CORRECTION': False,
 
+    # The number of threads computing collision integrals of different species and reactions
+    # concurrently. Each C++ integration additionally uses `OMP_NUM_THREADS` OpenMP threads
+    'COLLISION_THREADS': 1,
+
+    # Whether distribution functions of all non-equilibrium species should be advanced by a fully
+    # implicit BDF step solved with the Jacobian-free Newton-Krylov method. Allows larger steps
+    # through the stiff epochs at the cost of several collision integrals evaluations per step.
+    # Steps that do not converge fall back to the per-species Adams-Moulton or implicit Euler step
+    'IMPLICIT_DISTRIBUTION_STEP': False,
+
+    # Whether the collision integrals of the species with the same mass, statistics, grid,
+    # distribution function and reactions should be computed once per step and shared among them.
+    # Species mixed by the oscillation pattern are never shared
+    'SPECIES_EQUIVALENCE': False,
+
+    # Whether the `F_1` and `F_f` parts of the full collision integrals should be computed in a single
+    # adaptive pass sharing the kinematics of the integrand instead of two separate integrations.
+    # The error of the pass is controlled jointly, which changes the results within the tolerance
+    'FUSED_COLLISION_INTEGRALS': False,
+
+    # Whether the full collision integrals should be linearized in the non-equilibrium distribution
+    # functions and evaluated as products with the tabulated derivatives. Tables are refreshed when
+    # the momenta or masses in units of `aT` drift by the relative tolerance, and every
+    # `LINEARIZED_COLLISIONS_VALIDATION`-th result is checked against the exact integration.
+    # Only the integrals of species within `LINEARIZED_COLLISIONS_DEVIATION` of their equilibrium
+    # distribution functions (relative to the maximum of the latter) are linearized
+    'LINEARIZED_COLLISIONS': False,
+    'LINEARIZED_COLLISIONS_TOLERANCE': 1e-2,
+    'LINEARIZED_COLLISIONS_VALIDATION': 10,
+    'LINEARIZED_COLLISIONS_DEVIATION': 1e-1,
+
+    # Whether the collision integrals should be retired once their relative contribution to the
+    # distribution functions over a step and their rate relative to the Hubble rate stay below the
+    # thresholds for `INTEGRAL_PRUNING_STEPS` steps. Retired integrals are recomputed every
+    # `INTEGRAL_PRUNING_PROBE` steps and revived if they matter again
+    'INTEGRAL_PRUNING': False,
+    'INTEGRAL_PRUNING_TOLERANCE': 1e-6,
+    'INTEGRAL_PRUNING_RATE': 1e-2,
+    'INTEGRAL_PRUNING_STEPS': 10,
+    'INTEGRAL_PRUNING_PROBE': 50,
+
+    # Whether the fixed step evolution should fast-forward the free-streaming epochs: once no species
+    # is left to decouple and every collision integral is retired (requires `INTEGRAL_PRUNING`) or
+    # absent, the distribution functions are frozen and the step size is increased by the factor
+    # (bounded by `Params.h_max`) until any integral becomes active again. The epoch is not entered
+    # while the rates are saved for the KAWANO, so that its output keeps the kinetic step
+    'FREE_STREAMING_FAST_FORWARD': False,
+    'FREE_STREAMING_STEP_FACTOR': 4.,
+
+    # Whether the fixed step evolution should solve the comoving entropy conservation directly
+    # while every species is in equilibrium, with the step size increased by the factor (bounded
+    # by `Params.h_max`), and hand over to the kinetic loop once the first species decouples or
+    # the rates start to be saved for the KAWANO
+    'EQUILIBRIUM_FAST_FORWARD': False,
+    'EQUILIBRIUM_STEP_FACTOR': 10.,
+
+    # Whether the vacuum decay integrals should be tabulated over the momentum grids and reused
+    # until the momenta or masses in units of `aT` change by more than the relative tolerance.
+    # Kernels use a fixed Gauss-Legendre quadrature, which changes the results within its accuracy
+    'VACUUM_DECAY_KERNELS': False,
+    'VACUUM_DECAY_KERNEL_TOLERANCE': 1e-3,
+
+    # Whether distribution functions of the non-equilibrium species should be resampled once per step
+    # on a uniform grid `RESAMPLED_DISTRIBUTIONS_DENSITY` times denser than their own, so that
+    # the collision integrands interpolate them without a search and the logarithms. Changes the
+    # results: distribution functions of massive species are interpolated to about `3e-5` relative
+    'RESAMPLED_DISTRIBUTIONS': False,
+    'RESAMPLED_DISTRIBUTIONS_DENSITY': 8,
+
+    # Whether the time spent in the phases of the step should be measured and saved to `timings.txt`
+    'PHASE_TIMERS': True,
+
     # The default number of points on the momentum space grid
     'MOMENTUM_SAMPLES': 401,
     # The maximal value on the momentum space grid in MeV
@@ -54,6 +130,14 @@ defaults = {
 
     'LAGUERRE_GAUSS_FOR_MASSIVE_EQUILIBRIUM_PARTICLES': True,
 
+    # Whether thermodynamical quantities of the intermediate regime equilibrium particles should be
+    # interpolated from the tables over $M / T$ instead of being integrated each step. Tables are
+    # refined until the interpolation error is below the tolerance and are saved to the folder
+    # (`~/.cache/pyBBN/thermodynamics` by default). Changes the results within the tolerance
+    'THERMODYNAMICS_TABLES': False,
+    'THERMODYNAMICS_TABLES_TOLERANCE': 1e-8,
+    'THERMODYNAMICS_TABLES_DIR': '',
+
 }
 
 
@@ -66,3 +150,42 @@ def get(name):
         val = typ(val)
 
     return val
+
+
+class Config(object):
+
+    """ ## Run configuration
+        Typed snapshot of the settings above. Values are read from the process environment and\
+        converted once, keyword `overrides` replace them for a single run:
+
+            params = Params(T=10 * UNITS.MeV, dy=0.025, config=Config(ADAPTIVE_TIMESTEP=True))
+
+        Settings are plain attributes (`config.MOMENTUM_SAMPLES`) and can not be changed\
+        afterwards, use `replace()` to derive a modified configuration. """
+
+    def __init__(self, **overrides):
+        unknown = set(overrides) - set(defaults)
+        if unknown:
+            raise ValueError("Unknown settings: {}".format(", ".join(sorted(unknown))))
+
+        values = {name: get(name) for name in defaults}
+        values.update(overrides)
+        self.__dict__.update(values)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Configuration is immutable, use `replace({}=...)`".format(name))
+
+    def __delattr__(self, name):
+        raise AttributeError("Configuration is immutable")
+
+    def __repr__(self):
+        return "Config({})".format(", ".join("{}={!r}".format(name, value)
+                                             for name, value in sorted(self.__dict__.items())))
+
+    def get(self, name):
+        return self.__dict__.get(name)
+
+    def replace(self, **overrides):
+        values = dict(self.__dict__)
+        values.update(overrides)
+        return Config(**values)
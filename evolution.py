@@ -3,12 +3,23 @@
 import os
 import sys
 import time
+import atexit
+import pickle
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 
-import environment
-from common import CONST, UNITS, Params, utils
-from common.integrators import adams_bashforth_correction, MAX_ADAMS_BASHFORTH_ORDER
+import numpy
+from scipy import optimize
+
+from common import CONST, UNITS, Params, utils, store
+from common import kinematics
+from interactions.equivalence import equivalence_classes
+from common.integrators import (
+    adams_bashforth_correction, newton_krylov_step,
+    MAX_ADAMS_BASHFORTH_ORDER, MAX_ADAMS_MOULTON_ORDER, MAX_BACKWARD_DIFF_ORDER
+)
 
 import kawano
 
@@ -28,12 +39,41 @@ class Universe(object):
 
     kawano = None
     kawano_log = None
+    kawano_particles = None
+    # Output files are written in a background thread
+    writer = None
+    # Binary store of the particles history, written each `store_freq` steps
+    store = None
+    store_freq = 1
+    # Number of recent rows kept in memory for the particles history, see `set_history`
+    history = None
 
     oscillations = None
+    # Names of the species sharing the collision integrals, see `log_equivalence`
+    equivalent_species = ()
+    # Fast-forwarded epoch (`'equilibrium'`, `'free streaming'` or `None` for the kinetic one) and\
+    # the step size of the kinetic epoch meanwhile, see `set_epoch`
+    epoch = None
+    kinetic_step = None
+    # Whether every collision integral computed at the last step is retired (`None` before the\
+    # first computation), see `free_streaming`
+    collisions_retired = None
+    # Temperature the current `evolve` call stops at
+    T_final = None
 
     step_monitor = None
 
-    data = utils.DynamicRecArray([
+    # Restart point is written to the `checkpoint_file` each `checkpoint_freq` steps
+    checkpoint_freq = None
+    checkpoint_file = 'checkpoint.pickle'
+    checkpoint_writer = None
+    collision_pool = None
+    resume_state = None
+    # Logger saving the output to `log.txt` in the `folder`
+    logger = None
+
+    # Columns of the evolution history table `data`
+    data_columns = [
         ['aT', 'MeV', UNITS.MeV],
         ['T', 'MeV', UNITS.MeV],
         ['a', None, 1],
@@ -42,48 +82,125 @@ class Universe(object):
         ['rho', 'MeV^4', UNITS.MeV**4],
         ['N_eff', None, 1],
         ['fraction', None, 1],
-        ['S', 'MeV^3', UNITS.MeV**3]
-    ])
+        ['S', 'MeV^3', UNITS.MeV**3],
+        ['h', None, 1]
+    ]
+    data = None
 
-    def __init__(self, folder=None, params=None, max_log_rate=2):
+    def __init__(self, folder=None, params=None, max_log_rate=2, resume=False, config=None):
         """
         :param folder: Log file path (current `datetime` by default)
+        :param resume: Continue the run from the checkpoint in the `folder` if there is one
+        :param config: `environment.Config` of the run (the one of `params` by default)
         """
 
+        # All state of the run is owned by the instance, so that independent universes can be\
+        # evolved one after another or in parallel threads of the same process
         self.particles = []
         self.interactions = []
-
-        self.clock_start = time.time()
-        self.log_throttler = utils.Throttler(max_log_rate)
+        self.data = utils.DynamicRecArray(self.data_columns)
 
         self.params = params
         if not self.params:
             self.params = Params()
+        if config is not None:
+            self.params.config = config
+
+        self.clock_start = time.time()
+        self.log_throttler = utils.Throttler(max_log_rate)
+        # Time spent in the phases of each step
+        self.timer = utils.PhaseTimer(self.config.PHASE_TIMERS)
 
         self.folder = folder
+        checkpoint = os.path.join(folder, self.checkpoint_file) if folder else None
+        resume = resume and checkpoint and os.path.exists(checkpoint)
+
         if self.folder:
-            if os.path.exists(folder):
+            if os.path.exists(folder) and not resume:
                 shutil.rmtree(folder)
-            self.init_log(folder=folder)
+            self.init_log(folder=folder, mode="ab" if resume else "wb")
+
+            self.writer = utils.BackgroundWriter()
+            atexit.register(self.writer.close)
+        # Columns and number of table rows already written to the output files
+        self.exported = {}
 
         self.fraction = 0
+        # Step size used by the last accepted step
+        self.step_size = None
 
         self.step = 1
+        self.evolve_calls = 0
+
+        if resume:
+            self.resume(checkpoint)
+
+    @property
+    def config(self):
+        """ Settings of the run shared with particles and integrals through `params` """
+        return self.params.config
+
+    def set_history(self, length=10, spill_every=None):
+        """ ## History policy
+            Keep only `length` most recent rows of the particles history (distribution functions,\
+            collision integrals, parameters) in memory instead of the whole run. Every\
+            `spill_every`-th older row is saved to the `history` folder of the output, other rows\
+            are dropped. Universe and KAWANO tables keep enough rows for the periodic export. """
+        self.history = {'length': max(length, MAX_ADAMS_MOULTON_ORDER), 'spill_every': spill_every}
+
+        for particle in self.particles:
+            self.bound_particle_history(particle)
+
+        self.bound_table_history(self.data)
+        if self.kawano:
+            self.bound_table_history(self.kawano_data)
+
+    def history_spill(self, name):
+        if self.history['spill_every'] and self.folder:
+            return utils.ensure_path(self.folder, 'history', name.replace(' ', '_') + '.bin')
+
+    def bound_table_history(self, table):
+        # Rows are kept in memory till the next export to the text file, so nothing is spilled
+        table.bound(max(self.history['length'], self.export_freq + MAX_ADAMS_BASHFORTH_ORDER))
+
+    def bound_particle_history(self, particle):
+        for name, array in particle.data.items():
+            if array.capacity is None:
+                array.bound(self.history['length'],
+                            spill=self.history_spill(particle.name + '.' + name),
+                            spill_every=self.history['spill_every'] or 1)
 
     def init_kawano(self, datafile='s4.dat', **kwargs):
-        kawano.init_kawano(**kwargs)
+        self.kawano_particles = kawano.init_kawano(**kwargs)
         if self.folder:
-            self.kawano_log = open(os.path.join(self.folder, datafile), 'w')
-            self.kawano_log.write("\t".join([col[0] for col in kawano.heading]) + "\n")
+            if self.resume_state:
+                # The file is truncated to the checkpointed length once the state is restored
+                self.kawano_log = open(os.path.join(self.folder, datafile), 'a')
+            else:
+                self.kawano_log = open(os.path.join(self.folder, datafile), 'w')
+                self.kawano_log.write("\t".join([col[0] for col in kawano.heading]) + "\n")
         self.kawano = kawano
         self.kawano_data = utils.DynamicRecArray(self.kawano.heading)
+        if self.history:
+            self.bound_table_history(self.kawano_data)
+
+    def init_store(self, filename='store', freq=1, **kwargs):
+        """ Save distribution functions and collision integrals of the particles to the binary\
+            run store (see `common.store`) instead of the text files.
+
+            :param freq: Save every `freq`-th step
+            :param kwargs: `dtype`, `chunk_size` and `compress` options of the store
+        """
+        self.store_freq = freq
+        self.store = store.RunStoreWriter(os.path.join(self.folder, filename),
+                                          append=self.resume_state is not None, **kwargs)
 
     def oscillation_parameters(self):
 
         if self.oscillation_matter:
             MSW_12 = CONST.MSW_constant * self.oscillation_particles[0].grid.TEMPLATE**2 * self.params.T**4 / CONST.delta_m12_sq / self.params.a**2
             MSW_13 = CONST.MSW_constant * self.oscillation_particles[0].grid.TEMPLATE**2 * self.params.T**4 / CONST.delta_m13_sq / self.params.a**2
-            if not environment.get("NORMAL_HIERARCHY_NEUTRINOS"):
+            if not self.config.NORMAL_HIERARCHY_NEUTRINOS:
                 MSW_13 *= -1
 
         else:
@@ -110,6 +227,14 @@ class Universe(object):
         long before then BBN. Then most particle species are in the thermodynamical equilibrium.
 
         """
+        self.evolve_calls += 1
+
+        if self.resume_state:
+            # Evolution stages completed before the checkpoint are skipped
+            if self.evolve_calls < self.resume_state['evolve_calls']:
+                return self.data
+            return self.continue_evolution(T_final, export=export)
+
         T_initial = self.params.T
 
         print("\n\n" + "#"*32 + " Initial states " + "#"*32 + "\n")
@@ -131,33 +256,153 @@ class Universe(object):
             self.params.update(self.total_energy_density(), self.total_entropy())
         self.save_params()
 
+        return self.evolution_loop(T_final, export=export)
+
+    def continue_evolution(self, T_final, export=True):
+        """ Restore the checkpointed state and proceed with the interrupted evolution stage """
+        self.restore_state(self.resume_state)
+        self.resume_state = None
+
+        print("\n\n" + "#"*30 + " Resumed at step {} ".format(self.step) + "#"*30 + "\n")
+
+        return self.evolution_loop(T_final, export=export)
+
+    def evolution_loop(self, T_final, export=True):
+        self.T_final = T_final
         while self.params.T > T_final:
             try:
                 self.log()
                 self.make_step()
                 self.save()
+                self.timer.end_step(self.step)
                 self.step += 1
+                if self.folder and self.checkpoint_freq and self.step % self.checkpoint_freq == 0:
+                    self.checkpoint()
                 if self.folder and self.step % self.export_freq == 0:
-                    with open(os.path.join(self.folder, "evolution.txt"), "wb") as f:
-                        self.data.savetxt(f)
-                    if self.kawano:
-                        with open(os.path.join(self.folder, "kawano.txt"), "wb") as f:
-                            self.kawano_data.savetxt(f)
+                    self.export_tables()
             except KeyboardInterrupt:
                 print("\nKeyboard interrupt!")
-                sys.exit(1)
-                break
+                raise
 
         if not (self.params.T > 0):
-            print("\n(T < 0): suspect numerical instability")
-            sys.exit(1)
+            raise RuntimeError("(T < 0): suspect numerical instability")
 
         self.log()
+        if self.timer.steps:
+            print("\n" + self.timer.summary() + "\n")
+        report = self.integrals_report()
+        if report:
+            print(report + "\n")
         if export:
             self.export()
 
+        if self.checkpoint_writer:
+            self.checkpoint_writer.join()
+
         return self.data
 
+    def state(self):
+        """ ## Evolution state
+            Everything required to continue the evolution exactly from the current step. \
+            Returned objects are not copied. """
+
+        self.flush()
+
+        return {
+            'evolve_calls': self.evolve_calls,
+            'step': self.step,
+            'fraction': self.fraction,
+            'step_size': self.step_size,
+            'epoch': self.epoch,
+            'kinetic_step': self.kinetic_step,
+            'collisions_retired': self.collisions_retired,
+            'params': {key: value for key, value in self.params.__dict__.items()
+                       if key != 'config'},
+            'particles': [particle.state() for particle in self.particles],
+            'integrals': [integral.state() for integral in self.collision_integrals()],
+            'data': self.data,
+            'kawano_data': self.kawano_data if self.kawano else None,
+            'kawano_log': self.kawano_log.tell() if self.kawano_log else None,
+            'timer': self.timer,
+            # Exported columns, rows and the size of the output files
+            'exported': {filename: (columns, rows,
+                                    os.path.getsize(os.path.join(self.folder, filename)))
+                         for filename, (columns, rows) in self.exported.items()},
+            'store': self.store.rows if self.store else None
+        }
+
+    def restore_state(self, state):
+        """ Apply the `state()` snapshot to the universe """
+        if len(state['particles']) != len(self.particles):
+            raise ValueError("Checkpoint holds {} particles, but the universe has {}"
+                             .format(len(state['particles']), len(self.particles)))
+
+        self.evolve_calls = state['evolve_calls']
+        self.step = state['step']
+        self.fraction = state['fraction']
+        self.step_size = state.get('step_size')
+        self.epoch = state.get('epoch')
+        self.kinetic_step = state.get('kinetic_step')
+        self.collisions_retired = state.get('collisions_retired')
+        self.params.__dict__.update(state['params'])
+
+        for particle, particle_state in zip(self.particles, state['particles']):
+            particle.restore_state(particle_state)
+
+        if state.get('integrals') is not None:
+            integrals = self.collision_integrals()
+            if len(state['integrals']) != len(integrals):
+                raise ValueError("Checkpoint holds {} collision integrals, but the universe has {}"
+                                 .format(len(state['integrals']), len(integrals)))
+            for integral, integral_state in zip(integrals, state['integrals']):
+                integral.restore_state(integral_state)
+
+        self.data = state['data']
+        if state['kawano_data'] is not None:
+            self.kawano_data = state['kawano_data']
+        if self.kawano_log and state['kawano_log'] is not None:
+            self.flush()
+            self.kawano_log.truncate(state['kawano_log'])
+        if self.store and state.get('store') is not None:
+            self.store.truncate(state['store'])
+        if state.get('timer') is not None:
+            self.timer = state['timer']
+            self.timer.enabled = self.config.PHASE_TIMERS
+
+        # Output tables are cut to the checkpointed rows and appended from there on. Tables that\
+        # were not exported by then are written anew from the restored data
+        self.exported = {}
+        for filename, (columns, rows, size) in state.get('exported', {}).items():
+            path = os.path.join(self.folder, filename) if self.folder else None
+            if path and os.path.exists(path):
+                with open(path, 'r+') as f:
+                    f.truncate(size)
+                self.exported[filename] = (columns, rows)
+
+    def collision_integrals(self):
+        return [integral for interaction in self.interactions for integral in interaction.integrals]
+
+    def checkpoint(self, path=None):
+        """ Save a restart point of the evolution.
+
+            The state is serialized immediately, while writing to disk happens in a background\
+            thread so that the step loop is not stalled by the file system. """
+        if path is None:
+            path = os.path.join(self.folder, self.checkpoint_file)
+
+        payload = pickle.dumps(self.state(), protocol=pickle.HIGHEST_PROTOCOL)
+
+        if self.checkpoint_writer:
+            self.checkpoint_writer.join()
+        self.checkpoint_writer = threading.Thread(target=utils.atomic_write, args=(path, payload))
+        self.checkpoint_writer.start()
+
+    def resume(self, path):
+        """ Load a restart point. The state is applied as soon as `evolve` reaches the evolution\
+            stage (counted by `evolve` calls) during which the checkpoint was made. """
+        with open(path, 'rb') as f:
+            self.resume_state = pickle.load(f)
+
     def export(self):
         print("\n\n" + "#"*33 + " Final states " + "#"*33 + "\n")
         for particle in self.particles:
@@ -165,40 +410,329 @@ class Universe(object):
         print("\n")
 
         if self.folder:
-            if self.kawano:
+            self.export_tables()
+            report = self.integrals_report(top=None)
+            if report:
+                self.writer.write(os.path.join(self.folder, "integrals.txt"), report + "\n", mode='w')
+            self.flush()
 
+            if self.kawano:
                 self.kawano_log.close()
                 print(kawano.run(self.folder))
 
-                with open(os.path.join(self.folder, "kawano.txt"), "wb") as f:
-                    self.kawano_data.savetxt(f)
-
             print("Execution log saved to file {}".format(self.logfile))
 
-            with open(os.path.join(self.folder, "evolution.txt"), "wb") as f:
-                self.data.savetxt(f)
+    def export_table(self, filename, table):
+        """ Append rows added to the `table` since the last export to the file. The first export\
+            in the process or after the columns change writes the file anew with the heading. """
+        columns, start = self.exported.get(filename, (None, None))
+        if columns != table.columns:
+            start = None
+        stop = len(table)
+        if start == stop:
+            return
+
+        rows = table.rows(start or 0, stop).copy()
+        header = start is None
+        self.writer.write(os.path.join(self.folder, filename),
+                          lambda f: table.savetxt(f, rows=rows, header=header),
+                          mode='w' if header else 'a')
+        self.exported[filename] = (list(table.columns), stop)
+
+    def export_tables(self):
+        self.export_table("evolution.txt", self.data)
+        if self.kawano:
+            self.export_table("kawano.txt", self.kawano_data)
+        if self.timer.table:
+            self.export_table("timings.txt", self.timer.table)
+
+    def flush(self):
+        """ Wait for the output files to be written """
+        if self.writer:
+            self.writer.flush()
+        if self.store:
+            self.store.flush()
+        if self.kawano_log and not self.kawano_log.closed:
+            self.kawano_log.flush()
+
+    def close(self):
+        """ Release the resources of the run once it is over: wait for the output and checkpoint\
+            files, stop the writer and collision threads and detach the logger from `stdout`.
+
+            Universes evolved one after another in the same process should be closed or used as\
+            context managers:
+
+                with Universe(folder=folder, params=params) as universe:
+                    universe.evolve(T_final)
+            """
+        try:
+            if self.checkpoint_writer:
+                self.checkpoint_writer.join()
+            self.flush()
+        finally:
+            if self.writer:
+                self.writer.close()
+                atexit.unregister(self.writer.close)
+            if self.store:
+                self.store.close()
+            if self.kawano_log and not self.kawano_log.closed:
+                self.kawano_log.close()
+            if self.collision_pool:
+                self.collision_pool.shutdown()
+                self.collision_pool = None
+            if self.logger:
+                self.logger.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def make_step(self):
+        if self.config.ADAPTIVE_TIMESTEP:
+            return self.make_adaptive_step()
+
+        h = self.equilibrium_step_size() if self.config.EQUILIBRIUM_FAST_FORWARD else None
+        if h:
+            self.set_epoch('equilibrium', h)
+            return self.make_equilibrium_step()
+
+        # The epoch is decided before the distributions are advanced, so that the step size of\
+        # the whole step is the one of the epoch
+        if self.config.FREE_STREAMING_FAST_FORWARD and self.free_streaming():
+            if self.epoch != 'free streaming':
+                h = self.kinetic_step if self.epoch is not None else self.params.h
+                self.set_epoch('free streaming', h * self.config.FREE_STREAMING_STEP_FACTOR)
+        elif self.epoch is not None:
+            self.set_epoch(None)
+
         self.integrand(self.params.x, self.params.aT)
 
         if self.step_monitor:
             self.step_monitor(self)
 
-        if environment.get('ADAMS_BASHFORTH_TEMPERATURE_CORRECTION'):
-            fs = (list(self.data['fraction'][-MAX_ADAMS_BASHFORTH_ORDER:]) + [self.fraction])
+        self.params.aT += self.temperature_correction()
+        self.params.count_step()
+
+        self.params.x += self.params.dx
+        self.params.update(self.total_energy_density(), self.total_entropy())
 
-            self.params.aT += adams_bashforth_correction(fs=fs, h=self.params.h)
+        self.log_throttler.update()
+
+    def temperature_correction(self, order=None):
+        if self.config.ADAMS_BASHFORTH_TEMPERATURE_CORRECTION:
+            fs = (list(self.data['fraction'][-MAX_ADAMS_BASHFORTH_ORDER:]) + [self.fraction])
+            if order is None:
+                # Only the history made with the current step size enters the scheme
+                order = self.params.multistep_order(min(MAX_ADAMS_BASHFORTH_ORDER, len(fs)))
+
+            return adams_bashforth_correction(fs=fs, h=self.params.h, order=order)
+
+        return self.fraction * self.params.h
+
+    def free_streaming(self):
+        """ Whether the distribution functions can only free-stream from now on: some species are\
+            out of equilibrium, none is left to decouple, every collision integral computed at\
+            the last step is retired and the KAWANO output has not started. Conformal\
+            distributions are frozen then and only `aT` changes. """
+        if not self.collisions_retired or self.kawano_output():
+            return False
+        if all(particle.in_equilibrium for particle in self.particles):
+            return False
+        return not any(self.params.T > particle.decoupling_temperature > 0
+                       for particle in self.particles)
+
+    def set_epoch(self, epoch, h=None):
+        """ Switch the step size between the kinetic epoch (`epoch=None`) and the fast-forwarded\
+            one with the step size `h`. The step size of the kinetic epoch is restored when it\
+            resumes, e.g. when a retired collision integral becomes active again: retired integrals\
+            are still probed every `INTEGRAL_PRUNING_PROBE` steps, so the collisions are not lost\
+            if a species recouples. """
+        if epoch == self.epoch:
+            if epoch is not None:
+                self.params.set_step(h)
+            return
+
+        if self.epoch is None:
+            self.kinetic_step = self.params.h
+        if epoch is None:
+            self.params.set_step(self.kinetic_step)
+            self.kinetic_step = None
         else:
-            self.params.aT += self.fraction * self.params.h
+            self.params.set_step(h)
+
+        print("{} epoch: step size h = {:e}".format((epoch or 'kinetic').capitalize(), self.params.h))
+        self.epoch = epoch
+        # History of another epoch does not enter the multistep methods even for the same step size
+        self.params.uniform_steps = 0
+
+    def equilibrium_step_size(self):
+        """ Step size of the equilibrium epoch or `None` if some species is out of equilibrium,\
+            the KAWANO output has started or the step would not be larger than the kinetic one.
+
+            The step stops short of the temperature where the first species decouples, the\
+            KAWANO output starts (or the evolution ends), so that the kinetic loop takes over with\
+            the matching state and the KAWANO rates are saved with the kinetic step. """
+        if self.kawano_output() or not all(particle.in_equilibrium for particle in self.particles):
+            return None
+
+        h_kinetic = self.kinetic_step if self.epoch is not None else self.params.h
+        h = h_kinetic * self.config.EQUILIBRIUM_STEP_FACTOR
+
+        T_stop = max([self.T_final or 0, self.kawano.T_kawano if self.kawano else 0]
+                     + [particle.decoupling_temperature for particle in self.particles])
+        if T_stop > 0:
+            # Scale factor at which the temperature drops to `T_stop` for constant $aT$
+            dx = self.params.aT * self.params.m / T_stop - self.params.x
+            h = min(h, dx / self.params.x if self.config.LOGARITHMIC_TIMESTEP else dx)
+
+        return h if h > h_kinetic else None
+
+    def equilibrium_entropy(self, aT):
+        """ Comoving entropy of the equilibrium species with the given $aT$ at the current scale\
+            factor """
+        for particle in self.particles:
+            particle.aT = aT
+            particle.T = aT / self.params.a
+        return self.total_entropy() * self.params.a**3
+
+    def make_equilibrium_step(self):
+        """ ## Equilibrium epoch
+            While every species is in equilibrium, the temperature equation reduces to the\
+            conservation of the comoving entropy:
+
+            \begin{equation}
+                s(T) a^3 = const
+            \end{equation}
+
+            It is solved for $aT$ at the next scale factor directly, so the step size is only\
+            bounded by the resolution of the output. The initial guess follows the change of the\
+            entropic degrees of freedom and is refined by the fixed point iterations\
+            $aT \leftarrow aT (S / S(aT))^{1/3}$. Time is integrated by the trapezoidal rule in\
+            the scale factor, exact for the radiation dominated expansion. """
+
+        params = self.params
+        with self.timer('update_particles'):
+            self.update_particles()
+
+        aT, a, t, H = params.aT, params.a, params.t, params.H
+        entropy = self.total_entropy() * a**3
+        dof = Params.entropic_dof_eq(self)
+
+        params.x += params.dx
+        params.a = params.x / params.m
+        params.T = aT / params.a
+        dof_new = Params.entropic_dof_eq(self)
+        aT_new = aT * (dof / dof_new) ** (1. / 3.) if dof and dof_new else aT
+
+        with self.timer('calculate_temperature_terms'):
+            for iteration in range(100):
+                ratio = entropy / self.equilibrium_entropy(aT_new)
+                if abs(ratio - 1.) < params.aT_tolerance:
+                    break
+                aT_new *= ratio ** (1. / 3.)
+            else:
+                raise Exception("Entropy conservation is not solved at T = {:e} MeV"
+                                .format(aT_new / params.a / UNITS.MeV))
+
+        self.fraction = (aT_new - aT) / params.h
+        if self.step_monitor:
+            self.step_monitor(self)
+
+        params.aT = aT_new
+        params.update(self.total_energy_density(), self.total_entropy())
+        params.t = t + (params.a - a) * (1. / (a * H) + 1. / (params.a * params.H)) / 2.
+        params.count_step()
+
+        self.log_throttler.update()
+
+    def step_error(self):
+        """ Local error estimate of the current step relative to the requested tolerances.
+
+            Temperature error is estimated as the difference between the Adams-Bashforth\
+            corrections of two successive orders. Right after a step size change the scheme is of\
+            the first order and its error $h^2 / 2 \, d^2(aT) / dy^2$ is estimated with the\
+            derivative change over the previous step. Distribution functions error is estimated\
+            by the largest relative change `collision_integral * h / f` of non-equilibrium species.
+        """
+        error = 0.
+
+        history = len(self.data['fraction'])
+        if self.config.ADAMS_BASHFORTH_TEMPERATURE_CORRECTION and history:
+            order = self.params.multistep_order(min(MAX_ADAMS_BASHFORTH_ORDER, history + 1))
+            if order > 1:
+                aT_error = abs(self.temperature_correction(order=order)
+                               - self.temperature_correction(order=order - 1))
+            else:
+                aT_error = (self.params.h**2 / 2. * abs(self.fraction - self.data['fraction'][-1])
+                            / self.data['h'][-1])
+            error = max(error, aT_error / self.params.aT / self.params.aT_tolerance)
+
+        for particle in self.particles:
+            if particle.in_equilibrium:
+                continue
+            mask = particle._distribution > 0
+            if not numpy.any(mask):
+                continue
+            change = numpy.max(numpy.abs(particle.collision_integral[mask] * self.params.h
+                                         / particle._distribution[mask]))
+            error = max(error, change / self.params.distribution_tolerance)
+
+        return error
+
+    def make_adaptive_step(self):
+        """ Error-controlled step: the step is repeated with a smaller step size if the local error\
+            estimate exceeds the tolerances or the state becomes unphysical. Step size for the\
+            next step is adjusted according to the error of the accepted one. """
+
+        params = dict(self.params.__dict__)
+        particles = [particle.step_snapshot() for particle in self.particles]
+
+        while True:
+            self.integrand(self.params.x, self.params.aT)
+            error = self.step_error()
 
+            aT = self.params.aT + self.temperature_correction()
+            valid = numpy.isfinite(aT) and aT > 0 and numpy.isfinite(error)
+
+            if valid and (error <= 1. or self.params.h <= self.params.h_min):
+                break
+
+            if self.params.h <= self.params.h_min:
+                raise Exception("Step rejected at the minimal step size h = {:e}: {}"
+                                .format(self.params.h, "aT = {:e}".format(aT) if not valid
+                                        else "error = {:e}".format(error)))
+
+            # Roll back and retry with a smaller step
+            h = self.params.h * (max(0.1, 0.9 / error ** 0.5) if valid and error > 1. else 0.25)
+            self.params.__dict__.update(params)
+            for particle, snapshot in zip(self.particles, particles):
+                particle.rollback(snapshot)
+            self.params.set_step(h)
+
+        if self.step_monitor:
+            self.step_monitor(self)
+
+        self.params.aT = aT
         self.params.x += self.params.dx
         self.params.update(self.total_energy_density(), self.total_entropy())
 
         self.log_throttler.update()
 
+        # Step size for the next step. It is kept unless the error calls for a substantial change,\
+        # so that the multistep methods regain their order over the steps of the same size
+        self.step_size = self.params.h
+        self.params.count_step()
+        growth = 0.9 / error ** 0.5 if error > 0 else 2.
+        if growth < 1. or growth >= 1.5:
+            self.params.set_step(self.params.h * min(2., max(0.5, growth)))
+
     def add_particles(self, particles):
         for particle in particles:
             particle.set_params(self.params)
+            if self.history:
+                self.bound_particle_history(particle)
 
         self.particles += particles
 
@@ -230,11 +764,120 @@ class Universe(object):
 
         particles = [particle for particle in self.particles if particle.collision_integrals]
 
-        with utils.printoptions(precision=3, linewidth=100):
-            for particle in particles:
-                # with (utils.benchmark(lambda: "δf/f ({}) = {}".format(particle.symbol, particle.collision_integral / particle._distribution * self.params.h),
-                #       self.log_throttler.output)):
+        if self.config.IMPLICIT_DISTRIBUTION_STEP:
+            self.collisions_retired = not particles
+            return self.implicit_collisions(particles)
+
+        classes = [[particle] for particle in particles]
+        if self.config.SPECIES_EQUIVALENCE:
+            classes = equivalence_classes(particles,
+                                          exclude=self.oscillations[1] if self.oscillations else ())
+            self.log_equivalence(classes)
+            particles = [members[0] for members in classes]
+
+        threads = self.config.COLLISION_THREADS
+        if threads > 1:
+            self.schedule_collisions(particles, threads)
+        else:
+            with utils.printoptions(precision=3, linewidth=100):
+                for particle in particles:
+                    # with (utils.benchmark(lambda: "δf/f ({}) = {}".format(particle.symbol, particle.collision_integral / particle._distribution * self.params.h),
+                    #       self.log_throttler.output)):
+                    with self.timer('calculate_collisions/' + particle.name):
+                        particle.collision_integral = particle.integrate_collisions()
+
+        for representative, *members in classes:
+            for member in members:
+                member.collision_integral = numpy.array(representative.collision_integral)
+
+        # Integrals of the species sharing the collision integrals are not assessed
+        self.collisions_retired = all(integral.retired for particle in particles
+                                      for integral in particle.collision_integrals)
+
+    def log_equivalence(self, classes):
+        """ Report the species sharing the collision integrals whenever the classes change """
+        shared = tuple(tuple(member.name for member in members)
+                       for members in classes if len(members) > 1)
+        if shared != self.equivalent_species:
+            self.equivalent_species = shared
+            print("Species sharing collision integrals: {}".format(
+                "; ".join(", ".join(names) for names in shared) or "none"))
+
+    def implicit_collisions(self, particles):
+        """ Solve for the distribution functions of all non-equilibrium species at the next step\
+            at once, accounting for their coupling through the collision integrals.
+
+            Collision integrals are then set so that `update_distributions` yields the solution. """
+        implicit = []
+        for particle in particles:
+            ps = particle.grid.TEMPLATE
+            if (particle.decayed or kinematics.has_decayed(particle, ps)
+                    or hasattr(particle, 'fast_decay')):
                 particle.collision_integral = particle.integrate_collisions()
+            else:
+                implicit.append(particle)
+
+        if not implicit:
+            return
+
+        sizes = [particle.grid.MOMENTUM_SAMPLES for particle in implicit]
+        offsets = numpy.cumsum([0] + sizes)
+        current = [particle._distribution.copy() for particle in implicit]
+
+        def rate(fs):
+            for particle, start, stop in zip(implicit, offsets[:-1], offsets[1:]):
+                particle._distribution = fs[start:stop]
+            return numpy.concatenate([particle.collision_rate() for particle in implicit])
+
+        # Distribution functions history of the same length and step size for all species
+        order = self.params.multistep_order(min([len(particle.data['distribution'])
+                                                 for particle in implicit]
+                                                + [MAX_BACKWARD_DIFF_ORDER]))
+        ys = [numpy.concatenate([particle.data['distribution'][i - order] for particle in implicit])
+              for i in range(order - 1)] + [numpy.concatenate(current)]
+
+        # The relative residual is kept well below the error allowed per step
+        tolerance = self.params.distribution_tolerance**2
+        try:
+            solution = newton_krylov_step(ys, rate, self.params.h, order=order, tolerance=tolerance)
+        except optimize.NoConvergence:
+            solution = None
+        finally:
+            for particle, distribution in zip(implicit, current):
+                particle._distribution = distribution
+
+        if solution is None:
+            print("Warning: implicit step did not converge to {:.0e}, "
+                  "falling back to the per-species step".format(tolerance))
+            for particle in implicit:
+                particle.collision_integral = particle.integrate_collisions()
+            return
+
+        for particle, start, stop in zip(implicit, offsets[:-1], offsets[1:]):
+            particle.collision_integral = (solution[start:stop] - particle._distribution) / self.params.h
+
+    def schedule_collisions(self, particles, threads):
+        """ Compute collision integrals of all particles concurrently in a thread pool.
+
+            Integration routines release the GIL, so all integrals of the step run in parallel,\
+            while the terms are summed in the same order as in the serial computation. """
+        if self.collision_pool is None or self.collision_pool._max_workers != threads:
+            self.collision_pool = ThreadPoolExecutor(max_workers=threads)
+
+        pending = []
+
+        def collect():
+            for particle, result in pending:
+                particle.collision_integral = result()
+            del pending[:]
+
+        for particle in particles:
+            # Fast decaying species normalize the creation integrals of lighter species
+            if hasattr(particle, 'fast_decay'):
+                collect()
+            pending.append((particle, particle.schedule_collision_integral(self.collision_pool)))
+
+        collect()
 
     def update_distributions(self):
         """ ### 4. Update particles distributions """
@@ -285,17 +928,27 @@ class Universe(object):
         """
 
         # 1\. Update particles states
-        self.update_particles()
+        with self.timer('update_particles'):
+            self.update_particles()
         # 2\. Initialize non-equilibrium interactions
-        self.init_interactions()
+        with self.timer('init_interactions'):
+            self.init_interactions()
         # 3\. Calculate collision integrals
-        self.calculate_collisions()
+        with self.timer('calculate_collisions'):
+            self.calculate_collisions()
+            if self.epoch == 'free streaming' and not self.free_streaming():
+                # A probed integral is revived: the kinetic step size is restored and the\
+                # collision integrals are computed with it before the distributions are advanced
+                self.set_epoch(None)
+                self.calculate_collisions()
         # 4\. Update particles distributions
-        self.update_distributions()
+        with self.timer('update_distributions'):
+            self.update_distributions()
         # 5\. Calculate temperature equation terms
-        numerator, denominator = self.calculate_temperature_terms()
+        with self.timer('calculate_temperature_terms'):
+            numerator, denominator = self.calculate_temperature_terms()
 
-        if environment.get('LOGARITHMIC_TIMESTEP'):
+        if self.config.LOGARITHMIC_TIMESTEP:
             self.fraction = self.params.x * numerator / denominator
         else:
             self.fraction = numerator / denominator
@@ -312,46 +965,63 @@ class Universe(object):
             'N_eff': self.params.N_eff,
             't': self.params.t,
             'fraction': self.fraction,
-            'S': self.params.S
+            'S': self.params.S,
+            'h': self.step_size if self.step_size is not None else self.params.h
         })
 
     def save(self):
         """ Save current Universe parameters into the data arrays or output files """
         self.save_params()
 
-        if self.kawano and self.params.T <= self.kawano.T_kawano:
+        if self.store and self.step % self.store_freq == 0:
+            self.store.append(self)
 
-            #     t[s]         x    Tg[10^9K]   dTg/dt[10^9K/s] rho_tot[g cm^-3]     H[s^-1]
-            # n nue->p e  p e->n nue  n->p e nue  p e nue->n  n e->p nue  p nue->n e
+        if self.kawano_output():
+            with self.timer('kawano'):
+                self.save_kawano()
 
-            rates = self.kawano.baryonic_rates(self.params.a)
+    def kawano_output(self):
+        """ Whether the baryonic rates are saved for the KAWANO at the current temperature """
+        return bool(self.kawano) and self.params.T <= self.kawano.T_kawano
 
-            if environment.get('LOGARITHMIC_TIMESTEP'):
-                dTdt = (self.fraction - self.params.aT) * self.params.H / self.params.a
-            else:
-                dTdt = (self.fraction - self.params.T / self.params.m) * self.params.H * self.params.m
+    def save_kawano(self):
+        """ Save the baryonic rates for the KAWANO """
+        #     t[s]         x    Tg[10^9K]   dTg/dt[10^9K/s] rho_tot[g cm^-3]     H[s^-1]
+        # n nue->p e  p e->n nue  n->p e nue  p e nue->n  n e->p nue  p nue->n e
 
-            row = {
-                self.kawano_data.columns[0]: self.params.t,
-                self.kawano_data.columns[1]: self.params.x,
-                self.kawano_data.columns[2]: self.params.T,
-                self.kawano_data.columns[3]: dTdt,
-                self.kawano_data.columns[4]: self.params.rho,
-                self.kawano_data.columns[5]: self.params.H
-            }
+        rates = self.kawano.baryonic_rates(self.params.a, self.kawano_particles)
 
-            row.update({self.kawano_data.columns[i]: rate
-                        for i, rate in enumerate(rates, 6)})
+        if self.config.LOGARITHMIC_TIMESTEP:
+            dTdt = (self.fraction - self.params.aT) * self.params.H / self.params.a
+        else:
+            dTdt = (self.fraction - self.params.T / self.params.m) * self.params.H * self.params.m
+
+        row = {
+            self.kawano_data.columns[0]: self.params.t,
+            self.kawano_data.columns[1]: self.params.x,
+            self.kawano_data.columns[2]: self.params.T,
+            self.kawano_data.columns[3]: dTdt,
+            self.kawano_data.columns[4]: self.params.rho,
+            self.kawano_data.columns[5]: self.params.H
+        }
+
+        row.update({self.kawano_data.columns[i]: rate
+                    for i, rate in enumerate(rates, 6)})
 
-            self.kawano_data.append(row)
+        self.kawano_data.append(row)
 
-            if self.log_throttler.output:
-                print("KAWANO", self.kawano_data.row_repr(-1, names=True))
-            self.kawano_log.write(self.kawano_data.row_repr(-1) + "\n")
+        if self.log_throttler.output:
+            print("KAWANO", self.kawano_data.row_repr(-1, names=True))
+        row = self.kawano_data.row_repr(-1) + "\n"
+        if self.writer:
+            self.writer.write(self.kawano_log, row)
+        else:
+            self.kawano_log.write(row)
 
-    def init_log(self, folder=''):
+    def init_log(self, folder='', mode="wb"):
         self.logfile = utils.ensure_path(os.path.join(self.folder, 'log.txt'))
-        sys.stdout = utils.Logger(self.logfile)
+        self.logger = utils.Logger(self.logfile, mode=mode)
+        sys.stdout = self.logger
 
     def log(self):
         """ Runtime log output """
@@ -374,6 +1044,32 @@ class Universe(object):
     def total_energy_density(self):
         return sum(particle.energy_density for particle in self.particles)
 
+    def integrals_report(self, top=10):
+        """ The `top` most expensive interactions and collision integrals of the run by the wall\
+            time spent in `integrate` """
+        interactions = [(interaction.name, interaction.counters())
+                        for interaction in self.interactions]
+        integrals = [(str(integral), integral.counters)
+                     for interaction in self.interactions for integral in interaction.integrals
+                     if integral.counters]
+
+        def table(title, rows):
+            rows = sorted([row for row in rows if row[1].get('calls')],
+                          key=lambda row: -row[1]['time'])[:top]
+            lines = ["{:<60s} {:>10s} {:>8s} {:>9s} {:>8s} {:>8s} {:>13s} {:>12s}".format(
+                title, "time, s", "calls", "neglected", "pruned", "bins", "evaluations",
+                "subintervals")]
+            for name, counters in rows:
+                lines.append("{:<60s} {:>10.3f} {:>8d} {:>9d} {:>8d} {:>8d} {:>13d} {:>12d}".format(
+                    name.split('\t')[0][:60], counters['time'], counters['calls'],
+                    counters['neglected'], counters['pruned'], counters['bins'],
+                    counters['evaluations'], counters['subintervals']))
+            return "\n".join(lines)
+
+        if not any(counters.get('calls') for _, counters in interactions):
+            return ""
+        return table("Interaction", interactions) + "\n\n" + table("Integral", integrals)
+
     def QCD_transition(self, hadrons=None, quarkic_interactions=None, hadronic_interactions=None, secondary_interactions=None):
         self.data.truncate()
 
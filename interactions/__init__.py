@@ -47,6 +47,13 @@ class Interaction:
         for integral in self.integrals:
             integral.initialize()
 
+    def counters(self):
+        """ Cost counters of the integrals summed over the interaction """
+        total = Counter()
+        for integral in self.integrals:
+            total.update(integral.counters or {})
+        return total
+
 
 class CrossGeneratingInteraction(Interaction):
 
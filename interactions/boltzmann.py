@@ -1,6 +1,111 @@
 # -*- coding: utf-8 -*-
+import time
 import numpy
+import functools
 from common import integrators
+from interactions.four_particle.cpp.integral import CollisionIntegralKind
+
+
+# Cost counters of the collision integrals
+COUNTERS = ('calls', 'neglected', 'pruned', 'time', 'bins', 'evaluations', 'subintervals',
+            'fallbacks')
+
+
+def counted(integrate):
+    """ Count the calls of the `integrate` method and the wall time spent in them """
+    @functools.wraps(integrate)
+    def wrapper(self, *args, **kwargs):
+        start = time.time()
+        try:
+            return integrate(self, *args, **kwargs)
+        finally:
+            self.count(calls=1, time=time.time() - start)
+    return wrapper
+
+
+class SpecieHandle(object):
+
+    """ ## Particle handle
+        Persistent view of a particle species passed to the C++ integrators. The extension reads\
+        the momentum grid and the distribution function directly from the NumPy buffers kept\
+        here, so they are not copied for each integral. `update` refreshes the handle in place:\
+        the grid and scalars change only when the temperature or the scale factor do, and a new\
+        buffer is attached only when the distribution function array is replaced.
+
+        With `RESAMPLED_DISTRIBUTIONS` the handle also holds the distribution function resampled\
+        on a dense uniform grid. It is recomputed when the distribution function or the state\
+        change, into a new buffer so that integrals still reading the old one are not affected. """
+
+    def __init__(self, specie, grid_type, particle_type):
+        self.specie = specie
+        self.grid_type = grid_type
+        self.particle_type = particle_type
+
+        self.template = None
+        self.grid = None
+        self.source = None
+        self.distribution = None
+        self.state = None
+        self.cpp = None
+
+        self.resampled = None
+        self.resampled_from = None
+        self.resampled_state = None
+
+    @classmethod
+    def get(cls, specie, grid_type, particle_type):
+        """ The handle of the `specie` shared by all integrals of the extension """
+        handles = specie.__dict__.setdefault('integration_handles', {})
+        return handles.setdefault(particle_type, cls(specie, grid_type, particle_type))
+
+    def update(self, aT):
+        specie = self.specie
+
+        if self.template is not specie.grid.TEMPLATE:
+            self.template = specie.grid.TEMPLATE
+            self.grid = numpy.empty(len(self.template), dtype=numpy.float64)
+            self.source = None
+            self.state = None
+
+        if self.source is not specie._distribution:
+            self.source = specie._distribution
+            # Only arrays of other types or layouts are copied
+            self.distribution = numpy.ascontiguousarray(self.source, dtype=numpy.float64)
+            grid = self.grid_type(grid=self.grid, distribution=self.distribution,
+                                  spacing=specie.grid.SPACING, base=specie.grid.BASE)
+            if self.cpp is None:
+                self.cpp = self.particle_type(eta=int(specie.eta), m=0., grid=grid,
+                                              in_equilibrium=0, T=1.)
+            else:
+                self.cpp.grid = grid
+
+        state = (aT, specie.aT, specie.conformal_mass, specie.in_equilibrium)
+        if state != self.state:
+            numpy.divide(self.template, aT, out=self.grid)
+            self.cpp.m = specie.conformal_mass / aT
+            self.cpp.T = specie.aT / aT
+            self.cpp.in_equilibrium = int(specie.in_equilibrium)
+            self.state = state
+
+        config = specie.params.config
+        if not config.RESAMPLED_DISTRIBUTIONS:
+            if self.resampled is not None:
+                self.cpp.resample(None)
+                self.resampled = self.resampled_from = self.resampled_state = None
+        elif not specie.in_equilibrium:
+            self.resample(config.RESAMPLED_DISTRIBUTIONS_DENSITY)
+
+        return self.cpp
+
+    def resample(self, density):
+        if (self.resampled_state == self.state
+                and numpy.array_equal(self.resampled_from, self.distribution)):
+            return
+
+        self.resampled = numpy.empty((len(self.grid) - 1) * density + 1, dtype=numpy.float64)
+        self.cpp.resample(self.resampled)
+        self.resampled_from = self.distribution.copy()
+        self.resampled_state = self.state
 
 
 class BoltzmannIntegral(object):
@@ -43,6 +148,12 @@ class BoltzmannIntegral(object):
     """ Grids corresponding to particles integrated over """
     grids = None
 
+    """ `grid_t`, `particle_t` and `reaction_t` types of the C++ extension and the reactants\
+        passed to it, see `SpecieHandle` """
+    cpp_types = None
+    handles = None
+    creaction = None
+
     def __init__(self, **kwargs):
         """ Update self with configuration `kwargs`, construct particles list and \
             energy conservation law of the integral. """
@@ -69,12 +180,136 @@ class BoltzmannIntegral(object):
     def __repr__(self):
         return self.__str__()
 
+    """ ### Cost counters
+
+        `counters` accumulate the number of `integrate` calls, the calls short-circuited by the\
+        `Neglect*Interaction` checks, the wall time and the work done by the C++ integrator: the\
+        momentum bins evaluated, the integrand evaluations and the GSL subintervals. """
+
+    counters = None
+
+    def count(self, **counts):
+        if self.counters is None:
+            self.reset_counters()
+        for key, value in counts.items():
+            self.counters[key] += value
+
+    def record(self, stats):
+        """ Add the counters of the C++ `integration` call """
+        self.count(bins=stats.bins, evaluations=stats.evaluations,
+                   subintervals=stats.subintervals)
+
+    def reset_counters(self):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    """ ### Automatic pruning
+
+        With `INTEGRAL_PRUNING` every computed integral is assessed by its largest relative\
+        contribution to the distribution function over the step $|I h / f|$ and by the rate of\
+        the reaction relative to the expansion $\Gamma / H$, given by the part of the integral\
+        proportional to $f$. An integral below both thresholds for `INTEGRAL_PRUNING_STEPS`\
+        consecutive steps is retired: it is replaced by zeros without any integration, except\
+        every `INTEGRAL_PRUNING_PROBE`-th step when it is computed again and revived if it\
+        matters by then. """
+
+    quiet_steps = 0
+    idle_steps = 0
+    retired = False
+
+    def active(self):
+        """ Whether the integral has to be computed at this step """
+        config = self.particle.params.config
+        if not (config.INTEGRAL_PRUNING and self.retired):
+            return True
+
+        self.idle_steps += 1
+        if self.idle_steps >= config.INTEGRAL_PRUNING_PROBE:
+            self.idle_steps = 0
+            return True
+
+        self.count(pruned=1)
+        return False
+
+    def assess(self, value):
+        """ Retire or revive the integral by its computed `value` on the particle grid """
+        params = self.particle.params
+        config = params.config
+        if not config.INTEGRAL_PRUNING:
+            return
+
+        f = self.particle._distribution
+        if isinstance(value, tuple):
+            value, loss = value
+            loss = numpy.array(loss)
+        elif self.kind in [CollisionIntegralKind.F_f, CollisionIntegralKind.F_decay,
+                           CollisionIntegralKind.F_f_vacuum_decay]:
+            loss = None
+        else:
+            loss = numpy.zeros(len(f))
+
+        # Integrals are derivatives over the evolution variable $y$: $\Gamma = |I / f| dy/dt$
+        dy_dt = params.H if config.LOGARITHMIC_TIMESTEP else params.x * params.H
+
+        positive = f > 0
+        if not positive.any():
+            contribution = rate = 0.
+        else:
+            relative = numpy.abs(numpy.array(value)[positive] / f[positive])
+            contribution = relative.max() * params.h
+            rate = relative.max() if loss is None else numpy.abs(loss[positive]).max()
+            rate *= dy_dt / params.H
+
+        if contribution >= config.INTEGRAL_PRUNING_TOLERANCE or rate >= config.INTEGRAL_PRUNING_RATE:
+            self.quiet_steps = 0
+            if self.retired:
+                self.retired = False
+                print("Pruning: revived {} (|I h / f| = {:.1e}, Γ / H = {:.1e})"
+                      .format(self, contribution, rate))
+            return
+
+        self.quiet_steps += 1
+        if not self.retired and self.quiet_steps >= config.INTEGRAL_PRUNING_STEPS:
+            self.retired = True
+            self.idle_steps = 0
+            print("Pruning: retired {} (|I h / f| = {:.1e}, Γ / H = {:.1e})"
+                  .format(self, contribution, rate))
+
+    """ ### Checkpoint state
+
+        Pruning state, cost counters and the tables reused between the steps. Integrals are matched\
+        to the checkpoint by their position among the interactions of the universe. """
+
+    state_attributes = ('quiet_steps', 'idle_steps', 'retired', 'counters')
+
+    def state(self):
+        return {name: getattr(self, name) for name in self.state_attributes}
+
+    def restore_state(self, state):
+        for name in self.state_attributes:
+            setattr(self, name, state[name])
+
     def initialize(self):
         """
         Initialize collision integral constants and save them to the first involved particle
         """
         raise NotImplementedError()
 
+    def reaction_handles(self, aT):
+        """ Reactants of the C++ integrator updated for the current step """
+        grid_type, particle_type, reaction_type = self.cpp_types
+
+        if self.handles is None:
+            self.handles = [SpecieHandle.get(item.specie, grid_type, particle_type)
+                            for item in self.reaction]
+
+        species = [handle.update(aT) for handle in self.handles]
+
+        if self.creaction is None:
+            self.creaction = [reaction_type(specie=specie, side=item.side)
+                              for specie, item in zip(species, self.reaction)]
+
+        return self.creaction
+
     def rates(self):
         forward_integral = numpy.vectorize(lambda p0: p0**2 / (2 * numpy.pi)**3
                                            * self.integrate(p0, self.F_A)[0])
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""
+# Equivalent species
+
+Species with the same mass, statistics, momentum grid and distribution function that take part\
+in the same reactions have identical collision integrals. For example, without oscillations and\
+with the mixing only in the electron channel, muon and tau neutrinos can not be told apart.
+
+`equivalence_classes` groups such species, so that only the collision integral of the first\
+member of each class has to be computed. Classes are found from the current states at each step,\
+so the species split as soon as their distribution functions diverge. Species mixed by the\
+oscillation pattern are excluded, since the pattern weighs their integrals by flavour.
+"""
+
+from collections import Counter, OrderedDict
+
+import numpy
+
+from common.integrators import MAX_ADAMS_MOULTON_ORDER
+
+
+def specie_state(particle):
+    """ Everything the collision integral of the `particle` depends on besides the reactions """
+    history = numpy.asarray(particle.data['collision_integral'][-MAX_ADAMS_MOULTON_ORDER:])
+    return (
+        particle.mass, particle.eta, particle.dof, particle.majorana,
+        particle.in_equilibrium, particle.decoupling_temperature, particle.aT,
+        particle.grid.TEMPLATE.tobytes(), particle._distribution.tobytes(), history.tobytes()
+    )
+
+
+def shareable(particle):
+    """ Fast decaying species and the creation integrals normalized by them depend on the names\
+        of the species through the branching ratios """
+    return not (particle.decayed or hasattr(particle, 'fast_decay')
+                or any(hasattr(item.specie, 'fast_decay')
+                       for integral in particle.collision_integrals for item in integral.reaction))
+
+
+def matrix_element_signature(M):
+    return (type(M).__name__,) + tuple(getattr(M, name, None) for name in ('K1', 'K2', 'K', 'order'))
+
+
+def reaction_signature(integral, tokens):
+    """ The `integral` with the species replaced by the `tokens` of their classes """
+    return (
+        type(integral).__name__, int(integral.kind),
+        tuple((item.side, item.antiparticle, item.crossed,
+               tokens.get(id(item.specie), id(item.specie)))
+              for item in integral.reaction),
+        frozenset(Counter(matrix_element_signature(M) for M in integral.Ms).items())
+    )
+
+
+def equivalence_classes(particles, exclude=()):
+    """ Partition `particles` into the lists of species with identical collision integrals.
+
+        Species in `exclude` are kept in classes of their own. Others are first grouped by their\
+        states. Groups are then refined by the multisets of the reactions, where the species of\
+        each group are interchangeable, until no group splits. """
+    groups = OrderedDict()
+    for index, particle in enumerate(particles):
+        excluded = any(particle is specie for specie in exclude)
+        key = specie_state(particle) if shareable(particle) and not excluded else index
+        groups.setdefault(key, []).append(particle)
+    classes = list(groups.values())
+
+    while True:
+        tokens = {id(member): ('class', index)
+                  for index, members in enumerate(classes) for member in members}
+
+        refined = []
+        for members in classes:
+            groups = OrderedDict()
+            for particle in members:
+                key = frozenset(Counter(reaction_signature(integral, tokens)
+                                        for integral in particle.collision_integrals).items())
+                groups.setdefault(key, []).append(particle)
+            refined.extend(groups.values())
+
+        if len(refined) == len(classes):
+            return refined
+        classes = refined
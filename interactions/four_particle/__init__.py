@@ -3,13 +3,12 @@ import numpy
 from scipy.integrate import simps
 from scipy.interpolate import interp1d, UnivariateSpline
 import os
-import environment
 from collections import Counter
 from common import CONST, UNITS, kinematics
-from interactions.boltzmann import BoltzmannIntegral
+from interactions.boltzmann import BoltzmannIntegral, counted
 from interactions.four_particle.cpp.integral import (
-    integration, M_t, grid_t, particle_t, reaction_t,
-    CollisionIntegralKind
+    integration, integration_kinds, vacuum_decay_kernels, collision_jacobians, M_t, grid_t, particle_t, reaction_t,
+    CollisionIntegralKind, integration_stats_t
 )
 
 
@@ -86,6 +85,15 @@ class FourParticleM(object):
 
 class FourParticleIntegral(BoltzmannIntegral):
 
+    cpp_types = (grid_t, particle_t, reaction_t)
+
+    """ Tabulated vacuum decay integrals, see `vacuum_decay_integration` """
+    kernels = None
+    """ Linearized collision integrals, see `linearized_integration` """
+    linearization = None
+
+    state_attributes = BoltzmannIntegral.state_attributes + ('kernels', 'linearization')
+
     def __init__(self, **kwargs):
         super(FourParticleIntegral, self).__init__(**kwargs)
 
@@ -99,12 +107,144 @@ class FourParticleIntegral(BoltzmannIntegral):
         if self.grids is None:
             self.grids = tuple([self.reaction[1].specie.grid, self.reaction[2].specie.grid])
 
-        self.creaction = None
         self.cMs = None
 
+    def integration(self, ps, bounds, stepsize, kind):
+        stats = integration_stats_t()
+        result = integration(ps, *bounds, self.creaction, self.cMs, stepsize, kind, stats)
+        self.record(stats)
+        return result
+
+    def integration_kinds(self, ps, bounds, stepsize, kinds):
+        """ Integrals of several `kinds` computed in a single adaptive pass """
+        stats = integration_stats_t()
+        results = integration_kinds(ps, *bounds, self.creaction, self.cMs, stepsize,
+                                    [int(kind) for kind in kinds], stats)
+        self.record(stats)
+        return results
+
+    def conformal_masses(self):
+        """ Masses of the reactants in units of `aT` """
+        return (numpy.array([item.specie.conformal_mass for item in self.reaction])
+                / self.particle.params.aT)
+
+    @staticmethod
+    def stale(table, ps, masses, tolerance):
+        """ Whether the `table` tabulated over momenta `ps` for the reactants `masses` (both in\
+            units of `aT`) has to be computed again """
+        return not (table
+                    and len(table['ps']) == len(ps)
+                    and numpy.allclose(table['ps'], ps, rtol=tolerance, atol=0)
+                    and numpy.allclose(table['masses'], masses, rtol=tolerance, atol=0))
+
+    def vacuum_decay_integration(self, ps, bounds):
+        """ Vacuum decay integrals do not depend on the distribution functions (`F_f_vacuum_decay`)\
+            or are linear in the distribution function of the parent particle (`F_1_vacuum_decay`).\
+            They are tabulated once and reused while the momenta and masses in units of `aT` stay\
+            within `VACUUM_DECAY_KERNEL_TOLERANCE` of the tabulated ones. """
+        params = self.particle.params
+        parent = self.reaction[3].specie
+        masses = self.conformal_masses()
+
+        if self.stale(self.kernels, ps, masses, params.config.VACUUM_DECAY_KERNEL_TOLERANCE):
+            nodes, weights = numpy.polynomial.legendre.leggauss(params.config.GAUSS_LEGENDRE_ORDER)
+            stats = integration_stats_t()
+            vector, matrix = vacuum_decay_kernels(ps, *bounds, self.creaction, self.cMs,
+                                                  nodes, weights, stats)
+            self.record(stats)
+            self.kernels = {
+                'ps': numpy.array(ps),
+                'masses': masses,
+                'vector': numpy.array(vector),
+                'matrix': numpy.array(matrix)
+            }
+
+        if self.kind == CollisionIntegralKind.F_f_vacuum_decay:
+            return self.kernels['vector']
+        return self.kernels['matrix'].dot(parent._distribution)
+
+    def linearized_integration(self, ps, bounds, stepsize, kinds):
+        """ Integrals of several `kinds` linearized in the distribution functions of the\
+            non-equilibrium reactants around the background of the last tabulation:
+
+            \begin{equation}
+                I(f) \approx I(f_0) + \frac{\partial I}{\partial f} (f - f_0)
+            \end{equation}
+
+            The integrals and their derivatives on the grids are tabulated again when the momenta\
+            or masses in units of `aT` drift by more than `LINEARIZED_COLLISIONS_TOLERANCE`.\
+            Every `LINEARIZED_COLLISIONS_VALIDATION`-th result is compared to the exact\
+            integration: if they differ by more than the tolerance, the exact result is used and\
+            the integral is linearized again around the current distribution functions.
+
+            Integrals with a reactant further than `LINEARIZED_COLLISIONS_DEVIATION` from its\
+            equilibrium distribution function are integrated exactly, since the linearization is\
+            accurate only for small distortions of the background. """
+        params = self.particle.params
+        config = params.config
+
+        species = []
+        groups = []
+        for item in self.reaction:
+            if item.specie.in_equilibrium:
+                groups.append(-1)
+                continue
+            if not any(specie is item.specie for specie in species):
+                species.append(item.specie)
+            groups.append(next(i for i, specie in enumerate(species) if specie is item.specie))
+
+        if any(specie.equilibrium_deviation() > config.LINEARIZED_COLLISIONS_DEVIATION
+               for specie in species):
+            self.linearization = None
+            return self.integration_kinds(ps, bounds, stepsize, kinds)
+
+        table = self.linearization
+        masses = self.conformal_masses()
+
+        if (self.stale(table, ps, masses, config.LINEARIZED_COLLISIONS_TOLERANCE)
+                or table['groups'] != groups):
+            values = self.integration_kinds(ps, bounds, stepsize, kinds)
+            nodes, weights = numpy.polynomial.legendre.leggauss(config.GAUSS_LEGENDRE_ORDER)
+            stats = integration_stats_t()
+            jacobians = collision_jacobians(ps, *bounds, self.creaction, self.cMs,
+                                            [int(kind) for kind in kinds], groups,
+                                            nodes, weights, stats)
+            self.record(stats)
+            self.linearization = {
+                'ps': numpy.array(ps),
+                'masses': masses,
+                'groups': groups,
+                'background': [numpy.array(specie._distribution) for specie in species],
+                'values': [numpy.array(value) for value in values],
+                'jacobians': [[numpy.array(jacobian).reshape(len(ps), -1) for jacobian in kind]
+                              for kind in jacobians],
+                'calls': 0
+            }
+            return values
+
+        deltas = [specie._distribution - background
+                  for specie, background in zip(species, table['background'])]
+        results = [value + sum(jacobian.dot(delta) for jacobian, delta in zip(kind, deltas))
+                   for value, kind in zip(table['values'], table['jacobians'])]
+
+        table['calls'] += 1
+        if table['calls'] % config.LINEARIZED_COLLISIONS_VALIDATION == 0:
+            exact = self.integration_kinds(ps, bounds, stepsize, kinds)
+            for result, value in zip(results, exact):
+                value = numpy.array(value)
+                scale = numpy.abs(value).max()
+                if scale and numpy.abs(result - value).max() > config.LINEARIZED_COLLISIONS_TOLERANCE * scale:
+                    self.linearization = None
+                    self.count(fallbacks=1)
+                    return exact
+
+        return results
+
+    @counted
     def integrate(self, ps, stepsize=None):
 
         if kinematics.Neglect4pInteraction(self, ps):
+            self.count(neglected=1)
             return kinematics.return_function(self, ps)
 
         params = self.particle.params
@@ -121,26 +261,10 @@ class FourParticleIntegral(BoltzmannIntegral):
         if stepsize is None:
             stepsize = params.h
 
-        if not environment.get('LOGARITHMIC_TIMESTEP'):
+        if not params.config.LOGARITHMIC_TIMESTEP:
             stepsize /= params.aT
 
-        if not self.creaction:
-            self.creaction = [
-                reaction_t(
-                    specie=particle_t(
-                        m=particle.specie.conformal_mass / params.aT,
-                        grid=grid_t(
-                            grid=particle.specie.grid.TEMPLATE / params.aT,
-                            distribution=particle.specie._distribution
-                        ),
-                        eta=int(particle.specie.eta),
-                        in_equilibrium=int(particle.specie.in_equilibrium),
-                        T=particle.specie.aT / params.aT
-                    ),
-                    side=particle.side
-                )
-                for particle in self.reaction
-            ]
+        self.reaction_handles(params.aT)
 
         ps = ps / params.aT
         # All matrix elements share the same weak scale multiplier
@@ -154,7 +278,7 @@ class FourParticleIntegral(BoltzmannIntegral):
 
         constant *= kinematics.CollisionMultiplier4p(self)
 
-        if not environment.get('LOGARITHMIC_TIMESTEP'):
+        if not params.config.LOGARITHMIC_TIMESTEP:
             constant /= params.x
 
         stepsize *= constant
@@ -170,8 +294,13 @@ class FourParticleIntegral(BoltzmannIntegral):
 
         if self.kind in [CollisionIntegralKind.Full, CollisionIntegralKind.Full_vacuum_decay] and not hasattr(self.particle, 'fast_decay'):
             # C = integration(ps, *bounds, self.creaction, self.cMs, stepsize, CollisionIntegralKind.Full)
-            A = integration(ps, *bounds, self.creaction, self.cMs, stepsize, CollisionIntegralKind.F_1)
-            B = integration(ps, *bounds, self.creaction, self.cMs, stepsize, CollisionIntegralKind.F_f)
+            kinds = (CollisionIntegralKind.F_1, CollisionIntegralKind.F_f)
+            if params.config.LINEARIZED_COLLISIONS:
+                A, B = self.linearized_integration(ps, bounds, stepsize, kinds)
+            elif params.config.FUSED_COLLISION_INTEGRALS:
+                A, B = self.integration_kinds(ps, bounds, stepsize, kinds)
+            else:
+                A, B = (self.integration(ps, bounds, stepsize, kind) for kind in kinds)
             C = A + self.particle.distribution(ps * params.aT) * B
             if interpolate:
                 C = list(interp1d(ps, C, kind='linear')(slice_1 / params.aT))
@@ -179,8 +308,14 @@ class FourParticleIntegral(BoltzmannIntegral):
                 B = list(interp1d(ps, B, kind='linear')(slice_1 / params.aT))
             return numpy.array(list(C) + slice_2) * constant, numpy.array(list(B) + slice_2) * constant
 
-        fullstack = integration(ps, *bounds, self.creaction, self.cMs, stepsize, self.kind)
-        fullstack = numpy.array(fullstack)
+        # The parent distribution function is not tabulated if it is in equilibrium
+        if params.config.VACUUM_DECAY_KERNELS and (
+                self.kind == CollisionIntegralKind.F_f_vacuum_decay
+                or self.kind == CollisionIntegralKind.F_1_vacuum_decay
+                and not self.reaction[3].specie.in_equilibrium):
+            fullstack = self.vacuum_decay_integration(ps, bounds)
+        else:
+            fullstack = numpy.array(self.integration(ps, bounds, stepsize, self.kind))
 
         if interpolate:
             fullstack = interp1d(ps, fullstack, kind='linear')(slice_1 / params.aT)
@@ -188,7 +323,7 @@ class FourParticleIntegral(BoltzmannIntegral):
         fullstack = numpy.append(fullstack, slice_2)
 
         scaled_output = kinematics.scaling(self, fullstack, constant)
-        if not scaled_output:
+        if scaled_output is False:
             return kinematics.return_function(self, fullstack)
         else:
             fullstack = scaled_output
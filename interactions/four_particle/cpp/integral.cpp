@@ -6,8 +6,8 @@ dbl energy(dbl y, dbl mass=0) {
 }
 
 
-std::pair<int, int> binary_find(const std::vector<dbl> &grid, dbl x) {
-    int head(0), tail(grid.size() - 1);
+std::pair<int, int> binary_find(const dbl *grid, size_t size, dbl x) {
+    int head(0), tail(size - 1);
     int middle;
 
     if (grid[tail] < x) {
@@ -38,10 +38,46 @@ std::pair<int, int> binary_find(const std::vector<dbl> &grid, dbl x) {
 }
 
 
-dbl distribution_interpolation(const std::vector<dbl> &grid,
-                               const std::vector<dbl> &distribution,
+std::pair<int, int> grid_find(const dbl *grid, size_t size, int spacing, dbl base, dbl x) {
+    /*
+    Same as `binary_find`, but the nodes of the linear and logarithmic grids are located\
+    arithmetically from the fractional index of `x`
+    */
+    int tail(size - 1);
+    if (spacing == arbitrary_spacing || tail < 1 || grid[tail] < x || grid[0] > x) {
+        return binary_find(grid, size, x);
+    }
+
+    dbl position = (x - grid[0]) / (grid[tail] - grid[0]);
+    if (spacing == logarithmic_spacing) {
+        position = log1p(position * (pow(base, tail) - 1.)) / log(base);
+    } else {
+        position *= tail;
+    }
+
+    int head = std::max(0, std::min(static_cast<int>(position), tail - 1));
+    // Rounding errors can shift the arithmetic estimate by a node
+    while (head > 0 && grid[head] > x) {
+        --head;
+    }
+    while (head < tail - 1 && grid[head + 1] <= x) {
+        ++head;
+    }
+
+    if (grid[head + 1] == x) {
+        return std::make_pair(head + 1, head + 1);
+    }
+    if (grid[head] == x) {
+        return std::make_pair(head, head);
+    }
+    return std::make_pair(head, head + 1);
+}
+
+
+dbl distribution_interpolation(const dbl *grid, const dbl *distribution, size_t size,
                                dbl p, dbl m=0., int eta=1, dbl T=1.,
-                               bool in_equilibrium=false) {
+                               bool in_equilibrium=false,
+                               int spacing=arbitrary_spacing, dbl base=1.) {
 
     if (in_equilibrium) {
         return 1. / (
@@ -51,14 +87,14 @@ dbl distribution_interpolation(const std::vector<dbl> &grid,
     }
 
     int i_lo, i_hi;
-    std::tie(i_lo, i_hi) = binary_find(grid, p);
+    std::tie(i_lo, i_hi) = grid_find(grid, size, spacing, base, p);
     if(i_lo == -1) {
         throw std::runtime_error("Input momentum is too small for the given grid");
     }
 
     if(i_hi == -1) {
-        return distribution[grid.size()-1]
-            * exp((energy(grid[grid.size() -1], m) - energy(p, m)) / T);
+        return distribution[size - 1]
+            * exp((energy(grid[size - 1], m) - energy(p, m)) / T);
     }
 
     if(i_lo == i_hi) {
@@ -109,15 +145,55 @@ dbl distribution_interpolation(const std::vector<dbl> &grid,
 
 
 dbl distribution_interpolation(const particle_t &specie, dbl p) {
+    if (specie.resampled && !specie.in_equilibrium) {
+        dbl position = (p - specie.grid.grid[0]) / specie.resampled_step;
+        if (position >= 0 && position <= specie.resampled_size - 1) {
+            size_t i = std::min(static_cast<size_t>(position), specie.resampled_size - 2);
+            dbl w = position - i;
+            return 1. / (exp((1. - w) * specie.resampled[i] + w * specie.resampled[i + 1])
+                         + specie.eta);
+        }
+    }
+
     return distribution_interpolation(
-        specie.grid.grid, specie.grid.distribution,
+        specie.grid.grid, specie.grid.distribution, specie.grid.size,
         p,
         specie.m, specie.eta,
-        specie.T, specie.in_equilibrium
+        specie.T, specie.in_equilibrium,
+        specie.grid.spacing, specie.grid.base
     );
 }
 
 
+// Resampled exponent standing for $f = 0$
+const dbl RESAMPLED_ZERO = 700.;
+
+void resample(particle_t &specie, dbl *table, size_t size) {
+    /*
+    Tabulate the exponent $g = \ln(1 / f - \eta)$ of the exponential interpolation on `size`\
+    uniformly spaced momenta spanning the grid of the `specie`. Between them the distribution\
+    function is then found without a search and the logarithms: $f = 1 / (e^g + \eta)$
+    */
+    const auto &grid = specie.grid;
+    dbl origin = grid.grid[0],
+        last = grid.grid[grid.size - 1],
+        step = (last - origin) / (size - 1);
+
+    for (size_t j = 0; j < size; ++j) {
+        dbl p = j + 1 < size ? origin + j * step : last;
+        dbl f = distribution_interpolation(grid.grid, grid.distribution, grid.size,
+                                           p, specie.m, specie.eta, specie.T, false,
+                                           grid.spacing, grid.base);
+        dbl g = f > 0 ? 1. / f - specie.eta : 0.;
+        table[j] = g > 0 ? std::min(log(g), RESAMPLED_ZERO) : RESAMPLED_ZERO;
+    }
+
+    specie.resampled = table;
+    specie.resampled_size = size;
+    specie.resampled_step = step;
+}
+
+
 /* ## F(fα) functional */
 
 /* ### Naive form
@@ -246,17 +322,17 @@ dbl in_bounds(const std::array<dbl, 4> p, const std::array<dbl, 4> E, const std:
 }
 
 
-dbl integrand_full(
+dbl integrand_kinematics(
     dbl p0, dbl p1, dbl p2,
     const std::vector<reaction_t> &reaction, const std::vector<M_t> &Ms,
-    int kind
+    std::array<dbl, 4> &p, std::array<dbl, 4> &f
 ) {
     /*
-    Collision integral interior.
+    Kinematic part of the collision integral interior shared by all kinds of the integral.\
+    Momenta and distribution functions of the reactants are stored to `p` and `f` if the result\
+    is non-zero.
     */
 
-    dbl integrand = 0.;
-
     std::array<dbl, 4> m;
     std::array<int, 4> sides;
 
@@ -265,7 +341,7 @@ dbl integrand_full(
         m[i] = reaction[i].specie.m;
     }
 
-    std::array<dbl, 4> p, E;
+    std::array<dbl, 4> E;
     p[0] = p0;
     p[1] = p1;
     p[2] = p2;
@@ -278,11 +354,11 @@ dbl integrand_full(
 
     E[3] *= -sides[3];
 
-    if (E[3] < m[3]) { return integrand; }
+    if (E[3] < m[3]) { return 0.; }
 
     p[3] = sqrt(pow(E[3], 2) - pow(m[3], 2));
 
-    if (!in_bounds(p, E, m)) { return integrand; }
+    if (!in_bounds(p, E, m)) { return 0.; }
 
     dbl temp = 1.;
 
@@ -293,7 +369,7 @@ dbl integrand_full(
         }
     }
 
-    if (temp == 0.) { return integrand; }
+    if (temp == 0.) { return 0.; }
 
     dbl ds = 0.;
 
@@ -316,34 +392,81 @@ dbl integrand_full(
 
     temp *= ds;
 
-    if (temp == 0.) { return integrand; }
+    if (temp == 0.) { return 0.; }
 
-    std::array<dbl, 4> f;
     for (int k = 0; k < 4; ++k) {
         const particle_t &specie = reaction[k].specie;
         f[k] = distribution_interpolation(specie, p[k]);
     }
 
+    return temp;
+}
+
+
+dbl integrand_functional(
+    const std::vector<reaction_t> &reaction, const std::array<dbl, 4> &f,
+    int kind
+) {
     auto integral_kind = CollisionIntegralKind(kind);
 
     switch (integral_kind) {
         case CollisionIntegralKind::F_creation:
-            return temp * F_creation(reaction, f);
+            return F_creation(reaction, f);
         case CollisionIntegralKind::F_decay:
-            return temp * F_decay(reaction, f);
+            return F_decay(reaction, f);
         case CollisionIntegralKind::F_1_vacuum_decay:
-            return temp * F_1_vacuum_decay(reaction, f);
+            return F_1_vacuum_decay(reaction, f);
         case CollisionIntegralKind::F_f_vacuum_decay:
-            return temp * F_f_vacuum_decay(reaction, f);
+            return F_f_vacuum_decay(reaction, f);
         case CollisionIntegralKind::Full_vacuum_decay:
-            return temp * (F_1_vacuum_decay(reaction, f) + f[0] * F_f_vacuum_decay(reaction, f));
+            return F_1_vacuum_decay(reaction, f) + f[0] * F_f_vacuum_decay(reaction, f);
         case CollisionIntegralKind::F_1:
-            return temp * F_1(reaction, f);
+            return F_1(reaction, f);
         case CollisionIntegralKind::F_f:
-            return temp * F_f(reaction, f);
+            return F_f(reaction, f);
         case CollisionIntegralKind::Full:
         default:
-            return temp * (F_1(reaction, f) + f[0] * F_f(reaction, f));
+            return F_1(reaction, f) + f[0] * F_f(reaction, f);
+    }
+}
+
+
+dbl integrand_full(
+    dbl p0, dbl p1, dbl p2,
+    const std::vector<reaction_t> &reaction, const std::vector<M_t> &Ms,
+    int kind
+) {
+    /*
+    Collision integral interior.
+    */
+
+    std::array<dbl, 4> p, f;
+    dbl temp = integrand_kinematics(p0, p1, p2, reaction, Ms, p, f);
+
+    if (temp == 0.) { return 0.; }
+
+    return temp * integrand_functional(reaction, f, kind);
+}
+
+
+void integrand_kinds(
+    dbl p0, dbl p1, dbl p2,
+    const std::vector<reaction_t> &reaction, const std::vector<M_t> &Ms,
+    const std::vector<int> &kinds, kinds_t &values
+) {
+    /*
+    Collision integral interior of several `kinds` of the integral sharing the kinematic part.
+    */
+
+    values.fill(0.);
+
+    std::array<dbl, 4> p, f;
+    dbl temp = integrand_kinematics(p0, p1, p2, reaction, Ms, p, f);
+
+    if (temp == 0.) { return; }
+
+    for (size_t k = 0; k < kinds.size(); ++k) {
+        values[k] = temp * integrand_functional(reaction, f, kinds[k]);
     }
 }
 
@@ -373,6 +496,8 @@ struct integration_params {
     dbl abseps;
     size_t subdivisions;
     gsl_integration_workspace *w;
+    size_t *evaluations;
+    size_t *subintervals;
 };
 
 
@@ -382,6 +507,7 @@ dbl integrand_1st_integration(
     struct integration_params &params = *(struct integration_params *) p;
     dbl p0 = params.p0;
     dbl p1 = params.p1;
+    ++*params.evaluations;
     return integrand_full(p0, p1, p2, *params.reaction, *params.Ms, params.kind);
 }
 
@@ -539,16 +665,9 @@ dbl p2_max_scat(const std::vector<reaction_t> &reaction, dbl p0, dbl p1) {
 }
 
 
-dbl integrand_2nd_integration(
-    dbl p1, void *p
-) {
-    struct integration_params &old_params = *(struct integration_params *) p;
-    dbl min_2 = old_params.min_2;
-    dbl max_2 = old_params.max_2;
-    dbl max_3 = old_params.max_3;
-    dbl p0 = old_params.p0;
-    auto reaction = *old_params.reaction;
-
+bool p2_bounds(const std::vector<reaction_t> &reaction, dbl p0, dbl p1, dbl max_3,
+               dbl &min_2, dbl &max_2) {
+    /* Integration bounds of the inner integral over `p2`. `false` if the region is empty */
     auto reaction_type = get_reaction_type(reaction);
 
     if (reaction_type == Kinematics::DECAY) {
@@ -567,7 +686,7 @@ dbl integrand_2nd_integration(
         dbl min = reaction[3].specie.m - energy(p0, reaction[0].specie.m) - energy(p1, reaction[1].specie.m);
         dbl min2 = pow(min, 2) - pow(reaction[2].specie.m, 2);
         if (max <= 0 || max2 <= 0) {
-            return 0.;
+            return false;
         }
         else {
             max_2 = sqrt(max2);
@@ -580,6 +699,21 @@ dbl integrand_2nd_integration(
         }
     }
 
+    return true;
+}
+
+
+dbl integrand_2nd_integration(
+    dbl p1, void *p
+) {
+    struct integration_params &old_params = *(struct integration_params *) p;
+    dbl min_2 = old_params.min_2;
+    dbl max_2 = old_params.max_2;
+
+    if (!p2_bounds(*old_params.reaction, old_params.p0, p1, old_params.max_3, min_2, max_2)) {
+        return 0.;
+    }
+
     gsl_function F;
     struct integration_params params = old_params;
     params.p1 = p1;
@@ -596,62 +730,88 @@ dbl integrand_2nd_integration(
         printf("(p0=%e, p1=%e) 1st integration result: %e ± %e. %i intervals. %s\n", params.p0, p1, result, error, (int) params.w->size, gsl_strerror(status));
         throw std::runtime_error("Integrator failed to reach required accuracy");
     }
+    *params.subintervals += params.w->size;
 
     return result;
 }
 
 
+bool p1_bounds(const std::vector<reaction_t> &reaction, dbl p0, dbl max_3,
+               dbl &min_1, dbl &max_1) {
+    /* Integration bounds of the outer integral over `p1`. `false` if the region is empty */
+    auto reaction_type = get_reaction_type(reaction);
+
+    if (reaction_type == Kinematics::DECAY) {
+        max_1 = sqrt(
+            pow(energy(p0, reaction[0].specie.m) - reaction[2].specie.m - reaction[3].specie.m, 2)
+            - pow(reaction[1].specie.m, 2)
+        );
+    }
+    if (reaction_type == Kinematics::SCATTERING) {
+        dbl min = reaction[2].specie.m + reaction[3].specie.m - energy(p0, reaction[0].specie.m);
+        dbl min2 = pow(min, 2) - pow(reaction[1].specie.m, 2);
+        if (min <= 0 || min2 <= 0) {
+            min_1 = 0.;
+        }
+        else {
+            min_1 = sqrt(min2);
+        }
+        if (max_1 > 3. * min_1) {
+            max_1 = max_1;
+        }
+        else {
+            max_1 = 3. * min_1;
+        }
+    }
+    if (reaction_type == Kinematics::CREATION) {
+        if (reaction[3].specie.m == 0.) { return false; }
+        dbl max = energy(max_3, reaction[3].specie.m) - reaction[2].specie.m - energy(p0, reaction[0].specie.m);
+        dbl max2 = pow(max, 2) - pow(reaction[1].specie.m, 2);
+        if (max <= 0 || max2 <= 0) {
+            return false;
+        }
+        else {
+            max_1 = sqrt(max2);
+        }
+        min_1 = 0.;
+    }
+
+    return true;
+}
+
+
+dbl absolute_tolerance(const std::vector<reaction_t> &reaction, dbl p0, dbl stepsize, int kind,
+                       dbl releps) {
+    /* Absolute tolerance of the integral of the given `kind` in the momentum bin `p0` */
+    dbl abseps = releps / stepsize;
+    auto integral_kind = CollisionIntegralKind(kind);
+    if (integral_kind != CollisionIntegralKind::F_f
+        && integral_kind != CollisionIntegralKind::F_f_vacuum_decay)
+    {
+        dbl f = distribution_interpolation(reaction[0].specie, p0);
+        if (reaction[0].specie.m == 0.) {abseps *= f; }
+        // else {abseps *= 1e-15;}
+        // abseps *= 1e-20;
+    }
+    return abseps;
+}
+
+
 std::vector<dbl> integration(
     std::vector<dbl> ps, dbl min_1, dbl max_1, dbl min_2, dbl max_2, dbl max_3,
     const std::vector<reaction_t> &reaction,
     const std::vector<M_t> &Ms,
-    dbl stepsize, int kind=0
+    dbl stepsize, int kind=0, integration_stats_t *stats=nullptr
 ) {
 
     std::vector<dbl> integral(ps.size(), 0.);
 
-    // Determine the integration bounds
-    auto reaction_type = get_reaction_type(reaction);
-
     // Note firstprivate() clause: those variables will be copied for each thread
-    #pragma omp parallel for default(none) shared(std::cout,ps, Ms, reaction, integral, stepsize, kind, reaction_type) firstprivate(min_1, max_1, min_2, max_2, max_3)
+    #pragma omp parallel for default(none) shared(std::cout,ps, Ms, reaction, integral, stepsize, kind, stats) firstprivate(min_1, max_1, min_2, max_2, max_3)
     for (size_t i = 0; i < ps.size(); ++i) {
         dbl p0 = ps[i];
 
-        if (reaction_type == Kinematics::DECAY) {
-            max_1 = sqrt(
-                pow(energy(p0, reaction[0].specie.m) - reaction[2].specie.m - reaction[3].specie.m, 2)
-                - pow(reaction[1].specie.m, 2)
-            );
-        }
-        if (reaction_type == Kinematics::SCATTERING) {
-            dbl min = reaction[2].specie.m + reaction[3].specie.m - energy(p0, reaction[0].specie.m);
-            dbl min2 = pow(min, 2) - pow(reaction[1].specie.m, 2);
-            if (min <= 0 || min2 <= 0) {
-                min_1 = 0.;
-            }
-            else {
-                min_1 = sqrt(min2);
-            }
-            if (max_1 > 3. * min_1) {
-                max_1 = max_1;
-            }
-            else {
-                max_1 = 3. * min_1;
-            }
-        }
-        if (reaction_type == Kinematics::CREATION) {
-            if (reaction[3].specie.m == 0.) {continue; }
-            dbl max = energy(max_3, reaction[3].specie.m) - reaction[2].specie.m - energy(p0, reaction[0].specie.m);
-            dbl max2 = pow(max, 2) - pow(reaction[1].specie.m, 2);
-            if (max <= 0 || max2 <= 0) {
-                continue;
-            }
-            else {
-                max_1 = sqrt(max2);
-            }
-            min_1 = 0.;
-        }
+        if (!p1_bounds(reaction, p0, max_3, min_1, max_1)) { continue; }
 
         dbl result(0.), error(0.);
         size_t status;
@@ -659,26 +819,20 @@ std::vector<dbl> integration(
         F.function = &integrand_2nd_integration;
 
         dbl releps = 1e-2;
-        dbl abseps = releps / stepsize;
-        auto integral_kind = CollisionIntegralKind(kind);
-        if (integral_kind != CollisionIntegralKind::F_f
-            && integral_kind != CollisionIntegralKind::F_f_vacuum_decay)
-        {
-            dbl f = distribution_interpolation(reaction[0].specie, p0);
-            if (reaction[0].specie.m == 0.) {abseps *= f; }
-            // else {abseps *= 1e-15;}
-            // abseps *= 1e-20;
-        }
+        dbl abseps = absolute_tolerance(reaction, p0, stepsize, kind, releps);
 
         size_t subdivisions = 100000;
         gsl_integration_workspace *w1 = gsl_integration_workspace_alloc(subdivisions);
         gsl_integration_workspace *w2 = gsl_integration_workspace_alloc(subdivisions);
+        // Counters are private to the momentum bin and merged into `stats` once it is done
+        size_t evaluations(0), subintervals(0);
         struct integration_params params = {
             p0, 0., 0.,
             &reaction, &Ms,
             min_1, max_1, min_2, max_2, max_3,
             kind, releps, abseps,
-            subdivisions, w2
+            subdivisions, w2,
+            &evaluations, &subintervals
         };
         F.params = &params;
 
@@ -689,32 +843,485 @@ std::vector<dbl> integration(
             printf("2nd integration_1 result: %e ± %e. %i intervals. %s\n", result, error, (int) w1->size, gsl_strerror(status));
             throw std::runtime_error("Integrator failed to reach required accuracy");
         }
+        subintervals += w1->size;
         gsl_integration_workspace_free(w1);
         gsl_integration_workspace_free(w2);
         integral[i] += result;
+
+        if (stats) {
+            #pragma omp atomic
+            stats->bins += 1;
+            #pragma omp atomic
+            stats->evaluations += evaluations;
+            #pragma omp atomic
+            stats->subintervals += subintervals;
+        }
     }
 
     return integral;
 }
 
 
+// Abscissae and weights of the 15-point Kronrod rule and the embedded 7-point Gauss rule,
+// the same as used by `GSL_INTEG_GAUSS15`
+const dbl xgk[8] = {
+    0.991455371120812639206854697526329, 0.949107912342758524526189684047851,
+    0.864864423359769072789712788640926, 0.741531185599394439863864773280788,
+    0.586087235467691130294144845693013, 0.405845151377397166906606412076961,
+    0.207784955007898467600689403773245, 0.000000000000000000000000000000000
+};
+const dbl wgk[8] = {
+    0.022935322010529224963732008058970, 0.063092092629978553290700663189204,
+    0.104790010322250183839876322541518, 0.140653259715525918745189590510238,
+    0.169004726639267902826583426598550, 0.190350578064785409913256402421014,
+    0.204432940075298892414161999234649, 0.209482141084727828012999174891714
+};
+const dbl wg[4] = {
+    0.129484966168869693270611432679082, 0.279705391489276667901467771423780,
+    0.381830050505118944950369775488975, 0.417959183673469387755102040816327
+};
+
+
+dbl rescale_error(dbl error, dbl resabs, dbl resasc) {
+    /* QUADPACK estimate of the error of the Kronrod rule */
+    error = std::fabs(error);
+
+    if (resasc != 0. && error != 0.) {
+        dbl scale = pow(200. * error / resasc, 1.5);
+        error = scale < 1. ? resasc * scale : resasc;
+    }
+
+    if (resabs > DBL_MIN / (50. * DBL_EPSILON)) {
+        error = std::max(error, 50. * DBL_EPSILON * resabs);
+    }
+
+    return error;
+}
+
+
+template <typename Function>
+void qk15_kinds(const Function &function, size_t n, multi_interval_t &interval) {
+    /* Gauss-Kronrod rule applied to all `n` components of the `function` at once */
+    const dbl center = 0.5 * (interval.a + interval.b);
+    const dbl half_length = 0.5 * (interval.b - interval.a);
+    const dbl abs_half_length = std::fabs(half_length);
+
+    // Values in the center followed by the pairs of symmetric abscissae
+    std::array<kinds_t, 15> values;
+    function(center, values[0]);
+    for (int j = 0; j < 7; ++j) {
+        dbl dx = half_length * xgk[j];
+        function(center - dx, values[2 * j + 1]);
+        function(center + dx, values[2 * j + 2]);
+    }
+
+    for (size_t k = 0; k < n; ++k) {
+        dbl result_gauss = values[0][k] * wg[3];
+        dbl result_kronrod = values[0][k] * wgk[7];
+        dbl resabs = std::fabs(result_kronrod);
+
+        for (int j = 0; j < 7; ++j) {
+            dbl sum = values[2 * j + 1][k] + values[2 * j + 2][k];
+            result_kronrod += wgk[j] * sum;
+            resabs += wgk[j] * (std::fabs(values[2 * j + 1][k]) + std::fabs(values[2 * j + 2][k]));
+            if (j % 2 == 1) {
+                result_gauss += wg[j / 2] * sum;
+            }
+        }
+
+        dbl mean = 0.5 * result_kronrod;
+        dbl resasc = wgk[7] * std::fabs(values[0][k] - mean);
+        for (int j = 0; j < 7; ++j) {
+            resasc += wgk[j] * (std::fabs(values[2 * j + 1][k] - mean)
+                                + std::fabs(values[2 * j + 2][k] - mean));
+        }
+
+        interval.result[k] = result_kronrod * half_length;
+        interval.error[k] = rescale_error((result_kronrod - result_gauss) * half_length,
+                                          resabs * abs_half_length, resasc * abs_half_length);
+    }
+}
+
+
+template <typename Function>
+int qag_kinds(const Function &function, size_t n, dbl a, dbl b,
+              const kinds_t &abseps, dbl releps, size_t limit,
+              kinds_t &result, kinds_t &error, size_t &size) {
+    /*
+    Adaptive integration of the `n` components of the `function` over a common subdivision.\
+    The integral is done when every component reaches its own tolerance, otherwise the interval\
+    with the largest error relative to the tolerance of the component is bisected.
+    */
+    std::vector<multi_interval_t> intervals(1);
+    intervals[0].a = a;
+    intervals[0].b = b;
+    qk15_kinds(function, n, intervals[0]);
+    result = intervals[0].result;
+    error = intervals[0].error;
+
+    while (true) {
+        size = intervals.size();
+
+        kinds_t tolerance;
+        bool converged = true;
+        for (size_t k = 0; k < n; ++k) {
+            tolerance[k] = std::max(abseps[k], releps * std::fabs(result[k]));
+            converged = converged && error[k] <= tolerance[k];
+        }
+        if (converged) { return GSL_SUCCESS; }
+        if (size >= limit) { return GSL_EMAXITER; }
+
+        size_t worst = 0;
+        dbl worst_ratio = -1.;
+        for (size_t i = 0; i < size; ++i) {
+            for (size_t k = 0; k < n; ++k) {
+                dbl ratio = intervals[i].error[k] / std::max(tolerance[k], DBL_MIN);
+                if (ratio > worst_ratio) {
+                    worst_ratio = ratio;
+                    worst = i;
+                }
+            }
+        }
+
+        multi_interval_t parent = intervals[worst];
+        dbl middle = 0.5 * (parent.a + parent.b);
+        if (middle <= parent.a || middle >= parent.b) { return GSL_EROUND; }
+
+        multi_interval_t left, right;
+        left.a = parent.a;
+        left.b = middle;
+        right.a = middle;
+        right.b = parent.b;
+        qk15_kinds(function, n, left);
+        qk15_kinds(function, n, right);
+
+        for (size_t k = 0; k < n; ++k) {
+            result[k] += left.result[k] + right.result[k] - parent.result[k];
+            error[k] += left.error[k] + right.error[k] - parent.error[k];
+        }
+
+        intervals[worst] = left;
+        intervals.push_back(right);
+    }
+}
+
+
+std::vector<std::vector<dbl>> integration_kinds(
+    std::vector<dbl> ps, dbl min_1, dbl max_1, dbl min_2, dbl max_2, dbl max_3,
+    const std::vector<reaction_t> &reaction,
+    const std::vector<M_t> &Ms,
+    dbl stepsize, const std::vector<int> &kinds, integration_stats_t *stats=nullptr
+) {
+    /*
+    Collision integrals of several `kinds` computed in a single pass: the kinematic part of the\
+    integrand is evaluated once per phase space point and all components share the adaptive\
+    subdivision of both integrals. Returns the integrals in the order of `kinds`.
+    */
+
+    size_t n = kinds.size();
+    if (n == 0 || n > MAX_KINDS) {
+        throw std::invalid_argument("Unsupported number of collision integral kinds");
+    }
+
+    std::vector<std::vector<dbl>> integrals(n, std::vector<dbl>(ps.size(), 0.));
+
+    // Note firstprivate() clause: those variables will be copied for each thread
+    #pragma omp parallel for default(none) shared(ps, Ms, reaction, integrals, stepsize, kinds, n, stats) firstprivate(min_1, max_1, min_2, max_2, max_3)
+    for (size_t i = 0; i < ps.size(); ++i) {
+        dbl p0 = ps[i];
+
+        if (!p1_bounds(reaction, p0, max_3, min_1, max_1)) { continue; }
+
+        dbl releps = 1e-2;
+        kinds_t abseps;
+        for (size_t k = 0; k < n; ++k) {
+            abseps[k] = absolute_tolerance(reaction, p0, stepsize, kinds[k], releps);
+        }
+
+        size_t subdivisions = 100000;
+        // Counters are private to the momentum bin and merged into `stats` once it is done
+        size_t evaluations(0), subintervals(0);
+
+        auto integrand_1st = [&](dbl p1, kinds_t &values) {
+            values.fill(0.);
+            dbl p2_min = min_2, p2_max = max_2;
+            if (!p2_bounds(reaction, p0, p1, max_3, p2_min, p2_max)) { return; }
+
+            auto integrand = [&](dbl p2, kinds_t &point) {
+                ++evaluations;
+                integrand_kinds(p0, p1, p2, reaction, Ms, kinds, point);
+            };
+
+            kinds_t error;
+            size_t size;
+            int status = qag_kinds(integrand, n, p2_min, p2_max, abseps, releps, subdivisions,
+                                   values, error, size);
+            if (status) {
+                printf("(p0=%e, p1=%e) 1st integration: %i intervals. %s\n", p0, p1, (int) size, gsl_strerror(status));
+                throw std::runtime_error("Integrator failed to reach required accuracy");
+            }
+            subintervals += size;
+        };
+
+        kinds_t result, error;
+        size_t size;
+        int status = qag_kinds(integrand_1st, n, min_1, max_1, abseps, releps, subdivisions,
+                               result, error, size);
+        if (status) {
+            printf("2nd integration: %i intervals. %s\n", (int) size, gsl_strerror(status));
+            throw std::runtime_error("Integrator failed to reach required accuracy");
+        }
+        subintervals += size;
+
+        for (size_t k = 0; k < n; ++k) {
+            integrals[k][i] += result[k];
+        }
+
+        if (stats) {
+            #pragma omp atomic
+            stats->bins += 1;
+            #pragma omp atomic
+            stats->evaluations += evaluations;
+            #pragma omp atomic
+            stats->subintervals += subintervals;
+        }
+    }
+
+    return integrals;
+}
+
+
+void interpolation_weights(const particle_t &specie, dbl p,
+                           size_t &i_lo, dbl &w_lo, size_t &i_hi, dbl &w_hi) {
+    /*
+    Linear interpolation of the distribution function of the `specie` at `p`:\
+    $f(p) = w_{lo} f_{i_{lo}} + w_{hi} f_{i_{hi}}$. The exponential tail above the grid is\
+    proportional to the last grid point.
+    */
+    const grid_t &grid = specie.grid;
+    int lo, hi;
+    std::tie(lo, hi) = grid_find(grid.grid, grid.size, grid.spacing, grid.base, p);
+    if (lo == -1) {
+        throw std::runtime_error("Input momentum is too small for the given grid");
+    }
+
+    if (hi == -1) {
+        i_lo = i_hi = grid.size - 1;
+        w_lo = exp((energy(grid.grid[i_lo], specie.m) - energy(p, specie.m)) / specie.T);
+        w_hi = 0.;
+        return;
+    }
+
+    i_lo = lo;
+    i_hi = hi;
+    if (lo == hi) {
+        w_lo = 1.;
+        w_hi = 0.;
+        return;
+    }
+
+    w_hi = (p - grid.grid[lo]) / (grid.grid[hi] - grid.grid[lo]);
+    w_lo = 1. - w_hi;
+}
+
+
+std::pair<std::vector<dbl>, std::vector<std::vector<dbl>>> vacuum_decay_kernels(
+    std::vector<dbl> ps, dbl min_1, dbl max_1, dbl min_2, dbl max_2, dbl max_3,
+    const std::vector<reaction_t> &reaction,
+    const std::vector<M_t> &Ms,
+    const std::vector<dbl> &nodes, const std::vector<dbl> &weights,
+    integration_stats_t *stats=nullptr
+) {
+    /*
+    Tabulated vacuum decay integrals. The `F_f_vacuum_decay` functional is constant, so its\
+    integral is a vector over `ps`. The `F_1_vacuum_decay` one is the distribution function of\
+    the parent `reaction[3]`, interpolated linearly between its grid points: its integral is\
+    the matrix over `ps` and the parent grid applied to the parent distribution function.
+
+    Both integrals use the fixed order Gauss-Legendre quadrature given by `nodes` and `weights`\
+    on $[-1, 1]$.
+    */
+
+    const particle_t &parent = reaction[3].specie;
+    size_t size = parent.grid.size;
+
+    std::vector<dbl> vector(ps.size(), 0.);
+    std::vector<std::vector<dbl>> matrix(ps.size(), std::vector<dbl>(size, 0.));
+
+    // Note firstprivate() clause: those variables will be copied for each thread
+    #pragma omp parallel for default(none) shared(ps, Ms, reaction, parent, size, nodes, weights, vector, matrix, stats) firstprivate(min_1, max_1, min_2, max_2, max_3)
+    for (size_t i = 0; i < ps.size(); ++i) {
+        dbl p0 = ps[i];
+
+        if (!p1_bounds(reaction, p0, max_3, min_1, max_1)) { continue; }
+
+        size_t evaluations(0);
+        dbl center_1 = 0.5 * (max_1 + min_1), half_1 = 0.5 * (max_1 - min_1);
+
+        for (size_t j = 0; j < nodes.size(); ++j) {
+            dbl p1 = center_1 + half_1 * nodes[j];
+            dbl p2_min = min_2, p2_max = max_2;
+            if (!p2_bounds(reaction, p0, p1, max_3, p2_min, p2_max)) { continue; }
+
+            dbl center_2 = 0.5 * (p2_max + p2_min), half_2 = 0.5 * (p2_max - p2_min);
+
+            for (size_t k = 0; k < nodes.size(); ++k) {
+                dbl p2 = center_2 + half_2 * nodes[k];
+
+                ++evaluations;
+                std::array<dbl, 4> p, f;
+                dbl temp = integrand_kinematics(p0, p1, p2, reaction, Ms, p, f);
+                if (temp == 0.) { continue; }
+
+                dbl weight = temp * weights[j] * half_1 * weights[k] * half_2;
+                vector[i] += weight * F_f_vacuum_decay(reaction, f);
+
+                size_t i_lo, i_hi;
+                dbl w_lo, w_hi;
+                interpolation_weights(parent, p[3], i_lo, w_lo, i_hi, w_hi);
+                matrix[i][i_lo] += weight * w_lo;
+                matrix[i][i_hi] += weight * w_hi;
+            }
+        }
+
+        if (stats) {
+            #pragma omp atomic
+            stats->bins += 1;
+            #pragma omp atomic
+            stats->evaluations += evaluations;
+        }
+    }
+
+    return std::make_pair(vector, matrix);
+}
+
+
+std::vector<std::vector<std::vector<dbl>>> collision_jacobians(
+    std::vector<dbl> ps, dbl min_1, dbl max_1, dbl min_2, dbl max_2, dbl max_3,
+    const std::vector<reaction_t> &reaction,
+    const std::vector<M_t> &Ms,
+    const std::vector<int> &kinds, const std::vector<int> &groups,
+    const std::vector<dbl> &nodes, const std::vector<dbl> &weights,
+    integration_stats_t *stats=nullptr
+) {
+    /*
+    Derivatives of the collision integrals of the given `kinds` over the distribution functions\
+    on the grids of the reactants. The same particle may take several places in the reaction, so\
+    the places are merged by `groups`: the index of the distribution function of each reactant\
+    or `-1` if it does not depend on the grid (equilibrium particles).
+
+    Returns `[kind][group]` matrices of the shape `(len(ps), grid size)` flattened by rows.\
+    Distribution functions are interpolated linearly between the grid points and the functionals\
+    are linear in each of them, so the derivatives are exact for the fixed order Gauss-Legendre\
+    quadrature given by `nodes` and `weights` on $[-1, 1]$.
+    */
+
+    size_t n = kinds.size();
+    size_t n_groups = 0;
+    std::vector<size_t> sizes;
+    for (int k = 0; k < 4; ++k) {
+        if (groups[k] >= (int) n_groups) {
+            n_groups = groups[k] + 1;
+            sizes.resize(n_groups);
+            sizes[groups[k]] = reaction[k].specie.grid.size;
+        }
+    }
+
+    std::vector<std::vector<std::vector<dbl>>> jacobians(n, std::vector<std::vector<dbl>>(n_groups));
+    for (size_t kind = 0; kind < n; ++kind) {
+        for (size_t g = 0; g < n_groups; ++g) {
+            jacobians[kind][g].assign(ps.size() * sizes[g], 0.);
+        }
+    }
+
+    // Note firstprivate() clause: those variables will be copied for each thread
+    #pragma omp parallel for default(none) shared(ps, Ms, reaction, kinds, groups, nodes, weights, jacobians, sizes, n, stats) firstprivate(min_1, max_1, min_2, max_2, max_3)
+    for (size_t i = 0; i < ps.size(); ++i) {
+        dbl p0 = ps[i];
+
+        if (!p1_bounds(reaction, p0, max_3, min_1, max_1)) { continue; }
+
+        size_t evaluations(0);
+        dbl center_1 = 0.5 * (max_1 + min_1), half_1 = 0.5 * (max_1 - min_1);
+
+        for (size_t j = 0; j < nodes.size(); ++j) {
+            dbl p1 = center_1 + half_1 * nodes[j];
+            dbl p2_min = min_2, p2_max = max_2;
+            if (!p2_bounds(reaction, p0, p1, max_3, p2_min, p2_max)) { continue; }
+
+            dbl center_2 = 0.5 * (p2_max + p2_min), half_2 = 0.5 * (p2_max - p2_min);
+
+            for (size_t l = 0; l < nodes.size(); ++l) {
+                dbl p2 = center_2 + half_2 * nodes[l];
+
+                ++evaluations;
+                std::array<dbl, 4> p, f;
+                dbl temp = integrand_kinematics(p0, p1, p2, reaction, Ms, p, f);
+                if (temp == 0.) { continue; }
+
+                dbl weight = temp * weights[j] * half_1 * weights[l] * half_2;
+
+                for (int k = 0; k < 4; ++k) {
+                    if (groups[k] < 0) { continue; }
+
+                    size_t i_lo, i_hi;
+                    dbl w_lo, w_hi;
+                    interpolation_weights(reaction[k].specie, p[k], i_lo, w_lo, i_hi, w_hi);
+
+                    // The functionals are linear in each distribution function
+                    std::array<dbl, 4> f_1 = f, f_0 = f;
+                    f_1[k] = 1.;
+                    f_0[k] = 0.;
+
+                    size_t row = i * sizes[groups[k]];
+                    for (size_t kind = 0; kind < n; ++kind) {
+                        dbl derivative = weight * (integrand_functional(reaction, f_1, kinds[kind])
+                                                   - integrand_functional(reaction, f_0, kinds[kind]));
+                        std::vector<dbl> &jacobian = jacobians[kind][groups[k]];
+                        jacobian[row + i_lo] += derivative * w_lo;
+                        jacobian[row + i_hi] += derivative * w_hi;
+                    }
+                }
+            }
+        }
+
+        if (stats) {
+            #pragma omp atomic
+            stats->bins += 1;
+            #pragma omp atomic
+            stats->evaluations += evaluations;
+        }
+    }
+
+    return jacobians;
+}
+
+
 PYBIND11_MODULE(integral, m) {
     m.def("distribution_interpolation", [](
         const std::vector<dbl> &grid,
         const std::vector<dbl> &distribution,
         const py::array_t<double> &ps, dbl m=0., int eta=1, dbl T=1.,
-        bool in_equilibrium=false) {
-            auto v = [grid, distribution, m, eta, T, in_equilibrium](double p) {
-                return distribution_interpolation(grid, distribution, p, m, eta, T, in_equilibrium);
+        bool in_equilibrium=false, int spacing=arbitrary_spacing, dbl base=1.) {
+            auto v = [&grid, &distribution, m, eta, T, in_equilibrium, spacing, base](double p) {
+                return distribution_interpolation(grid.data(), distribution.data(), grid.size(),
+                                                  p, m, eta, T, in_equilibrium, spacing, base);
             };
             return py::vectorize(v)(ps);
         },
         "Exponential interpolation of distribution function",
         "grid"_a, "distribution"_a,
-        "p"_a, "m"_a=0, "eta"_a=1, "T"_a=1., "in_equilibrium"_a=false
+        "p"_a, "m"_a=0, "eta"_a=1, "T"_a=1., "in_equilibrium"_a=false,
+        "spacing"_a=0, "base"_a=1.
     );
-    m.def("binary_find", &binary_find,
-          "grid"_a, "x"_a);
+    m.def("binary_find", [](const std::vector<dbl> &grid, dbl x) {
+            return binary_find(grid.data(), grid.size(), x);
+        },
+        "grid"_a, "x"_a);
+    m.def("grid_find", [](const std::vector<dbl> &grid, int spacing, dbl base, dbl x) {
+            return grid_find(grid.data(), grid.size(), spacing, base, x);
+        },
+        "grid"_a, "spacing"_a, "base"_a, "x"_a);
 
     m.def("D1", &D1);
     m.def("D2", &D2);
@@ -728,9 +1335,30 @@ PYBIND11_MODULE(integral, m) {
           "p"_a, "E"_a, "m"_a,
           "K1"_a, "K2"_a, "order"_a, "sides"_a);
 
+    // Arguments are converted before the GIL is released, so the integrals can run in parallel
+    // Python threads
     m.def("integration", &integration,
           "ps"_a, "min_1"_a, "max_1"_a, "min_2"_a, "max_2"_a, "max_3"_a,
-          "reaction"_a, "Ms"_a, "stepsize"_a, "kind"_a);
+          "reaction"_a, "Ms"_a, "stepsize"_a, "kind"_a, "stats"_a=nullptr,
+          py::call_guard<py::gil_scoped_release>());
+    m.def("integration_kinds", &integration_kinds,
+          "ps"_a, "min_1"_a, "max_1"_a, "min_2"_a, "max_2"_a, "max_3"_a,
+          "reaction"_a, "Ms"_a, "stepsize"_a, "kinds"_a, "stats"_a=nullptr,
+          py::call_guard<py::gil_scoped_release>());
+    m.def("vacuum_decay_kernels", &vacuum_decay_kernels,
+          "ps"_a, "min_1"_a, "max_1"_a, "min_2"_a, "max_2"_a, "max_3"_a,
+          "reaction"_a, "Ms"_a, "nodes"_a, "weights"_a, "stats"_a=nullptr,
+          py::call_guard<py::gil_scoped_release>());
+    m.def("collision_jacobians", &collision_jacobians,
+          "ps"_a, "min_1"_a, "max_1"_a, "min_2"_a, "max_2"_a, "max_3"_a,
+          "reaction"_a, "Ms"_a, "kinds"_a, "groups"_a, "nodes"_a, "weights"_a, "stats"_a=nullptr,
+          py::call_guard<py::gil_scoped_release>());
+
+    py::class_<integration_stats_t>(m, "integration_stats_t")
+        .def(py::init<>())
+        .def_readonly("bins", &integration_stats_t::bins)
+        .def_readonly("evaluations", &integration_stats_t::evaluations)
+        .def_readonly("subintervals", &integration_stats_t::subintervals);
 
     py::enum_<CollisionIntegralKind>(m, "CollisionIntegralKind")
         .value("Full", CollisionIntegralKind::Full)
@@ -747,15 +1375,56 @@ PYBIND11_MODULE(integral, m) {
         .def(py::init<std::array<int, 4>, dbl, dbl, dbl>(),
              "order"_a, "K1"_a=0., "K2"_a=0., "K"_a=0.);
 
+    // Grid and particle handles keep pointers to the NumPy buffers, so the arrays have to be
+    // contiguous float64 ones: a converted copy would not outlive the call
     py::class_<grid_t>(m, "grid_t")
-        .def(py::init<std::vector<dbl>, std::vector<dbl>>(),
-             "grid"_a, "distribution"_a);
+        .def(py::init([](py::object grid, py::object distribution, int spacing, dbl base) {
+                for (auto array : {grid, distribution}) {
+                    if (!py::isinstance<py::array_t<dbl, py::array::c_style>>(array)) {
+                        throw std::invalid_argument("Contiguous float64 arrays are expected");
+                    }
+                }
+                auto grid_array = py::reinterpret_borrow<py::array_t<dbl>>(grid);
+                auto distribution_array = py::reinterpret_borrow<py::array_t<dbl>>(distribution);
+                if (grid_array.size() != distribution_array.size()) {
+                    throw std::invalid_argument("Grid and distribution sizes differ");
+                }
+                return grid_t(grid_array.data(), distribution_array.data(), grid_array.size(),
+                              spacing, base);
+            }),
+            "grid"_a, "distribution"_a, "spacing"_a=0, "base"_a=1.,
+            py::keep_alive<1, 2>(), py::keep_alive<1, 3>());
 
     py::class_<particle_t>(m, "particle_t")
         .def(py::init<int, dbl, grid_t, int, dbl>(),
-             "eta"_a, "m"_a, "grid"_a, "in_equilibrium"_a, "T"_a);
+             "eta"_a, "m"_a, "grid"_a, "in_equilibrium"_a, "T"_a,
+             py::keep_alive<1, 4>())
+        .def_readwrite("eta", &particle_t::eta)
+        .def_readwrite("m", &particle_t::m)
+        .def_readwrite("grid", &particle_t::grid)
+        .def_readwrite("in_equilibrium", &particle_t::in_equilibrium)
+        .def_readwrite("T", &particle_t::T)
+        // The table buffer has to be kept alive by the caller while the integrals use it,
+        // `None` discards the resampled distribution function
+        .def("resample", [](particle_t &specie, py::object table) {
+                if (table.is_none()) {
+                    specie.resampled = nullptr;
+                    specie.resampled_size = 0;
+                    return;
+                }
+                if (!py::isinstance<py::array_t<dbl, py::array::c_style>>(table)) {
+                    throw std::invalid_argument("Contiguous float64 array is expected");
+                }
+                auto table_array = py::reinterpret_borrow<py::array_t<dbl>>(table);
+                if (table_array.size() < 2) {
+                    throw std::invalid_argument("At least two resampled momenta are expected");
+                }
+                resample(specie, table_array.mutable_data(), table_array.size());
+            },
+            "table"_a);
 
     py::class_<reaction_t>(m, "reaction_t")
-        .def(py::init<particle_t, int>(),
-             "specie"_a, "side"_a);
+        .def(py::init<const particle_t &, int>(),
+             "specie"_a, "side"_a,
+             py::keep_alive<1, 2>());
 }
@@ -3,6 +3,7 @@
 #include <array>
 #include <vector>
 #include <complex>
+#include <cfloat>
 
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
@@ -46,11 +47,25 @@ struct M_t {
     dbl K;
 };
 
+// Placement of the grid nodes. The interval containing a momentum is found arithmetically on the
+// linear and logarithmic grids (with the ratio `base` of the consecutive steps)
+enum grid_spacing {
+  arbitrary_spacing = 0,
+  linear_spacing = 1,
+  logarithmic_spacing = 2
+};
+
+// View of the momentum grid and the distribution function of a particle. The buffers are owned
+// by the NumPy arrays on the Python side and are neither copied nor reallocated for the integrals
 struct grid_t {
-    grid_t(std::vector<dbl> grid, std::vector<dbl> distribution)
-        : grid(grid), distribution(distribution) {}
-    std::vector<dbl> grid;
-    std::vector<dbl> distribution;
+    grid_t(const dbl *grid, const dbl *distribution, size_t size,
+           int spacing=arbitrary_spacing, dbl base=1.)
+        : grid(grid), distribution(distribution), size(size), spacing(spacing), base(base) {}
+    const dbl *grid;
+    const dbl *distribution;
+    size_t size;
+    int spacing;
+    dbl base;
 };
 
 struct particle_t {
@@ -61,24 +76,51 @@ struct particle_t {
     grid_t grid;
     int in_equilibrium;
     dbl T;
+    // Exponent $\ln(1 / f - \eta)$ of the distribution function on `resampled_size` uniformly
+    // spaced momenta spanning the grid, set by `resample`. The buffer is owned by the Python side
+    const dbl *resampled = nullptr;
+    size_t resampled_size = 0;
+    dbl resampled_step = 0.;
 };
 
 struct reaction_t {
-    reaction_t(particle_t specie, int side) : specie(specie), side(side) {}
-    particle_t specie;
+    reaction_t(const particle_t &specie, int side) : specie(specie), side(side) {}
+    // Persistent particle handle updated in place by the Python side between the steps
+    const particle_t &specie;
     int side;
 };
 
+// Values of several kinds of the collision integral computed at once, see `integration_kinds`
+const size_t MAX_KINDS = 8;
+typedef std::array<dbl, MAX_KINDS> kinds_t;
+
+struct multi_interval_t {
+    dbl a;
+    dbl b;
+    kinds_t result;
+    kinds_t error;
+};
+
+// Cost counters of the `integration` calls
+struct integration_stats_t {
+    size_t bins = 0;  // Momentum bins evaluated
+    size_t evaluations = 0;  // Integrand evaluations
+    size_t subintervals = 0;  // Subintervals used by the GSL integrators
+};
+
 dbl energy(dbl y, dbl mass);
 
 
-std::pair<int, int> binary_find(const std::vector<dbl> &grid, dbl x);
+std::pair<int, int> binary_find(const dbl *grid, size_t size, dbl x);
 
+std::pair<int, int> grid_find(const dbl *grid, size_t size, int spacing, dbl base, dbl x);
 
-dbl distribution_interpolation(const std::vector<dbl> &grid,
-                               const std::vector<dbl> &distribution,
+
+dbl distribution_interpolation(const dbl *grid, const dbl *distribution, size_t size,
                                dbl p, dbl m, int eta, dbl T,
-                               bool in_equilibrium);
+                               bool in_equilibrium, int spacing, dbl base);
+
+void resample(particle_t &specie, dbl *table, size_t size);
 
 
 dbl D1(dbl q1, dbl q2, dbl q3, dbl q4);
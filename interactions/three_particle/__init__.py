@@ -3,11 +3,10 @@ import numpy
 from scipy.integrate import simps
 from collections import Counter
 
-import environment
 from common import kinematics, UNITS
-from interactions.boltzmann import BoltzmannIntegral
+from interactions.boltzmann import BoltzmannIntegral, counted
 from interactions.three_particle.cpp.integral import (
-    integration_3, grid_t3, particle_t3, reaction_t3
+    integration_3, grid_t3, particle_t3, reaction_t3, integration_stats_t3
 )
 from interactions.four_particle.cpp.integral import CollisionIntegralKind
 
@@ -39,6 +38,8 @@ class ThreeParticleM(object):
 
 class ThreeParticleIntegral(BoltzmannIntegral):
 
+    cpp_types = (grid_t3, particle_t3, reaction_t3)
+
     def __init__(self, **kwargs):
         super(ThreeParticleIntegral, self).__init__(**kwargs)
 
@@ -53,10 +54,18 @@ class ThreeParticleIntegral(BoltzmannIntegral):
         if self.grids is None:
             self.grids = self.reaction[1].specie.grid
 
+    def integration(self, ps, bounds, stepsize, kind):
+        stats = integration_stats_t3()
+        result = integration_3(ps, *bounds, self.creaction, stepsize, kind, stats)
+        self.record(stats)
+        return result
+
+    @counted
     def integrate(self, ps, stepsize=None, bounds=None):
         params = self.particle.params
 
         if kinematics.Neglect3pInteraction(self, ps):
+            self.count(neglected=1)
             return kinematics.return_function(self, ps)
 
         bounds = tuple(b1 / params.aT for b1 in self.grids.BOUNDS) + (self.reaction[2].specie.grid.MAX_MOMENTUM / params.aT, )
@@ -64,25 +73,10 @@ class ThreeParticleIntegral(BoltzmannIntegral):
         if stepsize is None:
             stepsize = params.h
 
-        if not environment.get('LOGARITHMIC_TIMESTEP'):
+        if not params.config.LOGARITHMIC_TIMESTEP:
             stepsize /= params.aT
 
-        self.creaction = [
-            reaction_t3(
-                specie=particle_t3(
-                    m=particle.specie.conformal_mass / params.aT,
-                    grid=grid_t3(
-                        grid=particle.specie.grid.TEMPLATE / params.aT,
-                        distribution=particle.specie._distribution
-                    ),
-                    eta=int(particle.specie.eta),
-                    in_equilibrium=int(particle.specie.in_equilibrium),
-                    T=particle.specie.aT / params.aT
-                ),
-                side=particle.side
-            )
-            for particle in self.reaction
-        ]
+        self.reaction_handles(params.aT)
 
         ps = ps / params.aT
         self.cMs = sum(M.K for M in self.Ms)
@@ -103,7 +97,7 @@ class ThreeParticleIntegral(BoltzmannIntegral):
 
         constant *= kinematics.CollisionMultiplier3p(self)
 
-        if not environment.get('LOGARITHMIC_TIMESTEP'):
+        if not params.config.LOGARITHMIC_TIMESTEP:
             constant /= params.x
 
         stepsize *= constant_else
@@ -114,11 +108,11 @@ class ThreeParticleIntegral(BoltzmannIntegral):
             return kinematics.return_function(self, ps)
 
         if self.kind in [CollisionIntegralKind.Full, CollisionIntegralKind.Full_vacuum_decay] and not hasattr(self.particle, 'fast_decay'):
-            C = integration_3(ps, *bounds, self.creaction, stepsize, CollisionIntegralKind.Full)
-            B = integration_3(ps, *bounds, self.creaction, stepsize, CollisionIntegralKind.F_f)
+            C = self.integration(ps, bounds, stepsize, CollisionIntegralKind.Full)
+            B = self.integration(ps, bounds, stepsize, CollisionIntegralKind.F_f)
             return numpy.array(slice_1 + C + slice_3) * constant, numpy.array(slice_1 + B + slice_3) * constant
 
-        fullstack = integration_3(ps, *bounds, self.creaction, stepsize, self.kind)
+        fullstack = self.integration(ps, bounds, stepsize, self.kind)
         fullstack = numpy.array(slice_1 + fullstack + slice_3)
 
         scaled_output = kinematics.scaling(self, fullstack, constant)
@@ -6,8 +6,8 @@ dbl energy(dbl y, dbl mass=0) {
 }
 
 
-std::pair<int, int> binary_find(const std::vector<dbl> &grid, dbl x) {
-    int head(0), tail(grid.size() - 1);
+std::pair<int, int> binary_find(const dbl *grid, size_t size, dbl x) {
+    int head(0), tail(size - 1);
     int middle;
 
     if (grid[tail] < x) {
@@ -38,10 +38,46 @@ std::pair<int, int> binary_find(const std::vector<dbl> &grid, dbl x) {
 }
 
 
-dbl distribution_interpolation(const std::vector<dbl> &grid,
-                               const std::vector<dbl> &distribution,
+std::pair<int, int> grid_find(const dbl *grid, size_t size, int spacing, dbl base, dbl x) {
+    /*
+    Same as `binary_find`, but the nodes of the linear and logarithmic grids are located\
+    arithmetically from the fractional index of `x`
+    */
+    int tail(size - 1);
+    if (spacing == arbitrary_spacing || tail < 1 || grid[tail] < x || grid[0] > x) {
+        return binary_find(grid, size, x);
+    }
+
+    dbl position = (x - grid[0]) / (grid[tail] - grid[0]);
+    if (spacing == logarithmic_spacing) {
+        position = log1p(position * (pow(base, tail) - 1.)) / log(base);
+    } else {
+        position *= tail;
+    }
+
+    int head = std::max(0, std::min(static_cast<int>(position), tail - 1));
+    // Rounding errors can shift the arithmetic estimate by a node
+    while (head > 0 && grid[head] > x) {
+        --head;
+    }
+    while (head < tail - 1 && grid[head + 1] <= x) {
+        ++head;
+    }
+
+    if (grid[head + 1] == x) {
+        return std::make_pair(head + 1, head + 1);
+    }
+    if (grid[head] == x) {
+        return std::make_pair(head, head);
+    }
+    return std::make_pair(head, head + 1);
+}
+
+
+dbl distribution_interpolation(const dbl *grid, const dbl *distribution, size_t size,
                                dbl p, dbl m=0., int eta=1, dbl T=1.,
-                               bool in_equilibrium=false) {
+                               bool in_equilibrium=false,
+                               int spacing=arbitrary_spacing, dbl base=1.) {
 
     if (in_equilibrium) {
         return 1. / (
@@ -51,14 +87,14 @@ dbl distribution_interpolation(const std::vector<dbl> &grid,
     }
 
     int i_lo, i_hi;
-    std::tie(i_lo, i_hi) = binary_find(grid, p);
+    std::tie(i_lo, i_hi) = grid_find(grid, size, spacing, base, p);
     if(i_lo == -1) {
         throw std::runtime_error("Input momentum is too small for the given grid");
     }
 
     if(i_hi == -1) {
-        return distribution[grid.size()-1]
-            * exp((energy(grid[grid.size() -1], m) - energy(p, m)) / T);
+        return distribution[size - 1]
+            * exp((energy(grid[size - 1], m) - energy(p, m)) / T);
     }
 
     if(i_lo == i_hi) {
@@ -109,15 +145,55 @@ dbl distribution_interpolation(const std::vector<dbl> &grid,
 
 
 dbl distribution_interpolation(const particle_t3 &specie, dbl p) {
+    if (specie.resampled && !specie.in_equilibrium) {
+        dbl position = (p - specie.grid.grid[0]) / specie.resampled_step;
+        if (position >= 0 && position <= specie.resampled_size - 1) {
+            size_t i = std::min(static_cast<size_t>(position), specie.resampled_size - 2);
+            dbl w = position - i;
+            return 1. / (exp((1. - w) * specie.resampled[i] + w * specie.resampled[i + 1])
+                         + specie.eta);
+        }
+    }
+
     return distribution_interpolation(
-        specie.grid.grid, specie.grid.distribution,
+        specie.grid.grid, specie.grid.distribution, specie.grid.size,
         p,
         specie.m, specie.eta,
-        specie.T, specie.in_equilibrium
+        specie.T, specie.in_equilibrium,
+        specie.grid.spacing, specie.grid.base
     );
 }
 
 
+// Resampled exponent standing for $f = 0$
+const dbl RESAMPLED_ZERO = 700.;
+
+void resample(particle_t3 &specie, dbl *table, size_t size) {
+    /*
+    Tabulate the exponent $g = \ln(1 / f - \eta)$ of the exponential interpolation on `size`\
+    uniformly spaced momenta spanning the grid of the `specie`. Between them the distribution\
+    function is then found without a search and the logarithms: $f = 1 / (e^g + \eta)$
+    */
+    const auto &grid = specie.grid;
+    dbl origin = grid.grid[0],
+        last = grid.grid[grid.size - 1],
+        step = (last - origin) / (size - 1);
+
+    for (size_t j = 0; j < size; ++j) {
+        dbl p = j + 1 < size ? origin + j * step : last;
+        dbl f = distribution_interpolation(grid.grid, grid.distribution, grid.size,
+                                           p, specie.m, specie.eta, specie.T, false,
+                                           grid.spacing, grid.base);
+        dbl g = f > 0 ? 1. / f - specie.eta : 0.;
+        table[j] = g > 0 ? std::min(log(g), RESAMPLED_ZERO) : RESAMPLED_ZERO;
+    }
+
+    specie.resampled = table;
+    specie.resampled_size = size;
+    specie.resampled_step = step;
+}
+
+
 /* ## $\mathcal{F}(f_\alpha)$ functional */
 
 /* ### Naive form
@@ -393,6 +469,7 @@ struct integration_params {
     dbl releps;
     dbl abseps;
     size_t subdivisions;
+    size_t *evaluations;
 };
 
 
@@ -401,6 +478,7 @@ dbl integrand_integration(
 ) {
     struct integration_params &params = *(struct integration_params *) p;
     dbl p0 = params.p0;
+    ++*params.evaluations;
     return integrand_full(p0, p1, params.kind, *params.reaction);
 }
 
@@ -476,7 +554,7 @@ dbl p1_bounds_4(const std::vector<reaction_t3> &reaction, dbl p0, dbl max_2
 
 std::vector<dbl> integration_3(
     std::vector<dbl> ps, dbl min_1, dbl max_1, dbl max_2, const std::vector<reaction_t3> &reaction,
-    dbl stepsize, int kind=0
+    dbl stepsize, int kind=0, integration_stats_t3 *stats=nullptr
 ) {
 
     std::vector<dbl> integral(ps.size(), 0.);
@@ -484,13 +562,20 @@ std::vector<dbl> integration_3(
     auto reaction_type = get_reaction_type(reaction);
 
     // Note firstprivate() clause: those variables will be copied for each thread
-    #pragma omp parallel for default(none) shared(std::cout,ps, reaction, integral, stepsize, kind, reaction_type) firstprivate(min_1, max_1, max_2)
+    #pragma omp parallel for default(none) shared(std::cout,ps, reaction, integral, stepsize, kind, reaction_type, stats) firstprivate(min_1, max_1, max_2)
     for (size_t i = 0; i < ps.size(); ++i) {
         dbl p0 = ps[i];
 
         if (p0 == 0) {
             dbl p1 = p1_bounds_1(reaction);
             integral[i] = integrand_full(p0, p1, kind, reaction);
+
+            if (stats) {
+                #pragma omp atomic
+                stats->bins += 1;
+                #pragma omp atomic
+                stats->evaluations += 1;
+            }
         }
 
         else {
@@ -529,12 +614,13 @@ std::vector<dbl> integration_3(
 
             size_t subdivisions = 10000;
             gsl_integration_workspace *w = gsl_integration_workspace_alloc(subdivisions);
+            size_t evaluations(0);
             struct integration_params params = {
                 p0, 0.,
                 &reaction,
                 min_1, max_1,
                 kind, releps, abseps,
-                subdivisions
+                subdivisions, &evaluations
             };
             F.params = &params;
 
@@ -547,8 +633,18 @@ std::vector<dbl> integration_3(
                 throw std::runtime_error("Integrator failed to reach required accuracy");
             }
 
+            size_t subintervals = w->size;
             gsl_integration_workspace_free(w);
             integral[i] += result;
+
+            if (stats) {
+                #pragma omp atomic
+                stats->bins += 1;
+                #pragma omp atomic
+                stats->evaluations += evaluations;
+                #pragma omp atomic
+                stats->subintervals += subintervals;
+            }
         }
     }
     return integral;
@@ -560,23 +656,40 @@ PYBIND11_MODULE(integral, m) {
         const std::vector<dbl> &grid,
         const std::vector<dbl> &distribution,
         const py::array_t<double> &ps, dbl m=0., int eta=1, dbl T=1.,
-        bool in_equilibrium=false) {
-            auto v = [grid, distribution, m, eta, T, in_equilibrium](double p) {
-                return distribution_interpolation(grid, distribution, p, m, eta, T, in_equilibrium);
+        bool in_equilibrium=false, int spacing=arbitrary_spacing, dbl base=1.) {
+            auto v = [&grid, &distribution, m, eta, T, in_equilibrium, spacing, base](double p) {
+                return distribution_interpolation(grid.data(), distribution.data(), grid.size(),
+                                                  p, m, eta, T, in_equilibrium, spacing, base);
             };
             return py::vectorize(v)(ps);
         },
         "Exponential interpolation of distribution function",
         "grid"_a, "distribution"_a,
-        "p"_a, "m"_a=0, "eta"_a=1, "T"_a=1., "in_equilibrium"_a=false
+        "p"_a, "m"_a=0, "eta"_a=1, "T"_a=1., "in_equilibrium"_a=false,
+        "spacing"_a=0, "base"_a=1.
     );
 
-    m.def("binary_find", &binary_find,
-          "grid"_a, "x"_a);
+    m.def("binary_find", [](const std::vector<dbl> &grid, dbl x) {
+            return binary_find(grid.data(), grid.size(), x);
+        },
+        "grid"_a, "x"_a);
+    m.def("grid_find", [](const std::vector<dbl> &grid, int spacing, dbl base, dbl x) {
+            return grid_find(grid.data(), grid.size(), spacing, base, x);
+        },
+        "grid"_a, "spacing"_a, "base"_a, "x"_a);
 
+    // Arguments are converted before the GIL is released, so the integrals can run in parallel
+    // Python threads
     m.def("integration_3", &integration_3,
           "ps"_a, "min_1"_a, "max_1"_a, "max_2"_a,
-          "reaction"_a, "stepsize"_a, "kind"_a);
+          "reaction"_a, "stepsize"_a, "kind"_a, "stats"_a=nullptr,
+          py::call_guard<py::gil_scoped_release>());
+
+    py::class_<integration_stats_t3>(m, "integration_stats_t3")
+        .def(py::init<>())
+        .def_readonly("bins", &integration_stats_t3::bins)
+        .def_readonly("evaluations", &integration_stats_t3::evaluations)
+        .def_readonly("subintervals", &integration_stats_t3::subintervals);
 
     py::enum_<CollisionIntegralKind_3>(m, "CollisionIntegralKind_3")
         .value("Full", CollisionIntegralKind_3::Full)
@@ -589,15 +702,56 @@ PYBIND11_MODULE(integral, m) {
         .value("F_f_vacuum_decay", CollisionIntegralKind_3::F_f_vacuum_decay)
         .enum_::export_values();
 
+    // Grid and particle handles keep pointers to the NumPy buffers, so the arrays have to be
+    // contiguous float64 ones: a converted copy would not outlive the call
     py::class_<grid_t3>(m, "grid_t3")
-        .def(py::init<std::vector<dbl>, std::vector<dbl>>(),
-             "grid"_a, "distribution"_a);
+        .def(py::init([](py::object grid, py::object distribution, int spacing, dbl base) {
+                for (auto array : {grid, distribution}) {
+                    if (!py::isinstance<py::array_t<dbl, py::array::c_style>>(array)) {
+                        throw std::invalid_argument("Contiguous float64 arrays are expected");
+                    }
+                }
+                auto grid_array = py::reinterpret_borrow<py::array_t<dbl>>(grid);
+                auto distribution_array = py::reinterpret_borrow<py::array_t<dbl>>(distribution);
+                if (grid_array.size() != distribution_array.size()) {
+                    throw std::invalid_argument("Grid and distribution sizes differ");
+                }
+                return grid_t3(grid_array.data(), distribution_array.data(), grid_array.size(),
+                               spacing, base);
+            }),
+            "grid"_a, "distribution"_a, "spacing"_a=0, "base"_a=1.,
+            py::keep_alive<1, 2>(), py::keep_alive<1, 3>());
 
     py::class_<particle_t3>(m, "particle_t3")
         .def(py::init<int, dbl, grid_t3, int, dbl>(),
-             "eta"_a, "m"_a, "grid"_a, "in_equilibrium"_a, "T"_a);
+             "eta"_a, "m"_a, "grid"_a, "in_equilibrium"_a, "T"_a,
+             py::keep_alive<1, 4>())
+        .def_readwrite("eta", &particle_t3::eta)
+        .def_readwrite("m", &particle_t3::m)
+        .def_readwrite("grid", &particle_t3::grid)
+        .def_readwrite("in_equilibrium", &particle_t3::in_equilibrium)
+        .def_readwrite("T", &particle_t3::T)
+        // The table buffer has to be kept alive by the caller while the integrals use it,
+        // `None` discards the resampled distribution function
+        .def("resample", [](particle_t3 &specie, py::object table) {
+                if (table.is_none()) {
+                    specie.resampled = nullptr;
+                    specie.resampled_size = 0;
+                    return;
+                }
+                if (!py::isinstance<py::array_t<dbl, py::array::c_style>>(table)) {
+                    throw std::invalid_argument("Contiguous float64 array is expected");
+                }
+                auto table_array = py::reinterpret_borrow<py::array_t<dbl>>(table);
+                if (table_array.size() < 2) {
+                    throw std::invalid_argument("At least two resampled momenta are expected");
+                }
+                resample(specie, table_array.mutable_data(), table_array.size());
+            },
+            "table"_a);
 
     py::class_<reaction_t3>(m, "reaction_t3")
-        .def(py::init<particle_t3, int>(),
-             "specie"_a, "side"_a);
+        .def(py::init<const particle_t3 &, int>(),
+             "specie"_a, "side"_a,
+             py::keep_alive<1, 2>());
 }
\ No newline at end of file
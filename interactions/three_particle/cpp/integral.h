@@ -32,11 +32,25 @@ enum class CollisionIntegralKind_3 {
   F_decay = 7
 };
 
+// Placement of the grid nodes. The interval containing a momentum is found arithmetically on the
+// linear and logarithmic grids (with the ratio `base` of the consecutive steps)
+enum grid_spacing {
+  arbitrary_spacing = 0,
+  linear_spacing = 1,
+  logarithmic_spacing = 2
+};
+
+// View of the momentum grid and the distribution function of a particle. The buffers are owned
+// by the NumPy arrays on the Python side and are neither copied nor reallocated for the integrals
 struct grid_t3 {
-    grid_t3(std::vector<dbl> grid, std::vector<dbl> distribution)
-        : grid(grid), distribution(distribution) {}
-    std::vector<dbl> grid;
-    std::vector<dbl> distribution;
+    grid_t3(const dbl *grid, const dbl *distribution, size_t size,
+            int spacing=arbitrary_spacing, dbl base=1.)
+        : grid(grid), distribution(distribution), size(size), spacing(spacing), base(base) {}
+    const dbl *grid;
+    const dbl *distribution;
+    size_t size;
+    int spacing;
+    dbl base;
 };
 
 struct particle_t3 {
@@ -47,22 +61,38 @@ struct particle_t3 {
     grid_t3 grid;
     int in_equilibrium;
     dbl T;
+    // Exponent $\ln(1 / f - \eta)$ of the distribution function on `resampled_size` uniformly
+    // spaced momenta spanning the grid, set by `resample`. The buffer is owned by the Python side
+    const dbl *resampled = nullptr;
+    size_t resampled_size = 0;
+    dbl resampled_step = 0.;
 };
 
 struct reaction_t3 {
-    reaction_t3(particle_t3 specie, int side) : specie(specie), side(side) {}
-    particle_t3 specie;
+    reaction_t3(const particle_t3 &specie, int side) : specie(specie), side(side) {}
+    // Persistent particle handle updated in place by the Python side between the steps
+    const particle_t3 &specie;
     int side;
 };
 
+// Cost counters of the `integration_3` calls
+struct integration_stats_t3 {
+    size_t bins = 0;  // Momentum bins evaluated
+    size_t evaluations = 0;  // Integrand evaluations
+    size_t subintervals = 0;  // Subintervals used by the GSL integrator
+};
+
 dbl energy(dbl y, dbl mass);
 
-std::pair<int, int> binary_find(const std::vector<dbl> &grid, dbl x);
+std::pair<int, int> binary_find(const dbl *grid, size_t size, dbl x);
+
+std::pair<int, int> grid_find(const dbl *grid, size_t size, int spacing, dbl base, dbl x);
 
-dbl distribution_interpolation(const std::vector<dbl> &grid,
-                               const std::vector<dbl> &distribution,
+dbl distribution_interpolation(const dbl *grid, const dbl *distribution, size_t size,
                                dbl p, dbl m, int eta, dbl T,
-                               bool in_equilibrium);
+                               bool in_equilibrium, int spacing, dbl base);
+
+void resample(particle_t3 &specie, dbl *table, size_t size);
 
 dbl F_A(const std::vector<reaction_t3> &reaction, const std::array<dbl, 3> &f, int skip_index);
 dbl F_B(const std::vector<reaction_t3> &reaction, const std::array<dbl, 3> &f, int skip_index);
@@ -19,15 +19,12 @@ q = (SM.particles.hadrons.neutron['mass'] - SM.particles.hadrons.proton['mass'])
 # q = 1.2933 * UNITS.MeV
 m_e = SM.particles.leptons.electron['mass']
 
-a = None
-
 Particles = namedtuple("Particles", "electron neutrino")
-particles = None
 
 
 def init_kawano(electron=None, neutrino=None):
-    global particles
-    particles = Particles(electron=electron, neutrino=neutrino)
+    """ Particles the baryonic rates depend on """
+    return Particles(electron=electron, neutrino=neutrino)
 
 
 def run(data_folder, input="s4.dat", output="kawano_output.dat"):
@@ -57,8 +54,31 @@ def run(data_folder, input="s4.dat", output="kawano_output.dat"):
         return kawano_output.read()
 
 
-@numpy.vectorize
-def _rate1(y):
+def observables(data_folder, output="kawano_output.dat"):
+    """ Parse the last `Observables:` line of the KAWANO output into a dictionary.
+
+        Entries of the form `name=value` are keyed by name, bare numbers by their position. """
+    line = None
+    with open(os.path.join(data_folder, output), "r") as kawano_output:
+        for row in kawano_output:
+            if 'Observables:' in row:
+                line = row
+
+    if line is None:
+        return {}
+
+    values = {}
+    tokens = line.split('Observables:', 1)[1].replace(',', ' ').split()
+    for i, token in enumerate(tokens):
+        name, _, value = token.rpartition('=')
+        try:
+            values[name or str(i)] = float(value)
+        except ValueError:
+            continue
+    return values
+
+
+def _rate1(y, a, particles):
     """ n + ν_e ⟶  e + p """
     E_e = q * a + y
     if E_e < m_e * a:
@@ -68,8 +88,7 @@ def _rate1(y):
             * (1. - particles.electron.distribution(y_e)) * particles.neutrino.distribution(y))
 
 
-@numpy.vectorize
-def _rate2(y):
+def _rate2(y, a, particles):
     """ e + p ⟶  n + ν_e """
     E_e = q * a + y
     if E_e < m_e * a:
@@ -79,8 +98,7 @@ def _rate2(y):
             * particles.electron.distribution(y_e) * (1. - particles.neutrino.distribution(y)))
 
 
-@numpy.vectorize
-def _rate3(y):
+def _rate3(y, a, particles):
     """ n ⟶  e + ν_e' + p """
     E_e = q * a - y
     if E_e < m_e * a:
@@ -91,8 +109,7 @@ def _rate3(y):
             * (1. - particles.neutrino.distribution(y)))
 
 
-@numpy.vectorize
-def _rate4(y):
+def _rate4(y, a, particles):
     """ e + ν_e' + p ⟶  n """
     E_e = q * a - y
     if E_e < m_e * a:
@@ -102,8 +119,7 @@ def _rate4(y):
             * particles.electron.distribution(y_e) * particles.neutrino.distribution(y))
 
 
-@numpy.vectorize
-def _rate5(y):
+def _rate5(y, a, particles):
     """ n + e' ⟶  ν_e' + p """
     E_e = -q * a + y
     if E_e < m_e * a:
@@ -113,8 +129,7 @@ def _rate5(y):
             * particles.electron.distribution(y_e) * (1. - particles.neutrino.distribution(y)))
 
 
-@numpy.vectorize
-def _rate6(y):
+def _rate6(y, a, particles):
     """ ν_e' + p ⟶  n + e' """
     E_e = -q * a + y
     if E_e < m_e * a:
@@ -125,14 +140,13 @@ def _rate6(y):
             * (1. - particles.electron.distribution(y_e)) * particles.neutrino.distribution(y))
 
 
-def baryonic_rates(_a):
-    global a
-    a = _a
-
+def baryonic_rates(a, particles):
+    """ Weak rates of the neutron-proton conversion at the scale factor `a` computed from the\
+        distribution functions of the `particles` (see `init_kawano`) """
     grid = particles.neutrino.grid
 
     data = []
-    for integrand, bounds in [
+    for rate, bounds in [
             (_rate1, (grid.MIN_MOMENTUM, grid.MAX_MOMENTUM)),
             (_rate2, (grid.MIN_MOMENTUM, grid.MAX_MOMENTUM)),
             (_rate3, (grid.MIN_MOMENTUM, (q - m_e) * a)),
@@ -141,6 +155,7 @@ def baryonic_rates(_a):
             (_rate6, ((q + m_e) * a, grid.MAX_MOMENTUM))
     ]:
         if bounds[0] < bounds[1]:
+            integrand = numpy.vectorize(lambda y, rate=rate: rate(y, a, particles))
             data.append(CONST.rate_normalization / particles.neutrino.params.a**5
                         * integrate_1D(integrand, bounds=bounds)[0])
         else:
@@ -1,13 +1,15 @@
 """
 For intermediate regime equilibrium particles, density, energy density and pressure\
-are obtained through integration of distribution function
+are obtained through integration of distribution function. The integrals depend only on\
+$\gamma = M / T$ and are looked up in the `particles.interpolation.thermodynamics` tables\
+when `THERMODYNAMICS_TABLES` is set
 """
 
 import numpy
 
-import environment
 from common import integrators
 from common.integrators import gauss_laguerre
+from particles.interpolation import thermodynamics as tables
 
 
 name = 'intermediate'
@@ -20,6 +22,11 @@ def density(particle):
             g \int \frac{p^2 dp}{2 \pi^2} f\left( \frac{p}{T} \right)
         \end{equation}
     """
+    tabulated = tables.lookup(particle, 'density', particle.mass / particle.T)
+    if tabulated is not None:
+        return (particle.dof / 2. / numpy.pi**2 * particle.T**3
+                * numpy.exp(-particle.mass / particle.T) * tabulated)
+
     density, _ = integrators.integrate_1D(
         lambda p: (
             particle.equilibrium_distribution_function(particle.energy(p) / particle.T)
@@ -49,6 +56,11 @@ def energy_density(particle):
             \rho = \int dp I_\rho
         \end{equation}
     """
+    tabulated = tables.lookup(particle, 'energy_density', particle.mass / particle.T)
+    if tabulated is not None:
+        return (particle.dof / 2. / numpy.pi**2 * particle.T**4
+                * numpy.exp(-particle.mass / particle.T) * tabulated)
+
     energy_density, _ = integrators.integrate_1D(
         lambda p: energy_density_integrand(p, particle),
         (0, 20 * particle.T)
@@ -76,6 +88,11 @@ def pressure(particle):
             P = \int dp I_P
         \end{equation}
     """
+    tabulated = tables.lookup(particle, 'pressure', particle.mass / particle.T)
+    if tabulated is not None:
+        return (particle.dof / 2. / numpy.pi**2 * particle.T**4
+                * numpy.exp(-particle.mass / particle.T) * tabulated)
+
     pressure, _ = integrators.integrate_1D(
         lambda p: pressure_integrand(p, particle),
         (0, 20 * particle.T)
@@ -116,10 +133,15 @@ def denominator(particle):
 
 
 def Int(particle, y_power=2):
-    if environment.get('LAGUERRE_GAUSS_FOR_MASSIVE_EQUILIBRIUM_PARTICLES'):
+    if particle.params.config.LAGUERRE_GAUSS_FOR_MASSIVE_EQUILIBRIUM_PARTICLES:
         aT = particle.params.aT
         mat = particle.conformal_mass / aT
 
+        tabulated = tables.lookup(particle, 'I{}'.format(y_power), mat)
+        if tabulated is not None:
+            return (particle.dof / 2. / numpy.pi**2 * aT**(y_power + 1) * numpy.exp(-mat)
+                    * tabulated)
+
         laguerre = (
             particle.dof / 2. / numpy.pi**2 * aT**(y_power + 1) * numpy.exp(-mat)
             * gauss_laguerre.integrate_1D(lambda eps: (
@@ -4,11 +4,8 @@
 from __future__ import division
 import numpy
 numpy.seterr(divide='ignore', invalid='ignore', over='ignore')
-from scipy.integrate import simps
 
 import environment
-from common import linear_interpolation
-from common.integrators import lambda_integrate
 
 
 name = 'non-equilibrium'
@@ -16,88 +13,85 @@ aT = 0
 adec = 0
 if not environment.get('SIMPSONS_NONEQ_PARTICLES'):
 
+    def integrate(particle, integrand):
+        """ Quadrature of the `integrand(y, f)` evaluated on all nodes at once """
+        y, weights = particle.grid.gauss()
+        return numpy.dot(integrand(y, particle.distribution(y)), weights)
+
+
     def density(particle):
-        @lambda_integrate(particle.grid.BOUNDS)
-        def den():
-            return numpy.vectorize(lambda y: (
-                particle.distribution(y) * y**2
-                * particle.dof / 2. / numpy.pi**2 / particle.params.a**3
-            ), otypes=[numpy.float_])
-        return den()
+        return integrate(particle, lambda y, f: (
+            f * y**2 * particle.dof / 2. / numpy.pi**2 / particle.params.a**3
+        ))
 
 
     def energy_density(particle):
-        @lambda_integrate(particle.grid.BOUNDS)
-        def energy_den():
-            """ ### Energy density
-
-                \begin{equation}
-                    \rho = \frac{g}{2 \pi^2} \frac{m^4}{x^4} \int dy y^2 \sqrt{y^2 +\
-                    \frac{M_N^2 x^2}{m^2}} f(y)
-                \end{equation}
-            """
-            return numpy.vectorize(lambda y: (
-                particle.distribution(y)
-                * y**2 * particle.conformal_energy(y)
-                * particle.dof / 2. / numpy.pi**2 / particle.params.a**4
-            ), otypes=[numpy.float_])
-        return energy_den()
+        """ ### Energy density
+
+            \begin{equation}
+                \rho = \frac{g}{2 \pi^2} \frac{m^4}{x^4} \int dy y^2 \sqrt{y^2 +\
+                \frac{M_N^2 x^2}{m^2}} f(y)
+            \end{equation}
+        """
+        return integrate(particle, lambda y, f: (
+            f * y**2 * particle.conformal_energy(y)
+            * particle.dof / 2. / numpy.pi**2 / particle.params.a**4
+        ))
 
 
     def pressure(particle):
-        @lambda_integrate(particle.grid.BOUNDS)
-        def press():
-            """ ### Pressure
-
-                \begin{equation}
-                    p = \frac{g}{6 \pi^2} \frac{m^4}{x^4} \int \frac{dy \, y^4 f(y)}\
-                    { \sqrt{y^2 + \frac{M_N^2 x^2}{m^2}} }
-                \end{equation}
-            """
+        """ ### Pressure
 
-            return numpy.vectorize(lambda p: (
-                particle.distribution(p) * p**4 / particle.conformal_energy(p)
-                * particle.dof / 6. / numpy.pi**2 / particle.params.a**4
-            ), otypes=[numpy.float_])
-        return press()
+            \begin{equation}
+                p = \frac{g}{6 \pi^2} \frac{m^4}{x^4} \int \frac{dy \, y^4 f(y)}\
+                { \sqrt{y^2 + \frac{M_N^2 x^2}{m^2}} }
+            \end{equation}
+        """
+        return integrate(particle, lambda y, f: (
+            f * y**4 / particle.conformal_energy(y)
+            * particle.dof / 6. / numpy.pi**2 / particle.params.a**4
+        ))
+
+
+    def entropy_integrand(y, f, eta):
+        integrand = numpy.zeros(len(y))
+        positive = f > 0
+        integrand[positive] = -y[positive]**2 * (
+            f[positive] * numpy.log(f[positive])
+            + eta * (1 - eta * f[positive]) * numpy.log(1 - eta * f[positive])
+        )
+        return integrand
 
 
     def entropy(particle):
-        @lambda_integrate(particle.grid.BOUNDS)
-        def ent():
-            """ ## Entropy
-
-                \begin{equation}
-                    s = - \int_0^\inf p^2 dp \left{ f(p) \ln f(p) \mp (1 \pm f(p)) \ln (1 \pm f(p)) \right}
-                \end{equation}
-            """
-
-            def integrand(p):
-                f = particle.distribution(p)
-                eta = particle.eta
-
-                if f == 0:
-                    return 0.
-
-                return (- particle.dof / 2 / numpy.pi**2 / particle.params.a**3
-                        * p**2 * (f * numpy.log(f) + eta * (1 - eta * f) * numpy.log(1 - eta * f)))
-
-            return numpy.vectorize(integrand, otypes=[numpy.float_])
-        return ent()
+        """ ## Entropy
 
+            \begin{equation}
+                s = - \int_0^\inf p^2 dp \left{ f(p) \ln f(p) \mp (1 \pm f(p)) \ln (1 \pm f(p)) \right}
+            \end{equation}
+        """
+        return integrate(particle, lambda y, f: (
+            entropy_integrand(y, f, particle.eta)
+            * particle.dof / 2 / numpy.pi**2 / particle.params.a**3
+        ))
 
-    # @lambda_integrate()
-    # def inverse_gamma_factor(particle):
-    #     """ ## Average gamma factor of the distribution """
 
-    #     def integrand(p):
-    #         if particle.mass == 0:
-    #             return 0.
+    def fused_thermodynamics(particle):
+        """ Density, energy density, pressure and entropy from a single evaluation of the\
+            distribution function on the nodes """
+        a = particle.params.a
+        y, weights = particle.grid.gauss()
+        f = particle.distribution(y)
+        energy = particle.conformal_energy(y)
 
-    #         return (particle.dof / 2 / numpy.pi**2 * p**2 / particle.params.a**3
-    #                 * particle.distribution(p) * particle.conformal_mass / particle.conformal_energy(p))
+        integrals = numpy.dot(numpy.array([
+            f * y**2 / a**3,
+            f * y**2 * energy / a**4,
+            f * y**4 / energy / 3. / a**4,
+            entropy_integrand(y, f, particle.eta) / a**3
+        ]) * particle.dof / 2. / numpy.pi**2, weights)
 
-    #     return numpy.vectorize(integrand, otypes=[numpy.float_])
+        return dict(zip(('density', 'energy_density', 'pressure', 'entropy'), integrals))
 
 
     """ ## Master equation terms """
@@ -111,13 +105,13 @@ if not environment.get('SIMPSONS_NONEQ_PARTICLES'):
 
 
     def numerator(particle):
-        integral = linear_interpolation(particle.collision_integral / particle.params.x,
-                                        particle.grid.TEMPLATE)
-        return lambda_integrate(particle.grid.BOUNDS)(lambda particle: numpy.vectorize(lambda y: (
-            -1. * particle.dof / 2. / numpy.pi**2
-            * y**2 * particle.conformal_energy(y)
-            * integral(y)
-        ), otypes=[numpy.float_]))(particle)
+        y, weights = particle.grid.gauss()
+        integral = numpy.interp(y, particle.grid.TEMPLATE,
+                                particle.collision_integral / particle.params.x)
+        return numpy.dot(
+            -1. * particle.dof / 2. / numpy.pi**2 * y**2 * particle.conformal_energy(y) * integral,
+            weights
+        )
 
 
     def denominator(particle):
@@ -135,10 +129,10 @@ if not environment.get('SIMPSONS_NONEQ_PARTICLES'):
 else:
 
     def density(particle):
-        temp = particle.grid.TEMPLATE
-        return simps((
-            particle.distribution(temp) * temp**2
-            * particle.dof / 2. / numpy.pi**2 / particle.params.a**3), temp
+        grid = particle.grid
+        return numpy.dot(
+            particle.distribution(grid.TEMPLATE) * grid.POWERS[2]
+            * particle.dof / 2. / numpy.pi**2 / particle.params.a**3, grid.SIMPSON_WEIGHTS
         )
 
 
@@ -150,10 +144,11 @@ else:
                 \frac{M_N^2 x^2}{m^2}} f(y)
             \end{equation}
         """
-        temp = particle.grid.TEMPLATE
-        return simps((
-            particle.distribution(temp) * temp**2 * particle.conformal_energy(temp)
-            * particle.dof / 2. / numpy.pi**2 / particle.params.a**4), temp
+        grid = particle.grid
+        return numpy.dot(
+            particle.distribution(grid.TEMPLATE) * grid.POWERS[2]
+            * particle.conformal_energy(grid.TEMPLATE)
+            * particle.dof / 2. / numpy.pi**2 / particle.params.a**4, grid.SIMPSON_WEIGHTS
         )
 
 
@@ -165,15 +160,16 @@ else:
                 { \sqrt{y^2 + \frac{M_N^2 x^2}{m^2}} }
             \end{equation}
         """
-        temp = particle.grid.TEMPLATE
-        if particle.mass == 0.:        
-            return simps((
-                particle.distribution(temp) * temp**3
-                * particle.dof / 6. / numpy.pi**2 / particle.params.a**4), temp
+        grid = particle.grid
+        if particle.mass == 0.:
+            return numpy.dot(
+                particle.distribution(grid.TEMPLATE) * grid.POWERS[3]
+                * particle.dof / 6. / numpy.pi**2 / particle.params.a**4, grid.SIMPSON_WEIGHTS
             )
-        return simps((
-            particle.distribution(temp) * temp**4 / particle.conformal_energy(temp)
-            * particle.dof / 6. / numpy.pi**2 / particle.params.a**4), temp
+        return numpy.dot(
+            particle.distribution(grid.TEMPLATE) * grid.POWERS[4]
+            / particle.conformal_energy(grid.TEMPLATE)
+            * particle.dof / 6. / numpy.pi**2 / particle.params.a**4, grid.SIMPSON_WEIGHTS
         )
 
 
@@ -184,24 +180,52 @@ else:
                 s = - \int_0^\inf p^2 dp \left{ f(p) \ln f(p) \mp (1 \pm f(p)) \ln (1 \pm f(p)) \right}
             \end{equation}
         """
-        temp = particle.grid.TEMPLATE
+        grid = particle.grid
         eta = particle.eta
-        integrand = numpy.zeros(len(temp))
+        integrand = numpy.zeros(len(grid.TEMPLATE))
 
-        f = particle.distribution(temp)
+        f = particle.distribution(grid.TEMPLATE)
 
         integrand[f>0] = (- particle.dof / 2 / numpy.pi**2 / particle.params.a**3
-                        * temp[f>0]**2 * (f[f>0] * numpy.log(f[f>0]) + eta * (1 - eta * f[f>0]) * numpy.log(1 - eta * f[f>0])))
+                        * grid.POWERS[2][f>0] * (f[f>0] * numpy.log(f[f>0]) + eta * (1 - eta * f[f>0]) * numpy.log(1 - eta * f[f>0])))
+
+        return numpy.dot(integrand, grid.SIMPSON_WEIGHTS)
+
+
+    def fused_thermodynamics(particle):
+        """ Density, energy density, pressure and entropy in a single pass over the grid """
+        grid = particle.grid
+        temp, powers = grid.TEMPLATE, grid.POWERS
+        eta = particle.eta
+        a = particle.params.a
+
+        f = particle.distribution(temp)
+        energy = particle.conformal_energy(temp)
+        pressure = f * powers[3] if particle.mass == 0. else f * powers[4] / energy
+
+        positive = f > 0
+        entropy = numpy.zeros(len(temp))
+        entropy[positive] = -powers[2][positive] * (
+            f[positive] * numpy.log(f[positive])
+            + eta * (1 - eta * f[positive]) * numpy.log(1 - eta * f[positive])
+        )
+
+        integrals = numpy.dot(numpy.array([
+            f * powers[2] / a**3,
+            f * powers[2] * energy / a**4,
+            pressure / 3. / a**4,
+            entropy / a**3
+        ]) * particle.dof / 2. / numpy.pi**2, grid.SIMPSON_WEIGHTS)
 
-        return simps(integrand, temp)
+        return dict(zip(('density', 'energy_density', 'pressure', 'entropy'), integrals))
 
 
     def numerator(particle):
-        temp = particle.grid.TEMPLATE
-        return simps((
+        grid = particle.grid
+        return numpy.dot(
             -1. * particle.dof / 2. / numpy.pi**2
-            * temp**2 * particle.conformal_energy(temp)
-            * particle.collision_integral / particle.params.x), temp
+            * grid.POWERS[2] * particle.conformal_energy(grid.TEMPLATE)
+            * particle.collision_integral / particle.params.x, grid.SIMPSON_WEIGHTS
         )
 
 
@@ -7,8 +7,9 @@ regimes
 """
 from __future__ import division
 
-import numpy
 import os
+import inspect
+import numpy
 import environment
 from common import GRID, UNITS, kinematics, statistics as STATISTICS
 from common.integrators import (
@@ -105,13 +106,56 @@ class AbstractParticle:
 
     def populate_methods(self):
         regime = self.regime
-        self.density = regime.density(self)
-        self.energy_density = regime.energy_density(self)
-        self.pressure = regime.pressure(self)
-        self.entropy = regime.entropy(self)
         self.numerator = lambda: regime.numerator(self)
         self.denominator = lambda: regime.denominator(self)
 
+    """ ### Thermodynamical quantities
+        Density, energy density, pressure and entropy are computed on the first access and cached\
+        until the regime, the distribution function, `aT` or the scale factor of the particle\
+        change. Regimes that define `fused_thermodynamics(particle)` compute all of them in one\
+        pass. """
+
+    THERMODYNAMICS = ('density', 'energy_density', 'pressure', 'entropy')
+    _thermodynamics = None
+
+    def thermodynamics_key(self):
+        regime = self.regime
+        key = (regime, self.params.a, self.aT, self.T)
+        if regime == REGIMES.NONEQ:
+            key += (self._distribution.tobytes(), )
+        return key
+
+    def thermodynamics(self, name):
+        key = self.thermodynamics_key()
+        if self._thermodynamics is None or self._thermodynamics[0] != key:
+            self._thermodynamics = (key, {})
+
+        values = self._thermodynamics[1]
+        if name not in values:
+            regime = key[0]
+            fused = getattr(regime, 'fused_thermodynamics', None)
+            if inspect.isfunction(fused):
+                values.update(fused(self))
+            else:
+                values[name] = getattr(regime, name)(self)
+        return values[name]
+
+    def set_thermodynamics(self, name, value):
+        """ Cache the `value` for the current state, e.g. restored from a checkpoint """
+        key = self.thermodynamics_key()
+        if self._thermodynamics is None or self._thermodynamics[0] != key:
+            self._thermodynamics = (key, {})
+        self._thermodynamics[1][name] = value
+
+    density = property(lambda self: self.thermodynamics('density'),
+                       lambda self, value: self.set_thermodynamics('density', value))
+    energy_density = property(lambda self: self.thermodynamics('energy_density'),
+                              lambda self, value: self.set_thermodynamics('energy_density', value))
+    pressure = property(lambda self: self.thermodynamics('pressure'),
+                        lambda self, value: self.set_thermodynamics('pressure', value))
+    entropy = property(lambda self: self.thermodynamics('entropy'),
+                       lambda self, value: self.set_thermodynamics('entropy', value))
+
     @property
     def regime(self):
         """
@@ -126,7 +170,7 @@ class AbstractParticle:
         `REGIMES.INTERMEDIATE`. When $T$ drops down even further to the value $ M / \gamma $,\
         particle species can be treated as `REGIMES.DUST` with a Boltzmann distribution function.
         """
-        regime_factor = environment.get('REGIME_SWITCHING_FACTOR')
+        regime_factor = self.params.config.REGIME_SWITCHING_FACTOR
 
         if not self.in_equilibrium:
             return REGIMES.NONEQ
@@ -212,6 +256,56 @@ class DistributionParticle(AbstractParticle):
         """ Particle collision integral is not effective in the equilibrium as well """
         self.collision_integral = numpy.zeros(self.grid.MOMENTUM_SAMPLES, dtype=numpy.float_)
 
+    # Attributes that change during the evolution and define the particle state
+    state_attributes = ('_distribution', 'collision_integral', 'aT', 'T', 't_decoupling',
+                        'decoupling_temperature', 'decayed', 'oldeq', 'num_creation',
+                        'density', 'energy_density', 'pressure', 'entropy')
+
+    def state(self):
+        """ Evolution state of the particle: distribution function, integrators history and\
+            internal parameters. Returned objects are not copied. """
+        state = {key: getattr(self, key) for key in self.state_attributes if hasattr(self, key)}
+        state['name'] = self.name
+        state['data'] = self.data
+        return state
+
+    def restore_state(self, state):
+        """ Restore the particle from the `state()` snapshot """
+        if state['name'] != self.name:
+            raise ValueError("Particle state of {} can't be applied to {}"
+                             .format(state['name'], self.name))
+
+        for key in self.state_attributes:
+            if key in state:
+                setattr(self, key, state[key])
+        self.data = state['data']
+
+        regime = self.regime
+        self.numerator = lambda: regime.numerator(self)
+        self.denominator = lambda: regime.denominator(self)
+
+    def step_snapshot(self):
+        """ Cheap copy of the `state()` taken before an evolution step so it can be undone """
+        snapshot = {key: getattr(self, key) for key in self.state_attributes if hasattr(self, key)}
+        if '_distribution' in snapshot:
+            # Distribution function is modified in place by `update_distribution`
+            snapshot['_distribution'] = snapshot['_distribution'].copy()
+        snapshot['data'] = {key: len(array) for key, array in self.data.items()}
+        return snapshot
+
+    def rollback(self, snapshot):
+        """ Undo the evolution step started at the `step_snapshot()` """
+        for key in self.state_attributes:
+            if key in snapshot:
+                setattr(self, key, snapshot[key])
+        for key, length in snapshot['data'].items():
+            self.data[key].length = length
+        self.collision_integrals = []
+
+        regime = self.regime
+        self.numerator = lambda: regime.numerator(self)
+        self.denominator = lambda: regime.denominator(self)
+
     def update(self, force_print=False):
         """ Update the particle parameters according to the new state of the system """
         oldregime = self.regime
@@ -298,45 +392,98 @@ class DistributionParticle(AbstractParticle):
             return kinematics.Icoll_fast_decay(self, ps)
 
         else:
-            Fs = []
-            ABs = []
-            Bs = []
+            integrals = [integral.integrate(ps, stepsize=self.params.h) if integral.active()
+                         else kinematics.return_function(integral, ps)
+                         for integral in self.collision_integrals]
+            return self.solve_collision_integral(ps, integrals)
+
+    def schedule_collision_integral(self, executor, ps=None):
+        """ Submit collision integrals of the particle to the `executor`.
+
+            Returns a function that waits for the submitted integrals and returns the same result\
+            as `calculate_collision_integral`. Particles that are not integrated term by term\
+            are computed immediately. """
+        if ps is None:
+            ps = self.grid.TEMPLATE
+
+        if (not self.collision_integrals or self.decayed or kinematics.has_decayed(self, ps)
+                or hasattr(self, 'fast_decay')):
+            I_coll = self.calculate_collision_integral(ps)
+            return lambda: I_coll
+
+        # Shared run state has to be set before any integral of the step reads it
+        for integral in self.collision_integrals:
+            kinematics.store_energy(integral)
+
+        futures = [executor.submit(integral.integrate, ps, stepsize=self.params.h)
+                   if integral.active()
+                   else executor.submit(kinematics.return_function, integral, ps)
+                   for integral in self.collision_integrals]
+
+        return lambda: self.solve_collision_integral(ps, [future.result() for future in futures])
+
+    def collision_terms(self, integrals):
+        """ Sum computed `collision_integrals` terms into the total collision integral `AB` and\
+            its part `B` proportional to the distribution function """
+        ABs = []
+        Bs = []
+
+        for integral, value in zip(self.collision_integrals, integrals):
+            if integral.kind in [CollisionIntegralKind.Full, CollisionIntegralKind.Full_vacuum_decay]:
+                C, B = value
+                ABs.append(C)
+                Bs.append(B)
+            elif integral.kind in [CollisionIntegralKind.F_f_vacuum_decay, CollisionIntegralKind.F_decay]:
+                Bs.append(value)
+                ABs.append(value)
+            else:
+                ABs.append(value)
+
+        return sum(ABs), sum(Bs)
 
-            for integral in self.collision_integrals:
-                if integral.kind in [CollisionIntegralKind.Full, CollisionIntegralKind.Full_vacuum_decay]:
-                    C,B = integral.integrate(ps, stepsize=self.params.h)
-                    ABs.append(C)
-                    Bs.append(B)
-                elif integral.kind in [CollisionIntegralKind.F_f_vacuum_decay, CollisionIntegralKind.F_decay]:
-                    G = integral.integrate(ps, stepsize=self.params.h)
-                    Bs.append(G)
-                    ABs.append(G)
-                else:
-                    ABs.append(integral.integrate(ps, stepsize=self.params.h))
+    def collision_rate(self, ps=None):
+        """ Collision integral for the current distribution functions without the time\
+            discretization: the right-hand side of the Boltzmann equation """
+        if ps is None:
+            ps = self.grid.TEMPLATE
 
-            AB = sum(ABs)
-            B = sum(Bs)
+        for integral in self.collision_integrals:
+            # Integration constants cache the distribution functions of the reaction species
+            if hasattr(integral, 'creaction'):
+                integral.creaction = None
 
-            # Adams-Moulton method
-            fs = list(self.data['collision_integral'][-MAX_ADAMS_MOULTON_ORDER:])
+        AB, _ = self.collision_terms([integral.integrate(ps, stepsize=self.params.h)
+                                      for integral in self.collision_integrals])
+        return AB
 
-            I_coll = adams_moulton_solver(y=self.distribution(ps), fs=fs,
-                                            A=AB, B=B, h=self.params.h)
+    def solve_collision_integral(self, ps, integrals):
+        """ Combine computed `collision_integrals` terms into the collision integral """
+        for integral, value in zip(self.collision_integrals, integrals):
+            integral.assess(value)
 
-            # # Backward differentiation method
-            # ys = list(self.data['distribution'][-MAX_BACKWARD_DIFF_ORDER:])
-            # I_coll = backward_differentiation(ys=ys, AB=AB, B=B, h=self.params.h)
+        AB, B = self.collision_terms(integrals)
 
-            # # Heun method
-            # I_coll =  heun_method(Is=self.data['collision_integral'], AB=AB)
+        # Adams-Moulton method over the history made with the current step size
+        fs = list(self.data['collision_integral'][-MAX_ADAMS_MOULTON_ORDER:])
+        order = self.params.multistep_order(min(MAX_ADAMS_MOULTON_ORDER, len(fs) + 1))
 
-            # # Implicit Euler method
-            # I_coll = implicit_euler(AB=AB, B=B, h=self.params.h)
+        I_coll = adams_moulton_solver(y=self.distribution(ps), fs=fs,
+                                      A=AB, B=B, h=self.params.h, order=order)
 
-            # # Euler method
-            # I_coll = AB
+        # # Backward differentiation method
+        # ys = list(self.data['distribution'][-MAX_BACKWARD_DIFF_ORDER:])
+        # I_coll = backward_differentiation(ys=ys, AB=AB, B=B, h=self.params.h)
 
-            return I_coll
+        # # Heun method
+        # I_coll =  heun_method(Is=self.data['collision_integral'], AB=AB)
+
+        # # Implicit Euler method
+        # I_coll = implicit_euler(AB=AB, B=B, h=self.params.h)
+
+        # # Euler method
+        # I_coll = AB
+
+        return I_coll
 
     def distribution(self, p):
         """
@@ -370,7 +517,9 @@ class DistributionParticle(AbstractParticle):
             p, conformal_mass,
             int(self.eta),
             self.aT,
-            self.in_equilibrium
+            self.in_equilibrium,
+            self.grid.SPACING,
+            self.grid.BASE
         )
 
     def equilibrium_distribution(self, y=None, aT=None, conf_mass=None):
@@ -385,6 +534,16 @@ class DistributionParticle(AbstractParticle):
         else:
             return self.equilibrium_distribution_function(self.conformal_energy(y, conf_mass) / aT)
 
+    def equilibrium_deviation(self):
+        """ Largest deviation of the distribution function from the equilibrium one at the\
+            temperature of decoupling, relative to the maximum of the latter """
+        if self.in_equilibrium:
+            return 0.
+        equilibrium = self.equilibrium_distribution(
+            conf_mass=self.mass * self.aT / self.decoupling_temperature
+        )
+        return numpy.abs(self._distribution - equilibrium).max() / equilibrium.max()
+
     def init_distribution(self, conf_mass=None):
         if not self.thermal_dyn:
             self._distribution = numpy.zeros(self.grid.MOMENTUM_SAMPLES)
@@ -0,0 +1,162 @@
+"""
+# Thermodynamics tables
+
+Thermodynamical quantities of the massive equilibrium particles depend on the temperature only\
+through $\gamma = M / T$ and the statistics of the species:
+
+\begin{align}
+    n &= \frac{g T^3}{2 \pi^2} e^{-\gamma} N(\gamma) \\\\
+    \rho &= \frac{g T^4}{2 \pi^2} e^{-\gamma} R(\gamma) \\\\
+    P &= \frac{g T^4}{2 \pi^2} e^{-\gamma} P(\gamma) \\\\
+    I(k) &= \frac{g (a T)^{k + 1}}{2 \pi^2} e^{-\gamma} L_k(\gamma)
+\end{align}
+
+The dimensionless integrals are the same quadratures that `IntermediateParticle` computes\
+directly, with the Boltzmann factor $e^{-\gamma}$ taken out. They are tabulated over $\log \gamma$\
+for each statistics and interpolated by a cubic spline of their logarithm. The table is refined\
+until the spline reproduces direct quadratures between the nodes within the tolerance, and is\
+saved to `THERMODYNAMICS_TABLES_DIR` (`~/.cache/pyBBN/thermodynamics` by default) so that the\
+next runs only load it. Concurrent runs computing the same table replace the file atomically.
+"""
+
+import io
+import os
+import numpy
+from scipy.interpolate import CubicSpline
+
+from common import utils
+from common.integrators import gauss_legendre, gauss_laguerre
+
+
+QUANTITIES = ('density', 'energy_density', 'pressure', 'I2', 'I4')
+
+""" Upper bound of the momentum integrals in units of $T$, same as in `IntermediateParticle` """
+MOMENTUM_CUTOFF = 20.
+
+""" Tables computed or loaded in the process, by the key of `table_key` """
+TABLES = {}
+
+
+def momentum_integrals(eta, gamma):
+    """ $N$, $R$ and $P$ integrals at $\gamma$ by the fixed order Gauss-Legendre quadrature """
+    x = MOMENTUM_CUTOFF / 2. * (gauss_legendre.points + 1.)
+    weights = MOMENTUM_CUTOFF / 2. * gauss_legendre.weights
+
+    energy = numpy.sqrt(x**2 + gamma**2)
+    # $f e^\gamma$ with $\epsilon - \gamma$ computed without cancellations
+    distribution = 1. / (numpy.exp(x**2 / (energy + gamma)) + eta * numpy.exp(-gamma))
+
+    return (
+        numpy.dot(weights, x**2 * distribution),
+        numpy.dot(weights, x**2 * energy * distribution),
+        numpy.dot(weights, x**4 / energy * distribution) / 3.
+    )
+
+
+def laguerre_integral(eta, gamma, y_power):
+    """ $L_k$ integral of `IntermediateParticle.Int` """
+    return gauss_laguerre.integrate_1D(lambda eps: (
+        (eps + gamma) * (eps * (eps + 2. * gamma))**((y_power - 1.) / 2.)
+        / (numpy.exp(-eps - gamma) + eta)**2
+    ))[0]
+
+
+def direct(eta, gamma):
+    """ All tabulated quantities at $\gamma$ computed directly """
+    return numpy.array(momentum_integrals(eta, gamma)
+                       + (laguerre_integral(eta, gamma, 2), laguerre_integral(eta, gamma, 4)))
+
+
+class ThermodynamicsTable(object):
+
+    """ Dimensionless thermodynamical integrals of the particles with the statistics `eta` on\
+        the `gammas` grid """
+
+    def __init__(self, eta, gammas, values, error):
+        self.eta = eta
+        self.gammas = gammas
+        self.values = values
+        self.error = error
+        self.bounds = (gammas[0], gammas[-1])
+        self.spline = CubicSpline(numpy.log(gammas), numpy.log(values), axis=0)
+
+    @classmethod
+    def compute(cls, eta, bounds, tolerance, samples=101, max_samples=10 ** 5):
+        """ Tabulate the integrals on the logarithmic grid, doubling its density until the\
+            maximal relative error of the interpolation in the middle points is below `tolerance` """
+        while True:
+            log_gammas = numpy.linspace(numpy.log(bounds[0]), numpy.log(bounds[1]), samples)
+            gammas = numpy.exp(log_gammas)
+            values = numpy.array([direct(eta, gamma) for gamma in gammas])
+            table = cls(eta, gammas, values, error=None)
+
+            middle = numpy.exp((log_gammas[1:] + log_gammas[:-1]) / 2.)
+            exact = numpy.array([direct(eta, gamma) for gamma in middle])
+            table.error = numpy.abs(table.interpolate(middle) / exact - 1.).max()
+
+            if table.error <= tolerance:
+                return table
+            if 2 * samples - 1 > max_samples:
+                raise ValueError("Thermodynamics table can not reach the tolerance {:e}: {:e}"
+                                 .format(tolerance, table.error))
+            samples = 2 * samples - 1
+
+    def interpolate(self, gamma):
+        return numpy.exp(self.spline(numpy.log(gamma)))
+
+    def __call__(self, name, gamma):
+        """ Tabulated `name` quantity at $\gamma$ or `None` if it is out of the table """
+        if not self.bounds[0] <= gamma <= self.bounds[1]:
+            return None
+        return float(numpy.exp(self.spline(numpy.log(gamma))[QUANTITIES.index(name)]))
+
+    def save(self, path):
+        payload = io.BytesIO()
+        numpy.savez(payload, eta=self.eta, gammas=self.gammas, values=self.values,
+                    error=self.error)
+        utils.atomic_write(path, payload.getvalue())
+
+    @classmethod
+    def load(cls, path):
+        with numpy.load(path) as data:
+            return cls(float(data['eta']), data['gammas'], data['values'], float(data['error']))
+
+
+def table_key(eta, config):
+    """ Everything the table depends on: statistics, range, tolerance and quadratures """
+    factor = config.REGIME_SWITCHING_FACTOR
+    return (float(eta), 1. / factor, factor, config.THERMODYNAMICS_TABLES_TOLERANCE,
+            len(gauss_legendre.points), len(gauss_laguerre.points))
+
+
+def table_path(key, config):
+    folder = config.THERMODYNAMICS_TABLES_DIR or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(os.path.join('~', '.cache')),
+        'pyBBN', 'thermodynamics'
+    )
+    name = "thermodynamics_eta{:+g}_{:g}_{:g}_{:g}_{}_{}.npz".format(*key)
+    return os.path.join(folder, name)
+
+
+def get_table(eta, config):
+    key = table_key(eta, config)
+    if key not in TABLES:
+        path = table_path(key, config)
+        if os.path.exists(path):
+            table = ThermodynamicsTable.load(path)
+        else:
+            # A small margin keeps the lookups near the regime switching inside the table
+            table = ThermodynamicsTable.compute(eta, (key[1] / 2., key[2] * 2.), key[3])
+            utils.ensure_dir(os.path.dirname(path))
+            table.save(path)
+        TABLES[key] = table
+    return TABLES[key]
+
+
+def lookup(particle, name, gamma):
+    """ Tabulated dimensionless `name` quantity of the equilibrium `particle` at $\gamma$ or\
+        `None` if the tables are disabled or $\gamma$ is out of their range """
+    config = particle.params.config
+    if not config.THERMODYNAMICS_TABLES or not gamma or name not in QUANTITIES:
+        return None
+    return get_table(particle.eta, config)(name, gamma)
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+# Parameter scan
+
+Runs a scenario for every point of a parameter grid in a pool of worker processes and collects\
+the resulting observables into a single table.
+
+A scenario builder is a function that takes the output `folder` and the point parameters as\
+keyword arguments, sets up and evolves the `Universe` and returns it:
+
+    def scenario(folder, mass, theta):
+        ...
+        universe.evolve(T_final)
+        return universe
+
+The returned universe is closed once its observables are collected. Errors of the evolution\
+propagate from the builder, which should close the universe itself then (e.g. by evolving it\
+inside `with Universe(...) as universe:`).
+
+Every point runs in its own process, so a crash or a timeout of one point (e.g. a GSL integration\
+failure or the numerical instability error) is recorded in the table and does not affect\
+the rest of the scan.
+
+    PYTHONPATH=. python scan.py --builder scenarios:sterile --folder output/scan \\
+        --param mass=100,150,200 --param theta=1e-3,5e-3 --processes 8 --timeout 36000
+
+With `--threads` the points are evolved by the threads of a single process instead: the start-up,\
+imports and caches are shared by all points, but there is no timeout and a crash of the\
+interpreter stops the whole scan.
+"""
+
+import os
+import sys
+import time
+import argparse
+import importlib
+import itertools
+import traceback
+import multiprocessing
+from multiprocessing.connection import wait
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import kawano
+from common import utils
+
+
+def grid(**axes):
+    """ Cartesian product of the parameter `axes` as a list of points """
+    names = sorted(axes.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*(axes[name] for name in names))]
+
+
+def point_folder(folder, point):
+    return os.path.join(folder, "_".join("{}={}".format(name, point[name]) for name in sorted(point)))
+
+
+def observables(universe):
+    """ Results of the evolved universe: effective number of neutrinos, KAWANO observables """
+    results = {
+        'N_eff': universe.params.N_eff,
+        'T': universe.params.T,
+        'a': universe.params.a,
+    }
+
+    if universe.folder and universe.kawano:
+        try:
+            results.update(kawano.observables(universe.folder))
+        except IOError:
+            pass
+
+    return results
+
+
+def worker(builder, folder, point, connection):
+    try:
+        connection.send(evolve_point(builder, folder, point))
+    finally:
+        connection.close()
+
+
+def evolve_point(builder, folder, point):
+    """ Evolve the point in the current process: (status, observables or error) """
+    try:
+        universe = builder(folder=folder, **point)
+        try:
+            return 'done', observables(universe)
+        finally:
+            # Points evolved in threads of one process must not leave the writers and loggers
+            universe.close()
+    except BaseException:
+        # Including `SystemExit` of the builders
+        return 'failed', traceback.format_exc().strip().splitlines()[-1]
+
+
+class Table(object):
+
+    """ Tab-separated table of the scan results, rows are appended as soon as points finish """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.columns = None
+        self.rows = []
+
+    def append(self, row):
+        self.rows.append(row)
+        if not self.path:
+            return
+
+        if self.columns is None:
+            self.columns = sorted(row.keys())
+            with open(self.path, 'w') as f:
+                f.write("\t".join(self.columns) + "\n")
+
+        extra = sorted(set(row.keys()) - set(self.columns))
+        if extra:
+            # New observables show up: rewrite the table with the extended heading
+            self.columns += extra
+            with open(self.path, 'w') as f:
+                f.write("\t".join(self.columns) + "\n")
+                for saved in self.rows:
+                    f.write(self.row_repr(saved) + "\n")
+        else:
+            with open(self.path, 'a') as f:
+                f.write(self.row_repr(row) + "\n")
+
+    def row_repr(self, row):
+        return "\t".join(str(row.get(column, '')) for column in self.columns)
+
+
+def run(builder, points, folder, processes=None, timeout=None, table='scan.txt'):
+    """ Evolve the scenario `builder` for all `points` using `processes` parallel processes.
+
+        :param timeout: Wall time limit per point in seconds
+        :return: Table rows: point parameters, `status` and observables
+    """
+    processes = processes or multiprocessing.cpu_count()
+    results = Table(utils.ensure_path(folder, table) if table else None)
+
+    queue = list(points)
+    running = {}
+
+    while queue or running:
+        while queue and len(running) < processes:
+            point = queue.pop(0)
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=worker,
+                                              args=(builder, point_folder(folder, point),
+                                                    point, sender))
+            process.start()
+            sender.close()
+            running[process.sentinel] = (process, point, receiver, time.time())
+
+        wait(list(running.keys()), timeout=1.)
+
+        for sentinel, (process, point, receiver, started) in list(running.items()):
+            row = dict(point)
+
+            if receiver.poll():
+                try:
+                    status, payload = receiver.recv()
+                except EOFError:
+                    status, payload = 'failed', 'worker exited with code {}'.format(process.exitcode)
+            elif not process.is_alive():
+                status, payload = 'failed', 'worker exited with code {}'.format(process.exitcode)
+            elif timeout and time.time() - started > timeout:
+                process.terminate()
+                status, payload = 'timeout', None
+            else:
+                continue
+
+            process.join()
+            receiver.close()
+            del running[sentinel]
+
+            row['status'] = status
+            row['time'] = time.time() - started
+            if status == 'done':
+                row.update(payload)
+            elif payload:
+                row['error'] = payload
+
+            results.append(row)
+            print("[{}] {}".format(status, ", ".join("{}={}".format(name, point[name])
+                                                     for name in sorted(point))))
+            sys.stdout.flush()
+
+    return results.rows
+
+
+def run_threads(builder, points, folder, threads=1, table='scan.txt'):
+    """ Evolve the scenario `builder` for all `points` in `threads` threads of this process
+
+        :return: Table rows: point parameters, `status` and observables
+    """
+    results = Table(utils.ensure_path(folder, table) if table else None)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = {executor.submit(evolve_point, builder, point_folder(folder, point), point):
+                   (point, time.time()) for point in points}
+
+        for future in as_completed(futures):
+            point, started = futures[future]
+            status, payload = future.result()
+
+            row = dict(point)
+            row['status'] = status
+            row['time'] = time.time() - started
+            if status == 'done':
+                row.update(payload)
+            elif payload:
+                row['error'] = payload
+
+            results.append(row)
+            print("[{}] {}".format(status, ", ".join("{}={}".format(name, point[name])
+                                                     for name in sorted(point))))
+            sys.stdout.flush()
+
+    return results.rows
+
+
+def load_builder(path):
+    """ Import the builder function given as `module:function` """
+    module, _, function = path.partition(':')
+    return getattr(importlib.import_module(module), function or 'scenario')
+
+
+def parse_axis(definition):
+    name, _, values = definition.partition('=')
+    return name, [float(value) for value in values.split(',')]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the scenario over a grid of parameters')
+    parser.add_argument('--builder', required=True, help='Scenario builder as `module:function`')
+    parser.add_argument('--folder', required=True)
+    parser.add_argument('--param', action='append', default=[], type=parse_axis,
+                        help='Parameter values as `name=value1,value2,...`')
+    parser.add_argument('--processes', default=None, type=int)
+    parser.add_argument('--threads', default=None, type=int,
+                        help='Evolve the points in threads of a single process')
+    parser.add_argument('--timeout', default=None, type=float, help='Seconds per point')
+    parser.add_argument('--table', default='scan.txt')
+    args = parser.parse_args()
+
+    if args.threads:
+        run_threads(load_builder(args.builder), grid(**dict(args.param)), args.folder,
+                    threads=args.threads, table=args.table)
+    else:
+        run(load_builder(args.builder), grid(**dict(args.param)), args.folder,
+            processes=args.processes, timeout=args.timeout, table=args.table)
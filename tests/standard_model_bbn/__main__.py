@@ -61,53 +61,56 @@ universe.interactions += (
 universe.init_kawano(electron=electron, neutrino=neutrino_e)
 
 def step_monitor(universe):
+    # Files are appended by the background writer of the universe, so the evolution is not
+    # blocked by the output
+    write = universe.writer.write
+
     # explanation of what is inside the file + first row which is a grid on y
     if universe.step == 1:
         for particle in [neutrino_e, neutrino_mu]:
-            with open(os.path.join(folder, particle.name.replace(' ', '_') + ".distribution.txt"), 'a') as f:
-                f.write('# First line is a grid of y; Starting from second line: first number is a, second is temperature, next is set of numbers is corresponding to f(y) on the grid' + '\n')
-                f.write('## a     T     ' + '\t'.join([
-                    '{:e}'.format(x)
-                    for x in particle.grid.TEMPLATE / UNITS.MeV
-                ]) + '\n')
-            with open(os.path.join(folder, particle.name.replace(' ', '_') + ".collision_integrals.txt"), 'a') as f:
-                f.write('# First line is a grid of y; Starting from second line each line is a set of numbers is corresponding to Icoll(f) on the grid y with temperature equal to the T in .distribution.txt' + '\n')
-                f.write('##     ' + '\t'.join([
-                    '{:e}'.format(x)
-                    for x in particle.grid.TEMPLATE / UNITS.MeV
-                ]) + '\n')
-            with open(os.path.join(folder, particle.name.replace(' ', '_') + ".rho.txt"), 'a') as f:
-                f.write('## a     T     aT    rho_nu' + '\n')
-        with open(os.path.join(folder, "rho_nu.txt"), 'a') as f:
-                    f.write('# a    rho_nu' + '\n')
+            write(os.path.join(folder, particle.name.replace(' ', '_') + ".distribution.txt"),
+                  '# First line is a grid of y; Starting from second line: first number is a, second is temperature, next is set of numbers is corresponding to f(y) on the grid' + '\n'
+                  + '## a     T     ' + '\t'.join([
+                      '{:e}'.format(x)
+                      for x in particle.grid.TEMPLATE / UNITS.MeV
+                  ]) + '\n')
+            write(os.path.join(folder, particle.name.replace(' ', '_') + ".collision_integrals.txt"),
+                  '# First line is a grid of y; Starting from second line each line is a set of numbers is corresponding to Icoll(f) on the grid y with temperature equal to the T in .distribution.txt' + '\n'
+                  + '##     ' + '\t'.join([
+                      '{:e}'.format(x)
+                      for x in particle.grid.TEMPLATE / UNITS.MeV
+                  ]) + '\n')
+            write(os.path.join(folder, particle.name.replace(' ', '_') + ".rho.txt"),
+                  '## a     T     aT    rho_nu' + '\n')
+        write(os.path.join(folder, "rho_nu.txt"), '# a    rho_nu' + '\n')
 
     # Output the distribution function and collision integrals distortion to file every 10 steps, first column is temperature
     if universe.step % 10 == 0:
         for particle in [neutrino_e, neutrino_mu]:
-            with open(os.path.join(folder, particle.name.replace(' ', '_') + ".distribution.txt"), 'a') as f:
-                f.write(
-                    '{:e}\t{:e}\t'.format(universe.params.a, universe.params.T / UNITS.MeV)
-                    + '\t'.join([
-                        '{:e}'.format(x)
-                        for x in particle._distribution
-                    ]) + '\n'
-                )
-            with open(os.path.join(folder, particle.name.replace(' ', '_') + ".rho.txt"), 'a') as f:
-                f.write('{:e}\t{:e}\t{:e}\t{:e}\n'.format(
-                    universe.params.a, universe.params.T / UNITS.MeV,
-                    universe.params.aT / UNITS.MeV, particle.energy_density / UNITS.MeV**4
-                ))
-        with open(os.path.join(folder, "rho_nu.txt"), 'a') as f:
-            f.write('{:e}\t{:e}\n'.format(
-                universe.params.a,
-                sum(p.energy_density for p in [neutrino_e, neutrino_mu]) / UNITS.MeV**4
-            ))
+            write(
+                os.path.join(folder, particle.name.replace(' ', '_') + ".distribution.txt"),
+                '{:e}\t{:e}\t'.format(universe.params.a, universe.params.T / UNITS.MeV)
+                + '\t'.join([
+                    '{:e}'.format(x)
+                    for x in particle._distribution
+                ]) + '\n'
+            )
+            write(os.path.join(folder, particle.name.replace(' ', '_') + ".rho.txt"),
+                  '{:e}\t{:e}\t{:e}\t{:e}\n'.format(
+                      universe.params.a, universe.params.T / UNITS.MeV,
+                      universe.params.aT / UNITS.MeV, particle.energy_density / UNITS.MeV**4
+                  ))
+        write(os.path.join(folder, "rho_nu.txt"), '{:e}\t{:e}\n'.format(
+            universe.params.a,
+            sum(p.energy_density for p in [neutrino_e, neutrino_mu]) / UNITS.MeV**4
+        ))
 
 universe.step_monitor = step_monitor
 
 universe.evolve(T_interaction_freezeout, export=False)
 universe.interactions = tuple()
 universe.evolve(T_final)
+universe.close()
 
 """
 ### Plots for comparison with articles
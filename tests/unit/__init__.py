@@ -13,9 +13,17 @@ def setup():
     return [params], {}
 
 
-def non_equilibium_setup():
+def decoupled_params_setup():
+    """ Parameters below the neutrino decoupling, where the collision integrals of the neutrinos\
+        are computed """
+    return [Params(T=SMP.leptons.neutrino_e['decoupling_temperature'] * 0.9, dy=0.025)], {}
+
+
+def non_equilibium_setup(T=None):
     args, _ = setup()
     params = args[0]
+    if T is not None:
+        params = Params(T=T, dy=params.dy)
 
     photon = Particle(**SMP.photon)
     neutrino_e = Particle(**SMP.leptons.neutrino_e)
@@ -29,6 +37,13 @@ def non_equilibium_setup():
     return [params, universe], {}
 
 
+def decoupled_setup():
+    """ Non-equilibrium setup below the neutrino decoupling, where the collision integrals of\
+        the electron neutrino are computed. Universe orders the particles by mass and name:\
+        photon, muon neutrino, electron neutrino """
+    return non_equilibium_setup(T=SMP.leptons.neutrino_e['decoupling_temperature'] * 0.9)
+
+
 def with_setup_args(setup, teardown=None):
     """Decorator to add setup and/or teardown methods to a test function::
 
@@ -0,0 +1,122 @@
+import os
+import sys
+import pickle
+import shutil
+import tempfile
+import numpy
+from nose.tools import eq_
+
+from common import Params
+from evolution import Universe
+from particles import Particle
+from library.SM import particles as SMP, interactions as SMI
+
+from . import setup, with_setup_args
+
+
+def checkpoint_universe(params):
+    photon = Particle(**SMP.photon)
+    neutrino_e = Particle(**SMP.leptons.neutrino_e)
+
+    universe = Universe(params=params)
+    universe.add_particles([photon, neutrino_e])
+    universe.interactions += [SMI.neutrino_scattering(neutrino_e, neutrino_e)]
+    return universe
+
+
+@with_setup_args(setup)
+def state_roundtrip_test(params):
+    universe = checkpoint_universe(params)
+    universe.params.update(universe.total_energy_density(), universe.total_entropy())
+    universe.step = 42
+
+    integral = universe.collision_integrals()[0]
+    integral.retired = True
+    integral.quiet_steps = 12
+    integral.idle_steps = 7
+    integral.count(calls=3, pruned=2)
+    integral.kernels = {'ps': numpy.arange(3.), 'masses': numpy.zeros(4),
+                       'vector': numpy.ones(3), 'matrix': numpy.eye(3)}
+
+    state = pickle.loads(pickle.dumps(universe.state()))
+
+    restored = checkpoint_universe(Params(T=params.T, dy=params.dy))
+    restored.restore_state(state)
+
+    assert restored.step == 42
+    assert restored.params.rho == universe.params.rho
+    for original, particle in zip(universe.particles, restored.particles):
+        assert numpy.array_equal(original._distribution, particle._distribution)
+        assert original.T == particle.T
+
+    for original, integral in zip(universe.collision_integrals(), restored.collision_integrals()):
+        eq_(integral.retired, original.retired)
+        eq_(integral.quiet_steps, original.quiet_steps)
+        eq_(integral.idle_steps, original.idle_steps)
+        eq_(integral.counters, original.counters)
+    integral = restored.collision_integrals()[0]
+    assert integral.retired
+    eq_(integral.counters['pruned'], 2)
+    assert numpy.array_equal(integral.kernels['matrix'], numpy.eye(3))
+
+
+@with_setup_args(setup)
+def integral_mismatch_test(params):
+    universe = checkpoint_universe(params)
+    universe.params.update(universe.total_energy_density(), universe.total_entropy())
+    state = universe.state()
+
+    restored = checkpoint_universe(Params(T=params.T, dy=params.dy))
+    restored.interactions = []
+    try:
+        restored.restore_state(state)
+    except ValueError:
+        pass
+    else:
+        assert False, "Integrals state must not be applied to different interactions"
+
+
+@with_setup_args(setup)
+def particle_mismatch_test(params):
+    photon = Particle(params=params, **SMP.photon)
+    neutrino = Particle(params=params, **SMP.leptons.neutrino_e)
+
+    try:
+        neutrino.restore_state(photon.state())
+    except ValueError:
+        pass
+    else:
+        assert False, "Particle state must not be applied to a different species"
+
+
+@with_setup_args(setup)
+def export_resume_test(params):
+    folder = tempfile.mkdtemp()
+    stdout = sys.stdout
+    try:
+        universe = Universe(folder=folder, params=params)
+        universe.add_particles([Particle(**SMP.photon)])
+        params.update(universe.total_energy_density(), universe.total_entropy())
+        for step in range(3):
+            universe.save_params()
+        universe.export_tables()
+        universe.checkpoint()
+        universe.checkpoint_writer.join()
+
+        # Rows exported after the checkpoint are cut off on resume
+        universe.save_params()
+        universe.export_tables()
+        universe.flush()
+
+        restored = Universe(folder=folder, params=Params(T=params.T, dy=params.dy), resume=True)
+        restored.add_particles([Particle(**SMP.photon)])
+        restored.restore_state(restored.resume_state)
+        restored.save_params()
+        restored.export_tables()
+        restored.flush()
+
+        rows = numpy.loadtxt(os.path.join(folder, 'evolution.txt'))
+        assert len(rows) == 4, "Resumed run must append to the checkpointed rows"
+    finally:
+        sys.stdout = stdout
+        shutil.rmtree(folder)
@@ -0,0 +1,68 @@
+import os
+import pickle
+
+import environment
+from common import Params, UNITS, kinematics
+from evolution import Universe
+from particles import Particle, REGIMES
+from library.SM import particles as SMP
+
+from . import setup, with_setup_args
+
+
+def config_snapshot_test():
+    os.environ['MOMENTUM_SAMPLES'] = '101'
+    try:
+        config = environment.Config(ADAPTIVE_TIMESTEP=True)
+    finally:
+        del os.environ['MOMENTUM_SAMPLES']
+
+    assert config.MOMENTUM_SAMPLES == 101, "Environment is not converted to the setting type"
+    assert config.ADAPTIVE_TIMESTEP is True
+    assert environment.Config().MOMENTUM_SAMPLES == environment.defaults['MOMENTUM_SAMPLES']
+
+    try:
+        config.MOMENTUM_SAMPLES = 11
+        assert False, "Configuration is mutable"
+    except AttributeError:
+        pass
+
+    replaced = config.replace(MOMENTUM_SAMPLES=11)
+    assert replaced.MOMENTUM_SAMPLES == 11 and config.MOMENTUM_SAMPLES == 101
+    assert pickle.loads(pickle.dumps(config)).ADAPTIVE_TIMESTEP is True
+
+    try:
+        environment.Config(MOMENTUM_SAMPLE=11)
+        assert False, "Unknown setting is accepted"
+    except ValueError:
+        pass
+
+
+@with_setup_args(setup)
+def run_config_test(params):
+    config = environment.Config(REGIME_SWITCHING_FACTOR=10.)
+    universe = Universe(params=params, config=config)
+    electron = Particle(**SMP.leptons.electron)
+    universe.add_particles([electron])
+
+    assert universe.config is config and electron.params.config is config
+
+    params.aT = params.a * electron.mass * 20
+    electron.update()
+    assert electron.regime == REGIMES.RADIATION, "Per-run setting is ignored"
+
+    # Run state is saved with the params, not in the process environment
+    params.HNL_energy = 10 * UNITS.MeV
+    state = pickle.loads(pickle.dumps(universe.state()))
+    assert 'config' not in state['params']
+    assert state['params']['HNL_energy'] == 10 * UNITS.MeV
+    assert 'HNL_ENERGY' not in os.environ
+
+
+def relativistic_decoupling_test():
+    first, second = Params(T=10 * UNITS.MeV, dy=0.1), Params(T=10 * UNITS.MeV, dy=0.1)
+
+    kinematics.grid_params_HNL(10 * UNITS.MeV, 1e-3, first)
+    assert first.relativistic_decoupling, "Relativistic decoupling is not recorded"
+    assert not second.relativistic_decoupling, "Relativistic decoupling leaks to another run"
+    assert 'Relativistic_decoupling' not in os.environ
@@ -0,0 +1,86 @@
+import os
+import sys
+import tempfile
+import threading
+
+import kawano
+from common import utils
+from evolution import Universe
+from particles import Particle
+from library.SM import particles as SMP
+
+from . import setup, with_setup_args
+
+
+@with_setup_args(setup)
+def independent_universes_test(params):
+    first = Universe(params=params)
+    second = Universe(params=setup()[0][0])
+
+    first.data.append({column: 1. for column in first.data.columns})
+    assert len(first.data) == 1 and len(second.data) == 0, "Universes share the history"
+
+    electron, neutrino = Particle(**SMP.leptons.electron), Particle(**SMP.leptons.neutrino_e)
+    first.add_particles([electron, neutrino])
+    first.init_kawano(electron=electron, neutrino=neutrino)
+    assert first.kawano_particles.neutrino is neutrino
+    assert second.kawano_particles is None
+    assert len(kawano.baryonic_rates(params.a, first.kawano_particles)) == 6
+
+
+def thread_logs_test():
+    folder = tempfile.mkdtemp()
+    stdout = sys.stdout
+    created = {name: threading.Event() for name in ("first", "second")}
+    loggers = {}
+
+    def run(name, after):
+        if after:
+            created[after].wait()
+        loggers[name] = sys.stdout = utils.Logger(os.path.join(folder, name), mode="w")
+        created[name].set()
+
+        # Both threads write to the same (last) `stdout`
+        created["second"].wait()
+        sys.stdout.write(name + "\n", terminal=False)
+
+    threads = [threading.Thread(target=run, args=("first", None)),
+               threading.Thread(target=run, args=("second", "first"))]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.stdout = stdout
+
+    for name, logger in loggers.items():
+        logger.log.close()
+        with open(os.path.join(folder, name)) as f:
+            assert f.read() == name + "\n", "Output of one thread is saved to the log of another"
+
+
+@with_setup_args(setup)
+def close_test(params):
+    folder = tempfile.mkdtemp()
+    stdout = sys.stdout
+    try:
+        with Universe(folder=folder, params=params) as universe:
+            assert sys.stdout is universe.logger
+            print("evolving")
+        assert sys.stdout is stdout, "Closed universe keeps redirecting the output"
+        assert not universe.writer.thread.is_alive(), "Closed universe keeps the writer thread"
+        assert universe.logger.log.closed
+
+        # Loggers created later in the chain are relinked past the closed one
+        first = sys.stdout = utils.Logger(os.path.join(folder, "first"), mode="w")
+        second = sys.stdout = utils.Logger(os.path.join(folder, "second"), mode="w")
+        first.close()
+        assert second.terminal is stdout
+        second.close()
+        assert sys.stdout is stdout
+    finally:
+        sys.stdout = stdout
+
+    with open(os.path.join(folder, 'log.txt')) as f:
+        assert f.read() == "evolving\n"
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+
+import numpy
+
+from common import utils
+
+
+def bounded_history_test():
+    folder = tempfile.mkdtemp()
+    try:
+        array = utils.Dynamic2DArray(numpy.arange(3.))
+        array.bound(4, head=2, spill=os.path.join(folder, 'spill.bin'), spill_every=2)
+        buffer = array._data
+
+        for i in range(20):
+            array.append([i] * 3)
+
+        assert array._data is buffer, "Bounded array must not be reallocated"
+        assert len(array) == 20
+        assert numpy.array_equal(array.data[:, 0], [0, 1, 16, 17, 18, 19])
+        assert numpy.array_equal(array[-2:][:, 0], [18, 19])
+
+        # Rolled back rows are replaced by the new ones
+        array.length = 18
+        array.append([99] * 3)
+        assert numpy.array_equal(array.data[:, 0], [0, 1, 16, 17, 99])
+
+        indices, rows = array.load_spill()
+        assert numpy.array_equal(indices, [2, 4, 6, 8, 10, 12, 14])
+        assert numpy.array_equal(rows[:, 0], indices)
+    finally:
+        shutil.rmtree(folder)
+
+
+def bounded_records_test():
+    table = utils.DynamicRecArray([['x', None, 1], ['y', None, 1]])
+    table.bound(3)
+    for i in range(8):
+        table.append({'x': i, 'y': -i})
+
+    assert numpy.array_equal(table['x'], [0, 1, 5, 6, 7])
+    assert table['y'][1] == -1
+    assert numpy.array_equal(table.rows(6, 8)['x'], [6, 7])
+
+    # Ranges reaching the dropped rows are not read modulo the capacity
+    for start, stop in [(0, 8), (4, 6), (6, 9)]:
+        try:
+            table.rows(start, stop)
+        except IndexError:
+            pass
+        else:
+            assert False, "Rows {}-{} are not kept in memory".format(start, stop)
+
+
+def phase_timer_columns_test():
+    timer = utils.PhaseTimer()
+    timer.current = {'first': 1.}
+    timer.end_step(1)
+    # Phases that show up later get their columns
+    timer.current = {'first': 2., 'second': 3.}
+    timer.end_step(2)
+
+    assert timer.table.columns == ['step', 'first', 'second']
+    assert numpy.array_equal(timer.table['second'], [0., 3.])
+    assert timer.totals == {'first': 3., 'second': 3.}
@@ -1,7 +1,7 @@
 import numpy
 
 from array import array
-from scipy import special, integrate
+from scipy import special, integrate, optimize
 
 import environment
 from common import integrators
@@ -82,6 +82,13 @@ def implicit_euler_test():
         "Implicit Euler method should be stable"
 
 
+def adams_moulton_first_order_test():
+    y, A, B, h = 1., 0.5, -2.3, 0.1
+    assert numpy.isclose(integrators.adams_moulton_solver(y, [0.1, 0.2], A, B, h, order=1),
+                         integrators.implicit_euler(y, 0., A, B, h)), \
+        "First order Adams-Moulton method must ignore the history"
+
+
 def heun_test():
 
     f = lambda t, y: -2.3 * y
@@ -99,6 +106,42 @@ def heun_test():
         "Heun method should be more accurate"
 
 
+def newton_krylov_test():
+
+    # Stiff coupled linear system
+    M = numpy.array([[-1000., 999.], [1., -2.]])
+    rate = lambda y: M.dot(y)
+    y_0 = numpy.array([1., 0.5])
+    h = 0.1
+
+    y_1 = integrators.newton_krylov_step([y_0], rate, h)
+    assert numpy.allclose(y_1, numpy.linalg.solve(numpy.eye(2) - h * M, y_0)), \
+        "First order step should coincide with the implicit Euler method"
+
+    y_2 = integrators.newton_krylov_step([y_0, y_1], rate, h)
+    assert numpy.allclose(y_2, numpy.linalg.solve(numpy.eye(2) - 2. / 3. * h * M,
+                                                  4. / 3. * y_1 - 1. / 3. * y_0)), \
+        "Second order step should solve the BDF2 equation"
+
+
+def newton_krylov_tolerance_test():
+
+    rate = lambda y: -10. * y**3
+    y_0 = numpy.array([1., 2.])
+    h = 0.1
+
+    y_1 = integrators.newton_krylov_step([y_0], rate, h, tolerance=1e-4)
+    assert numpy.abs((y_1 - y_0 - h * rate(y_1)) / y_0).max() < 1e-4, \
+        "Residual should be within the tolerance relative to the solution"
+
+    try:
+        integrators.newton_krylov_step([y_0], rate, h, max_iterations=1)
+    except optimize.NoConvergence:
+        pass
+    else:
+        assert False, "Unconverged step should raise to let the caller fall back"
+
+
 # def adams_bashforth_test():
 
 #     f = lambda t, y: -15 * y
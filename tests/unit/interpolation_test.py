@@ -1,10 +1,12 @@
 import numpy
 from nose.tools import eq_
 
-from common import UNITS
+from scipy.integrate import simps
+
+from common import UNITS, LinearSpacedGrid, LogSpacedGrid
 from particles import Particle
 from library.SM import particles as SMP
-from interactions.four_particle.cpp.integral import binary_find
+from interactions.four_particle.cpp.integral import binary_find, grid_find
 
 
 from . import setup, with_setup_args
@@ -86,3 +88,22 @@ def binary_search_test():
     # Corner cases
     eq_(binary_find(haystack, 0.), (0, 0))
     eq_(binary_find(haystack, 98.), (98, 98))
+
+
+def grid_lookup_test():
+
+    for grid in [LinearSpacedGrid(MOMENTUM_SAMPLES=401, MAX_MOMENTUM=20 * UNITS.MeV),
+                 LogSpacedGrid(MOMENTUM_SAMPLES=51, MAX_MOMENTUM=7 * UNITS.MeV)]:
+        needles = numpy.concatenate([
+            grid.TEMPLATE,
+            numpy.random.uniform(-grid.MAX_MOMENTUM / 10, grid.MAX_MOMENTUM * 1.1, 1000)
+        ])
+
+        for needle in needles:
+            expected = binary_find(grid.TEMPLATE, needle)
+            eq_(tuple(grid.find(needle)), expected)
+            eq_(grid_find(grid.TEMPLATE, grid.SPACING, grid.BASE, needle), expected)
+
+        f = numpy.exp(-grid.TEMPLATE / UNITS.MeV)
+        assert numpy.isclose(numpy.dot(f, grid.SIMPSON_WEIGHTS), simps(f, grid.TEMPLATE))
+        assert numpy.allclose(grid.POWERS[2], grid.TEMPLATE**2)
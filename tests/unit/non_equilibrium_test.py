@@ -1,12 +1,14 @@
 import numpy
 from collections import defaultdict
+from nose.tools import eq_
 import environment
+import importlib.util
 import os
-from . import non_equilibium_setup, with_setup_args, setup
+from . import non_equilibium_setup, decoupled_setup, decoupled_params_setup, with_setup_args, setup
 from common import CONST, UNITS
 from evolution import Universe
 from particles import Particle
-from library.SM import particles as SMP
+from library.SM import particles as SMP, interactions as SMI
 from library.NuMSM import particles as NuP, interactions as NuI
 from interactions.four_particle.cpp.integral import CollisionIntegralKind
 
@@ -105,6 +107,53 @@ def four_particle_decay_test(params):
     assert any(numpy.abs(val) - 1 < 1e-2 for val in ratio), "Four-particle decay test failed"
 
 
+@with_setup_args(setup)
+def vacuum_decay_kernels_test(params):
+    photon = Particle(**SMP.photon)
+    neutrino_e = Particle(**SMP.leptons.neutrino_e)
+    sterile = Particle(**NuP.dirac_sterile_neutrino(mass=200 * UNITS.MeV))
+
+    thetas = defaultdict(float, {
+        'electron': 1e-4,
+    })
+
+    interaction = NuI.sterile_leptons_interactions(
+        thetas=thetas, sterile=sterile,
+        neutrinos=[neutrino_e],
+        leptons=[],
+        kind=CollisionIntegralKind.F_f_vacuum_decay
+    )
+
+    universe = Universe(params=params)
+    universe.add_particles([photon, neutrino_e, sterile])
+    universe.interactions += interaction
+
+    params.update(universe.total_energy_density(), universe.total_entropy())
+
+    universe.update_particles()
+    universe.init_interactions()
+
+    params.config = params.config.replace(VACUUM_DECAY_KERNELS=True)
+    integrals = sterile.collision_integrals + neutrino_e.collision_integrals
+    assert integrals, "No vacuum decay integrals"
+    tabulated = [integral.integrate(integral.particle.grid.TEMPLATE) for integral in integrals]
+    kernels = [integral.kernels for integral in integrals]
+    assert all(kernel is not None for kernel in kernels), "Vacuum decay integrals are not tabulated"
+
+    for integral, kernel in zip(integrals, kernels):
+        integral.integrate(integral.particle.grid.TEMPLATE)
+        assert integral.kernels is kernel, "Kernels are tabulated again for the same step"
+
+    # Kernels are integrated with the fixed Gauss-Legendre quadrature, which agrees with the
+    # adaptive `integration()` within a percent on the default grids
+    tolerance = 2e-2
+    params.config = params.config.replace(VACUUM_DECAY_KERNELS=False)
+    for integral, result in zip(integrals, tabulated):
+        expected = integral.integrate(integral.particle.grid.TEMPLATE)
+        assert numpy.abs(result - expected).max() < tolerance * numpy.abs(expected).max(), \
+            "Tabulated vacuum decay integral differs from the adaptive one"
+
+
 @with_setup_args(setup)
 def three_particle_free_non_equilibrium_test(params):
     eps = 1e-14
@@ -207,4 +256,330 @@ def three_particle_decay_test(params):
 
     ratio = decay_rate / theo_value
 
-    assert any(numpy.abs(val) - 1 < 1e-2 for val in ratio), "Three-particle decay test failed"
\ No newline at end of file
+    assert any(numpy.abs(val) - 1 < 1e-2 for val in ratio), "Three-particle decay test failed"
+
+@with_setup_args(decoupled_setup)
+def concurrent_collisions_test(params, universe):
+    params.update(universe.total_energy_density(), universe.total_entropy())
+    photon, neutrino_mu, neutrino_e = universe.particles
+
+    universe.update_particles()
+    universe.init_interactions()
+    universe.calculate_collisions()
+    serial = neutrino_e.collision_integral
+
+    universe.schedule_collisions([neutrino_e], threads=4)
+
+    assert numpy.array_equal(serial, neutrino_e.collision_integral), \
+        "Concurrent collision integrals differ from the serial ones"
+
+
+@with_setup_args(decoupled_setup)
+def integral_counters_test(params, universe):
+    params.update(universe.total_energy_density(), universe.total_entropy())
+    photon, neutrino_mu, neutrino_e = universe.particles
+
+    universe.update_particles()
+    universe.init_interactions()
+    universe.calculate_collisions()
+
+    counters = universe.interactions[0].counters()
+    integrals = len(neutrino_e.collision_integrals)
+    assert counters['calls'] == integrals, "Every integral call is counted"
+    assert counters['bins'] > 0 and counters['evaluations'] > counters['bins'], \
+        "Integrator counters are not collected"
+    assert counters['subintervals'] >= counters['bins']
+    assert "neglected" in universe.integrals_report(top=1)
+
+
+@with_setup_args(decoupled_setup)
+def specie_handles_test(params, universe):
+    params.update(universe.total_energy_density(), universe.total_entropy())
+    photon, neutrino_mu, neutrino_e = universe.particles
+
+    universe.update_particles()
+    universe.init_interactions()
+    universe.calculate_collisions()
+    integral = numpy.array(neutrino_e.collision_integral)
+
+    handles = {id(handle) for collision in neutrino_e.collision_integrals
+               for handle in collision.handles}
+    assert len(handles) == 1, "Every specie has a single handle"
+
+    creactions = [collision.creaction for collision in neutrino_e.collision_integrals]
+    distribution = neutrino_e._distribution
+    neutrino_e._distribution = numpy.array(distribution)
+    universe.calculate_collisions()
+
+    assert all(collision.creaction is creaction for collision, creaction
+               in zip(neutrino_e.collision_integrals, creactions)), "Reactants are rebuilt"
+    assert numpy.allclose(neutrino_e.collision_integral, integral), \
+        "Replaced distribution function changes the integral"
+
+    handle, = set(neutrino_e.integration_handles.values())
+    assert handle.distribution is neutrino_e._distribution, "Handle keeps the replaced buffer"
+
+    neutrino_e.grid.TEMPLATE = numpy.array(neutrino_e.grid.TEMPLATE)
+    universe.calculate_collisions()
+    assert handle.template is neutrino_e.grid.TEMPLATE, "Handle keeps the replaced grid"
+    assert numpy.allclose(neutrino_e.collision_integral, integral), \
+        "Replaced grid changes the integral"
+
+    params.config = params.config.replace(RESAMPLED_DISTRIBUTIONS=True)
+    universe.calculate_collisions()
+    resampled = handle.resampled
+    assert resampled is not None, "Distribution function is not resampled"
+    previous = numpy.array(resampled)
+
+    neutrino_e._distribution = neutrino_e._distribution * 1.1
+    universe.calculate_collisions()
+    assert handle.distribution is neutrino_e._distribution
+    assert handle.resampled is not resampled, "Resampled buffer is not replaced"
+    assert numpy.array_equal(resampled, previous), "Resampled buffer in use is overwritten"
+    density = params.config.RESAMPLED_DISTRIBUTIONS_DENSITY
+    assert numpy.allclose(1. / (numpy.exp(handle.resampled[::density]) + neutrino_e.eta),
+                          neutrino_e._distribution, rtol=1e-8, atol=1e-12), \
+        "Resampled distribution function is not updated"
+
+
+@with_setup_args(decoupled_setup)
+def resampled_distributions_test(params, universe):
+    params.update(universe.total_energy_density(), universe.total_entropy())
+    photon, neutrino_mu, neutrino_e = universe.particles
+
+    universe.update_particles()
+    universe.init_interactions()
+    neutrino_e._distribution = (neutrino_e._distribution
+                                * (1 + 0.1 * numpy.sin(neutrino_e.grid.TEMPLATE / UNITS.MeV)))
+
+    params.config = params.config.replace(RESAMPLED_DISTRIBUTIONS=True)
+    universe.calculate_collisions()
+    resampled = numpy.array(neutrino_e.collision_integral)
+
+    params.config = params.config.replace(RESAMPLED_DISTRIBUTIONS=False)
+    universe.calculate_collisions()
+    exact = neutrino_e.collision_integral
+
+    scale = numpy.abs(exact).max()
+    assert numpy.allclose(resampled, exact, rtol=1e-3, atol=1e-3 * scale), \
+        "Resampled distribution functions change the integral"
+
+
+@with_setup_args(decoupled_setup)
+def fused_integration_test(params, universe):
+    params.update(universe.total_energy_density(), universe.total_entropy())
+    photon, neutrino_mu, neutrino_e = universe.particles
+
+    universe.update_particles()
+    universe.init_interactions()
+
+    integral = neutrino_e.collision_integrals[0]
+    params.config = params.config.replace(FUSED_COLLISION_INTEGRALS=True)
+    fused = integral.integrate(neutrino_e.grid.TEMPLATE)
+
+    params.config = params.config.replace(FUSED_COLLISION_INTEGRALS=False)
+    separate = integral.integrate(neutrino_e.grid.TEMPLATE)
+
+    # Gain and loss terms almost cancel near the equilibrium, so the deviation of the full
+    # integral is measured against the loss term. The tolerance covers the adaptive integration
+    # error, which is estimated jointly for both parts in a single pass
+    tolerance = 1e-3
+    scales = (numpy.abs(neutrino_e._distribution * separate[1]).max(), numpy.abs(separate[1]).max())
+    for fused_part, separate_part, scale in zip(fused, separate, scales):
+        assert numpy.abs(fused_part - separate_part).max() < tolerance * scale, \
+            "Single pass integration differs from the separate ones"
+
+
+@with_setup_args(decoupled_setup)
+def linearized_collisions_test(params, universe):
+    params.update(universe.total_energy_density(), universe.total_entropy())
+    photon, neutrino_mu, neutrino_e = universe.particles
+
+    universe.update_particles()
+    universe.init_interactions()
+
+    params.config = params.config.replace(LINEARIZED_COLLISIONS=True)
+    integral = neutrino_e.collision_integrals[0]
+    integral.integrate(neutrino_e.grid.TEMPLATE)
+    assert integral.linearization, "Collision integral is not linearized"
+
+    neutrino_e._distribution = neutrino_e._distribution \
+        * (1. + 1e-3 * numpy.sin(neutrino_e.grid.TEMPLATE / UNITS.MeV))
+    linearized = integral.integrate(neutrino_e.grid.TEMPLATE)
+
+    params.config = params.config.replace(LINEARIZED_COLLISIONS=False, FUSED_COLLISION_INTEGRALS=False)
+    exact = integral.integrate(neutrino_e.grid.TEMPLATE)
+
+    # Gain and loss terms almost cancel near the equilibrium, so the deviation of the full
+    # integral is measured against the loss term. The second order of the perturbation is far
+    # below the tolerance, which covers the adaptive integration error
+    tolerance = 1e-3
+    scales = (numpy.abs(neutrino_e._distribution * exact[1]).max(), numpy.abs(exact[1]).max())
+    for linearized_part, exact_part, scale in zip(linearized, exact, scales):
+        assert numpy.abs(linearized_part - exact_part).max() < tolerance * scale, \
+            "Linearized collision integral differs from the exact one"
+
+
+@with_setup_args(decoupled_setup)
+def linearized_collisions_deviation_test(params, universe):
+    params.update(universe.total_energy_density(), universe.total_entropy())
+    photon, neutrino_mu, neutrino_e = universe.particles
+
+    universe.update_particles()
+    universe.init_interactions()
+
+    params.config = params.config.replace(LINEARIZED_COLLISIONS=True)
+    integral = neutrino_e.collision_integrals[0]
+
+    neutrino_e._distribution = neutrino_e._distribution * 1.5
+    assert neutrino_e.equilibrium_deviation() > params.config.LINEARIZED_COLLISIONS_DEVIATION
+    integral.integrate(neutrino_e.grid.TEMPLATE)
+    assert not integral.linearization, "Collision integral of a distorted species is linearized"
+
+
+@with_setup_args(non_equilibium_setup)
+def lazy_thermodynamics_test(params, universe):
+    params.update(universe.total_energy_density(), universe.total_entropy())
+    photon, neutrino_e, neutrino_mu = universe.particles
+
+    universe.update_particles()
+    assert not neutrino_e.in_equilibrium
+
+    density = neutrino_e.density
+    if environment.get('SIMPSONS_NONEQ_PARTICLES'):
+        assert set(neutrino_e._thermodynamics[1]) == set(Particle.THERMODYNAMICS), \
+            "Thermodynamical quantities are not computed in one pass"
+
+    neutrino_e._distribution = neutrino_e._distribution * 2.
+    assert numpy.isclose(neutrino_e.density, 2. * density), \
+        "Density is not recomputed after the distribution function change"
+
+
+@with_setup_args(decoupled_setup)
+def gauss_quadratures_test(params, universe):
+    params.update(universe.total_energy_density(), universe.total_entropy())
+    photon, neutrino_mu, neutrino_e = universe.particles
+
+    universe.update_particles()
+    grid = neutrino_e.grid
+    neutrino_e._distribution = neutrino_e._distribution \
+        * (1. + 0.1 * numpy.sin(grid.TEMPLATE / UNITS.MeV))
+    neutrino_e.collision_integral = -neutrino_e._distribution * grid.TEMPLATE / UNITS.MeV
+
+    # Both implementations of the regime are chosen when the module is loaded
+    regimes = {}
+    simpsons = os.environ.get('SIMPSONS_NONEQ_PARTICLES')
+    try:
+        for flag in ('', 'True'):
+            os.environ['SIMPSONS_NONEQ_PARTICLES'] = flag
+            spec = importlib.util.find_spec('particles.NonEqParticle')
+            regimes[bool(flag)] = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(regimes[bool(flag)])
+    finally:
+        if simpsons is None:
+            del os.environ['SIMPSONS_NONEQ_PARTICLES']
+        else:
+            os.environ['SIMPSONS_NONEQ_PARTICLES'] = simpsons
+
+    gauss, simpson = regimes[False], regimes[True]
+    for name in ('density', 'energy_density', 'pressure', 'entropy'):
+        assert numpy.isclose(getattr(gauss, name)(neutrino_e), getattr(simpson, name)(neutrino_e),
+                             rtol=1e-3, atol=0), \
+            "Batched quadrature of the {} differs from Simpson's rule".format(name)
+
+    # The collision integral is interpolated linearly between the grid nodes. Interpolation from
+    # the interval above the point instead is off by a percent
+    assert numpy.isclose(gauss.numerator(neutrino_e), simpson.numerator(neutrino_e),
+                         rtol=5e-3, atol=0), \
+        "Batched quadrature of the numerator differs from Simpson's rule"
+
+
+@with_setup_args(decoupled_params_setup)
+def species_equivalence_test(params):
+    photon = Particle(params=params, **SMP.photon)
+    electron = Particle(params=params, **SMP.leptons.electron)
+    neutrino_e = Particle(params=params, **SMP.leptons.neutrino_e)
+    neutrino_mu = Particle(params=params, **SMP.leptons.neutrino_mu)
+    neutrino_tau = Particle(params=params, **SMP.leptons.neutrino_tau)
+
+    universe = Universe(params=params)
+    universe.add_particles([photon, electron, neutrino_e, neutrino_mu, neutrino_tau])
+    # Scatterings of the muon and tau neutrinos on each other place the flavours in different
+    # reactant slots, so they are told apart. Only the interactions with electrons are kept
+    universe.interactions += [
+        SMI.neutrinos_to_leptons(g_L=CONST.g_R - 0.5, lepton=electron, neutrino=neutrino)
+        for neutrino in (neutrino_mu, neutrino_tau)
+    ]
+    params.update(universe.total_energy_density(), universe.total_entropy())
+    universe.update_particles()
+    universe.init_interactions()
+
+    eq_(universe.equivalent_species, ())
+    params.config = params.config.replace(SPECIES_EQUIVALENCE=True)
+    universe.calculate_collisions()
+    eq_(universe.equivalent_species, ((neutrino_tau.name, neutrino_mu.name), ))
+    shared = numpy.array(neutrino_tau.collision_integral)
+
+    params.config = params.config.replace(SPECIES_EQUIVALENCE=False)
+    universe.calculate_collisions()
+    assert numpy.allclose(neutrino_tau.collision_integral, shared)
+
+    # Distinct distribution functions split the class
+    params.config = params.config.replace(SPECIES_EQUIVALENCE=True)
+    neutrino_tau._distribution = neutrino_tau._distribution * 1.01
+    universe.calculate_collisions()
+    eq_(universe.equivalent_species, ())
+
+    # Species mixed by the oscillations are not shared
+    neutrino_tau._distribution = numpy.array(neutrino_mu._distribution)
+    universe.calculate_collisions()
+    eq_(universe.equivalent_species, ((neutrino_tau.name, neutrino_mu.name), ))
+    universe.init_oscillations(SMP.leptons.oscillations_map, (neutrino_e, neutrino_mu, neutrino_tau))
+    universe.calculate_collisions()
+    eq_(universe.equivalent_species, ())
+
+
+@with_setup_args(decoupled_setup)
+def integral_pruning_test(params, universe):
+    params.update(universe.total_energy_density(), universe.total_entropy())
+    photon, neutrino_mu, neutrino_e = universe.particles
+
+    universe.update_particles()
+    universe.init_interactions()
+    # Every integral is negligible by these thresholds
+    params.config = params.config.replace(INTEGRAL_PRUNING=True, INTEGRAL_PRUNING_TOLERANCE=1e10,
+                                          INTEGRAL_PRUNING_RATE=1e10, INTEGRAL_PRUNING_STEPS=2,
+                                          INTEGRAL_PRUNING_PROBE=3)
+    integrals = neutrino_e.collision_integrals
+
+    for step in range(2):
+        universe.calculate_collisions()
+    assert all(integral.retired for integral in integrals)
+    calls = [integral.counters['calls'] for integral in integrals]
+
+    for step in range(3):
+        universe.calculate_collisions()
+    eq_([integral.counters['pruned'] for integral in integrals], [2] * len(integrals))
+    eq_([integral.counters['calls'] for integral in integrals], [n + 1 for n in calls])
+
+
+@with_setup_args(decoupled_setup)
+def free_streaming_test(params, universe):
+    params.update(universe.total_energy_density(), universe.total_entropy())
+    photon, neutrino_mu, neutrino_e = universe.particles
+    params.config = params.config.replace(FREE_STREAMING_FAST_FORWARD=True,
+                                          FREE_STREAMING_STEP_FACTOR=4.)
+    interactions = universe.interactions
+    universe.interactions = tuple()
+    dy = params.dy
+    distribution = neutrino_e._distribution.copy()
+
+    for step in range(3):
+        universe.make_step()
+        universe.save()
+    eq_(params.dy, 4. * dy)
+    assert numpy.array_equal(neutrino_e._distribution, distribution)
+
+    universe.interactions = interactions
+    universe.make_step()
+    eq_(params.dy, dy)
@@ -1,7 +1,11 @@
+import os
+import shutil
+import tempfile
 import numpy
 import environment
 from common import Params, UNITS
 from particles import Particle, REGIMES
+from evolution import Universe
 from library.SM import particles as SMP
 
 from . import eps, setup, with_setup_args
@@ -14,6 +18,20 @@ def params_inferrence_test(params):
     assert params.x - params.m * params.aT / params.T < eps
 
 
+@with_setup_args(setup)
+def step_size_bounds_test(params):
+    h = params.h
+    assert params.set_step(h * 1e3) == params.h_max
+    assert params.set_step(h * 1e-3) == params.h_min
+    assert params.set_step(h) == h
+    assert numpy.allclose(params.dx, params.x * params.h), "Step in `x` must follow the step in `y`"
+
+    assert params.multistep_order(5) == 1, "History of another step size must not be used"
+    params.count_step()
+    params.set_step(h)
+    assert params.multistep_order(5) == 2, "Steps of the same size rebuild the history"
+
+
 @with_setup_args(setup)
 def radiation_regime_test(params):
 
@@ -41,6 +59,29 @@ def intermediate_regime_test(params):
     assert electron.denominator() != 0, "Massive particles contribute to the denominator"
 
 
+@with_setup_args(setup)
+def thermodynamics_tables_test(params):
+    folder = tempfile.mkdtemp()
+    tables = params.config.replace(THERMODYNAMICS_TABLES=True, THERMODYNAMICS_TABLES_DIR=folder)
+
+    def thermodynamics(config):
+        electron = Particle(params=Params(T=params.T, dy=params.dy, config=config),
+                            **SMP.leptons.electron)
+        assert electron.regime == REGIMES.INTERMEDIATE
+        return [electron.density, electron.energy_density, electron.pressure,
+                electron.entropy, electron.numerator(), electron.denominator()]
+
+    try:
+        tabulated = thermodynamics(tables)
+        assert os.listdir(folder), "Thermodynamics table is not saved"
+    finally:
+        shutil.rmtree(folder)
+    integrated = thermodynamics(params.config.replace(THERMODYNAMICS_TABLES=False))
+
+    assert numpy.allclose(tabulated, integrated, rtol=1e-6, atol=0), \
+        "Tabulated thermodynamics differs from the integrated one"
+
+
 @with_setup_args(setup)
 def dust_regime_test(params):
 
@@ -154,3 +195,44 @@ def smooth_decoupling_test(params):
     assert neutrino.pressure - pressure < eps
     assert neutrino.numerator() - numerator < eps
     assert neutrino.denominator() - denominator < eps
+
+
+def equilibrium_fast_forward_test():
+    params = Params(T=10 * UNITS.MeV, dy=0.025,
+                    config=environment.Config(EQUILIBRIUM_FAST_FORWARD=True))
+    universe = Universe(params=params)
+    universe.add_particles([Particle(**SMP.photon), Particle(**SMP.leptons.electron),
+                            Particle(**SMP.leptons.neutrino_e)])
+    params.update(universe.total_energy_density(), universe.total_entropy())
+    entropy = params.S * params.a**3
+
+    universe.make_step()
+    universe.save()
+    assert numpy.allclose(params.dy, 0.25)
+    assert abs(params.S * params.a**3 / entropy - 1.) < 1e-5, "Comoving entropy must be conserved"
+
+    # Equilibrium steps stop short of the neutrino decoupling and the kinetic loop takes over
+    for step in range(10):
+        T = params.T
+        universe.make_step()
+        universe.save()
+        if universe.epoch is None:
+            break
+    assert universe.epoch is None
+    # The kinetic step taking over may cross the decoupling itself
+    assert T > SMP.leptons.neutrino_e['decoupling_temperature']
+    assert params.dy == 0.025
+
+
+def equilibrium_fast_forward_kawano_test():
+    params = Params(T=10 * UNITS.MeV, dy=0.025,
+                    config=environment.Config(EQUILIBRIUM_FAST_FORWARD=True))
+    universe = Universe(params=params)
+    electron, neutrino = Particle(**SMP.leptons.electron), Particle(**SMP.leptons.neutrino_e)
+    universe.add_particles([Particle(**SMP.photon), electron, neutrino])
+    params.update(universe.total_energy_density(), universe.total_entropy())
+    universe.init_kawano(electron=electron, neutrino=neutrino)
+
+    # KAWANO rates are saved with the kinetic step
+    assert universe.kawano_output()
+    assert universe.equilibrium_step_size() is None
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+
+import scan
+from common import Params, UNITS
+
+
+class Evolved(object):
+    folder = None
+    kawano = None
+    closed = False
+
+    def __init__(self):
+        self.params = Params(T=1. * UNITS.MeV, dy=0.1)
+
+    def close(self):
+        self.closed = True
+
+
+evolved = []
+
+
+def scenario(folder, mass):
+    if mass < 0:
+        raise RuntimeError("gsl: qag.c: failed to reach required accuracy")
+    evolved.append(Evolved())
+    return evolved[-1]
+
+
+def grid_test():
+    points = scan.grid(mass=[1., 2.], theta=[0.1, 0.2, 0.3])
+    assert len(points) == 6
+    assert {'mass': 2., 'theta': 0.3} in points
+
+
+def crash_isolation_test():
+    folder = tempfile.mkdtemp()
+    try:
+        rows = scan.run(scenario, scan.grid(mass=[-1., 1.]), folder, processes=2)
+        statuses = {row['mass']: row['status'] for row in rows}
+
+        assert statuses == {-1.: 'failed', 1.: 'done'}
+        assert all('N_eff' in row for row in rows if row['status'] == 'done')
+        assert os.path.exists(os.path.join(folder, 'scan.txt'))
+    finally:
+        shutil.rmtree(folder)
+
+
+def threads_test():
+    folder = tempfile.mkdtemp()
+    try:
+        rows = scan.run_threads(scenario, scan.grid(mass=[-1., 1., 2.]), folder, threads=2)
+        statuses = {row['mass']: row['status'] for row in rows}
+
+        assert statuses == {-1.: 'failed', 1.: 'done', 2.: 'done'}
+        assert all(universe.closed for universe in evolved[-2:]), "Evolved points are not closed"
+    finally:
+        shutil.rmtree(folder)
@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy
+
+from common import store, utils
+from evolution import Universe
+from particles import Particle
+from library.SM import particles as SMP
+
+from . import setup, with_setup_args
+
+
+@with_setup_args(setup)
+def store_roundtrip_test(params):
+    universe = Universe(params=params)
+    neutrino = Particle(**SMP.leptons.neutrino_e)
+    universe.add_particles([Particle(**SMP.photon), neutrino])
+
+    folder = tempfile.mkdtemp()
+    try:
+        writer = store.RunStoreWriter(folder, dtype=numpy.float32, chunk_size=3)
+        distributions = []
+        for step in range(7):
+            universe.step = step
+            neutrino._distribution = neutrino._distribution * 0.9
+            distributions.append(neutrino._distribution.astype(numpy.float32))
+            writer.append(universe)
+        writer.close()
+
+        reader = store.RunStore(folder)
+        history = reader[neutrino.name, 'distribution']
+
+        assert history.shape == (7, neutrino.grid.MOMENTUM_SAMPLES)
+        assert numpy.array_equal(reader.steps['step'], numpy.arange(7))
+        assert numpy.array_equal(history[:], numpy.array(distributions))
+        assert numpy.array_equal(history[2:6:2, 5:10], numpy.array(distributions)[2:6:2, 5:10])
+        assert numpy.array_equal(history[-1], distributions[-1])
+
+        writer = store.RunStoreWriter(folder, append=True)
+        writer.truncate(4)
+        assert len(store.RunStore(folder)[neutrino.name, 'distribution']) == 4
+    finally:
+        shutil.rmtree(folder)
+
+
+def concurrent_atomic_write_test():
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, 'table.npz')
+    errors = []
+
+    def write(payload):
+        try:
+            for i in range(20):
+                utils.atomic_write(path, payload)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(bytes([i]) * 1000, )) for i in range(4)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert not errors, errors
+        assert os.listdir(folder) == ['table.npz'], "Temporary files are left behind"
+        with open(path, 'rb') as f:
+            content = f.read()
+        assert len(set(content)) == 1 and len(content) == 1000, "Writes are interleaved"
+    finally:
+        shutil.rmtree(folder)